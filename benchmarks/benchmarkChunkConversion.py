@@ -0,0 +1,107 @@
+"""
+Benchmark the conversion of CatalogDBObject query results into numpy
+recarrays.
+
+This script builds a sqlite database of fake stars and then queries it
+with ChunkIterator twice: once reading rows through sqlalchemy and
+converting them record-by-record (the original path), and once reading
+rows directly from the DBAPI cursor and converting them column-by-column
+(the default).  The throughput of each path is reported in rows/second.
+
+Usage:
+
+    python benchmarkChunkConversion.py --n_rows 1000000 --chunk_size 100000
+"""
+from __future__ import print_function
+import argparse
+import os
+import sqlite3
+import tempfile
+import shutil
+import time
+
+import numpy as np
+
+from lsst.sims.catalogs.db import CatalogDBObject, ChunkIterator
+
+
+class BenchmarkStarDBObject(CatalogDBObject):
+    objid = 'benchmark_chunk_conversion_stars'
+    tableid = 'stars'
+    idColKey = 'id'
+    driver = 'sqlite'
+    raColName = 'ra'
+    decColName = 'decl'
+    columns = [('id', None, int),
+               ('raJ2000', 'ra*%f' % (np.pi/180.)),
+               ('decJ2000', 'decl*%f' % (np.pi/180.)),
+               ('umag', None),
+               ('gmag', None),
+               ('rmag', None),
+               ('imag', None),
+               ('zmag', None),
+               ('ymag', None),
+               ('sedFilename', 'sed', str, 40)]
+
+
+def make_benchmark_db(file_name, n_rows, seed=771):
+    """
+    Write a table of n_rows fake stars to the sqlite database file_name
+    """
+    rng = np.random.RandomState(seed)
+    with sqlite3.connect(file_name) as connection:
+        cursor = connection.cursor()
+        cursor.execute('''CREATE TABLE stars
+                       (id int, ra real, decl real, umag real, gmag real,
+                       rmag real, imag real, zmag real, ymag real, sed text)''')
+        batch_size = 100000
+        for i_start in range(0, n_rows, batch_size):
+            n_batch = min(batch_size, n_rows-i_start)
+            mags = rng.random_sample((6, n_batch))*10.0+15.0
+            values = ((i_start+ii, 360.0*rng.random_sample(), 180.0*rng.random_sample()-90.0,
+                       mags[0][ii], mags[1][ii], mags[2][ii], mags[3][ii], mags[4][ii], mags[5][ii],
+                       'sed_%d.dat' % rng.randint(0, 1000))
+                      for ii in range(n_batch))
+            cursor.executemany('''INSERT INTO stars VALUES (?,?,?,?,?,?,?,?,?,?)''', values)
+        connection.commit()
+
+
+def time_conversion(db_obj, chunk_size, columnar):
+    """
+    Return the number of rows read and the number of seconds it took
+    to read them into recarrays
+    """
+    query = db_obj._get_column_query()
+    t_start = time.time()
+    n_rows = 0
+    for chunk in ChunkIterator(db_obj, query, chunk_size, columnar=columnar):
+        n_rows += len(chunk)
+    return n_rows, time.time()-t_start
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--n_rows', type=int, default=1000000,
+                        help='number of rows in the benchmark database')
+    parser.add_argument('--chunk_size', type=int, default=100000,
+                        help='chunk_size passed to ChunkIterator')
+    parser.add_argument('--n_trials', type=int, default=3,
+                        help='number of times to time each path (the best time is reported)')
+    args = parser.parse_args()
+
+    scratch_dir = tempfile.mkdtemp(prefix='benchmarkChunkConversion-')
+    try:
+        db_name = os.path.join(scratch_dir, 'benchmark_stars.db')
+        make_benchmark_db(db_name, args.n_rows)
+        db_obj = BenchmarkStarDBObject(database=db_name)
+
+        for label, columnar in (('row-by-row', False), ('columnar', True)):
+            best = None
+            for i_trial in range(args.n_trials):
+                n_rows, duration = time_conversion(db_obj, args.chunk_size, columnar)
+                if best is None or duration < best:
+                    best = duration
+            print('%-12s %d rows in %.3f s: %.3e rows/second' % (label, n_rows, best, n_rows/best))
+    finally:
+        shutil.rmtree(scratch_dir)
@@ -0,0 +1,74 @@
+"""
+Benchmark the time it takes to import lsst.sims.catalogs.
+
+Each trial imports the packages in a fresh python process, so that nothing
+is already in sys.modules.  The best time over the trials is compared to a
+budget, and the script exits with a non-zero status if the budget is
+exceeded or if importing the packages also imported any of the modules
+which are deliberately imported lazily (e.g. sqlalchemy.orm, DbAuth,
+lsst.sims.utils); so it can be used to catch import-time regressions.
+
+Usage:
+
+    python benchmarkImportTime.py --n_trials 10 --budget 1.0
+"""
+from __future__ import print_function
+import argparse
+import json
+import subprocess
+import sys
+
+
+# Modules which lsst.sims.catalogs only imports when they are needed
+# (i.e. when connecting to a database or building an InstanceCatalog)
+LAZY_MODULES = ['sqlalchemy.orm', 'lsst.daf.butler', 'lsst.utils', 'lsst.sims.utils']
+
+
+def time_import(packages):
+    """
+    Import packages in a new python process.  Return the number of seconds
+    the imports took and the list of LAZY_MODULES which they imported.
+    """
+    script = ("import json, sys, time\n"
+              "t_start = time.time()\n"
+              "for name in %r:\n"
+              "    __import__(name)\n"
+              "duration = time.time() - t_start\n"
+              "lazy = [name for name in %r if name in sys.modules]\n"
+              "print(json.dumps([duration, lazy]))\n" % (packages, LAZY_MODULES))
+    output = subprocess.check_output([sys.executable, '-c', script])
+    duration, lazy = json.loads(output.decode('utf-8').strip().splitlines()[-1])
+    return duration, lazy
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--packages', type=str, nargs='+',
+                        default=['lsst.sims.catalogs.db', 'lsst.sims.catalogs.definitions'],
+                        help='packages to import')
+    parser.add_argument('--n_trials', type=int, default=10,
+                        help='number of times to time the imports (the best time is reported)')
+    parser.add_argument('--budget', type=float, default=None,
+                        help='maximum acceptable import time in seconds')
+    args = parser.parse_args()
+
+    best = None
+    for i_trial in range(args.n_trials):
+        duration, lazy = time_import(args.packages)
+        if best is None or duration < best:
+            best = duration
+
+    print('importing %s took %.3f s' % (', '.join(args.packages), best))
+
+    failed = False
+    if len(lazy) > 0:
+        print('these modules should only be imported when needed, but were imported: %s'
+              % ', '.join(lazy))
+        failed = True
+    if args.budget is not None and best > args.budget:
+        print('this exceeds the budget of %.3f s' % args.budget)
+        failed = True
+
+    if failed:
+        sys.exit(1)
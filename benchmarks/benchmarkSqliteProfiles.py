@@ -0,0 +1,157 @@
+"""
+Benchmark the sqlite connection profiles (see
+lsst.sims.catalogs.db.utils.SQLITE_PROFILES).
+
+This script writes a .npy file of fake stars (so that the time to load it
+is spent inserting rows and building an index, rather than parsing text)
+and loads it with loadTable into a sqlite database file, with sqlite's
+default pragmas and with the 'bulk_load' profile.  It then queries the
+database with a CatalogDBObject connected with each of the reading
+profiles (default, 'read', 'immutable' and 'wal'), once reading every row
+and many times reading a few rows (which is dominated by the cost of
+opening connections).  The throughput of each is reported.
+
+Usage:
+
+    python benchmarkSqliteProfiles.py --n_rows 1000000 --chunk_size 100000
+"""
+from __future__ import print_function
+import argparse
+import contextlib
+import io
+import os
+import tempfile
+import shutil
+import time
+
+import numpy as np
+
+from lsst.sims.catalogs.db import CatalogDBObject, make_engine, createSQLTable, loadTable
+from lsst.sims.catalogs.db.dbConnection import DBConnection
+
+
+class BenchmarkStarDBObject(CatalogDBObject):
+    objid = 'benchmark_sqlite_profiles_stars'
+    tableid = 'stars'
+    idColKey = 'id'
+    driver = 'sqlite'
+    raColName = 'ra'
+    decColName = 'decl'
+    columns = [('id', None, int),
+               ('raJ2000', 'ra*%f' % (np.pi/180.)),
+               ('decJ2000', 'decl*%f' % (np.pi/180.)),
+               ('sinDec', 'SIN(decl*%f)' % (np.pi/180.)),
+               ('umag', None),
+               ('gmag', None),
+               ('rmag', None),
+               ('sedFilename', 'sed', str, 40)]
+
+
+dtype = np.dtype([('id', int), ('ra', float), ('decl', float), ('umag', float),
+                  ('gmag', float), ('rmag', float), ('sed', str, 40)])
+
+
+def write_benchmark_file(file_name, n_rows, seed=9913):
+    """
+    Write a .npy file of n_rows fake stars
+    """
+    rng = np.random.RandomState(seed)
+    data = np.zeros(n_rows, dtype=dtype)
+    data['id'] = np.arange(n_rows)
+    data['ra'] = 360.0*rng.random_sample(n_rows)
+    data['decl'] = 180.0*rng.random_sample(n_rows)-90.0
+    for name in ('umag', 'gmag', 'rmag'):
+        data[name] = rng.random_sample(n_rows)*10.0+15.0
+    data['sed'] = ['sed_%d.dat' % ii for ii in rng.randint(0, 1000, n_rows)]
+    np.save(file_name, data)
+
+
+def time_load(file_name, db_name, chunk_size, profile):
+    """
+    Return the number of rows loaded from file_name into a new database
+    db_name, and the number of seconds it took
+    """
+    if os.path.exists(db_name):
+        os.unlink(db_name)
+    engine, metadata = make_engine('sqlite:///%s' % db_name)
+    table = createSQLTable(dtype, 'stars', 'id', metadata)
+    t_start = time.time()
+    # silence loadTable's progress messages
+    with contextlib.redirect_stdout(io.StringIO()):
+        n_rows = loadTable(file_name, table, None, dtype, engine, indexCols=['decl'],
+                           chunkSize=chunk_size, sqliteProfile=profile)
+    duration = time.time()-t_start
+    engine.dispose()
+    return n_rows, duration
+
+
+def time_query(db_obj, chunk_size):
+    """
+    Return the number of rows read by a query of every row,
+    and the number of seconds it took
+    """
+    t_start = time.time()
+    n_rows = 0
+    for chunk in db_obj.query_columns(chunk_size=chunk_size):
+        n_rows += len(chunk)
+    return n_rows, time.time()-t_start
+
+
+def time_small_queries(db_obj, n_queries):
+    """
+    Return the number of seconds it took to run n_queries queries
+    of a few rows each
+    """
+    t_start = time.time()
+    for i_query in range(n_queries):
+        list(db_obj.query_columns(colnames=['id', 'sinDec'], constraint='decl BETWEEN %d AND %d.01' %
+                                  (i_query % 170 - 85, i_query % 170 - 85)))
+    return time.time()-t_start
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--n_rows', type=int, default=1000000,
+                        help='number of rows in the benchmark database')
+    parser.add_argument('--chunk_size', type=int, default=100000,
+                        help='chunk_size used to load and query the database')
+    parser.add_argument('--n_queries', type=int, default=1000,
+                        help='number of small queries to time')
+    parser.add_argument('--n_trials', type=int, default=3,
+                        help='number of times to time each profile (the best time is reported)')
+    args = parser.parse_args()
+
+    scratch_dir = tempfile.mkdtemp(prefix='benchmarkSqliteProfiles-')
+    try:
+        file_name = os.path.join(scratch_dir, 'benchmark_stars.npy')
+        db_name = os.path.join(scratch_dir, 'benchmark_stars.db')
+        write_benchmark_file(file_name, args.n_rows)
+
+        for profile in (None, 'bulk_load'):
+            best = None
+            for i_trial in range(args.n_trials):
+                n_rows, duration = time_load(file_name, db_name, args.chunk_size, profile)
+                if best is None or duration < best:
+                    best = duration
+            print('load  %-10s %d rows in %.3f s: %.3e rows/second' %
+                  (profile, n_rows, best, n_rows/best))
+
+        # 'wal' comes last, since it leaves the database in write-ahead-log mode
+        for profile in (None, 'read', 'immutable', 'wal'):
+            connection = DBConnection(database=db_name, driver='sqlite', sqlite_profile=profile)
+            db_obj = BenchmarkStarDBObject(connection=connection)
+            best = None
+            best_small = None
+            for i_trial in range(args.n_trials):
+                n_rows, duration = time_query(db_obj, args.chunk_size)
+                if best is None or duration < best:
+                    best = duration
+                duration = time_small_queries(db_obj, args.n_queries)
+                if best_small is None or duration < best_small:
+                    best_small = duration
+            print('query %-10s %d rows in %.3f s: %.3e rows/second; %d small queries: %.3e queries/second' %
+                  (profile, n_rows, best, n_rows/best, args.n_queries, args.n_queries/best_small))
+            connection.engine.dispose()
+    finally:
+        shutil.rmtree(scratch_dir)
@@ -0,0 +1,244 @@
+"""
+Support for driving queries and catalog writes from an asyncio event loop
+(see CatalogDBObject.query_columns_async and InstanceCatalog.write_catalog_async).
+
+Queries and writes are blocking, so each one is run on a thread of its own:
+DBConnection.session is a scoped_session, so the query is executed, read and
+closed on one session (and database connection) belonging to that thread,
+exactly as it would be by a synchronous caller.  The number of queries and
+writes in flight at once, over all of the CatalogDBObjects and catalogs used
+on an event loop, is bounded by set_async_concurrency (also available as
+CatalogDBObject.set_async_concurrency).
+
+Engines which give each thread its own connection (e.g. in-memory sqlite
+databases, where another thread would see an empty database) are instead
+queried on the event loop's thread, blocking it while they run.  Objects
+with no connection (e.g. fileDBObjects with the numpy backend) are queried
+on a thread of their own.
+
+This module uses the async/await syntax, so it is only importable under
+python 3.5 or later; it is imported (along with asyncio) when first used
+rather than with lsst.sims.catalogs.db.
+"""
+import asyncio
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy.pool import SingletonThreadPool
+
+__all__ = ["AsyncChunkIterator", "set_async_concurrency", "get_async_concurrency"]
+
+
+class _ConcurrencyLimit(object):
+    """
+    The maximum number of queries and writes in flight at once, and the
+    asyncio.Semaphore enforcing it on each event loop
+    """
+
+    def __init__(self, max_concurrency):
+        self.max_concurrency = max_concurrency
+        self._semaphores = weakref.WeakKeyDictionary()
+
+    def semaphore(self):
+        """
+        Return the semaphore for the running event loop (asyncio
+        primitives cannot be shared between loops)
+        """
+        loop = asyncio.get_event_loop()
+        semaphore = self._semaphores.get(loop)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._semaphores[loop] = semaphore
+        return semaphore
+
+
+_concurrency_limit = _ConcurrencyLimit(8)
+
+
+def set_async_concurrency(max_concurrency):
+    """
+    Set the maximum number of queries (from query_columns_async) and catalog
+    writes (from write_catalog_async) in flight at once on an event loop.
+    Others wait for one of those to finish.  Operations already in flight
+    are not affected.
+    """
+    if max_concurrency < 1:
+        raise ValueError("max_concurrency must be at least 1; you gave %s" % max_concurrency)
+    _concurrency_limit.max_concurrency = max_concurrency
+    _concurrency_limit._semaphores.clear()
+
+
+def get_async_concurrency():
+    """
+    Return the maximum number of queries and catalog writes in flight at once
+    """
+    return _concurrency_limit.max_concurrency
+
+
+def _is_thread_bound(connection):
+    """
+    Return True if connection's engine gives each thread its own database
+    connection, so that it must only be used from the event loop's thread
+    """
+    return connection is not None and isinstance(connection.engine.pool, SingletonThreadPool)
+
+
+def _new_executor():
+    """
+    Return an executor with a single thread, on which all of the work
+    on one query or catalog is done
+    """
+    return ThreadPoolExecutor(max_workers=1)
+
+
+def _call_and_remove_session(connection, func, args, kwargs):
+    """
+    Call func(*args, **kwargs) and then release the current thread's session
+    """
+    try:
+        return func(*args, **kwargs)
+    finally:
+        if connection is not None:
+            connection.session.remove()
+
+
+async def run_blocking(connection, func, *args, **kwargs):
+    """
+    Run func(*args, **kwargs), which uses the DBConnection connection, on a
+    thread of its own once the concurrency limit allows, and return its result
+    """
+    async with _concurrency_limit.semaphore():
+        if _is_thread_bound(connection):
+            return func(*args, **kwargs)
+
+        executor = _new_executor()
+        try:
+            return await asyncio.get_event_loop().run_in_executor(
+                executor, _call_and_remove_session, connection, func, args, kwargs)
+        finally:
+            executor.shutdown(wait=False)
+
+
+_END_OF_QUERY = object()
+
+
+class AsyncChunkIterator(object):
+    """
+    Asynchronous iterator over the chunks of a query, returned by
+    CatalogDBObject.query_columns_async.
+
+    The query is executed when the first chunk is requested (once the
+    concurrency limit allows) and each chunk is fetched and postprocessed
+    on the query's own thread while the event loop carries on.  The query
+    counts against the concurrency limit until it is exhausted or closed,
+    so call aclose() (or use the iterator as an async context manager)
+    to abandon it early.
+
+    Usage:
+
+        async with db_obj.query_columns_async(colnames, chunk_size=1000) as chunks:
+            async for chunk in chunks:
+                ...
+    """
+
+    def __init__(self, connection, make_iterator):
+        """
+        @param [in] connection is the DBConnection being queried
+
+        @param [in] make_iterator is a callable returning the (blocking)
+        iterator over the chunks of the query
+        """
+        self._connection = connection
+        self._make_iterator = make_iterator
+        self._chunk_iter = None
+        self._executor = None
+        self._semaphore = None
+        self._loop = None
+        self._closed = False
+
+    def __aiter__(self):
+        return self
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.aclose()
+
+    async def _run(self, func, *args):
+        if self._executor is None:
+            return func(*args)
+        return await self._loop.run_in_executor(self._executor, func, *args)
+
+    async def _start(self):
+        semaphore = _concurrency_limit.semaphore()
+        await semaphore.acquire()
+        self._semaphore = semaphore
+        self._loop = asyncio.get_event_loop()
+        if not _is_thread_bound(self._connection):
+            self._executor = _new_executor()
+        self._chunk_iter = await self._run(self._make_iterator)
+
+    async def __anext__(self):
+        if self._closed:
+            raise StopAsyncIteration
+
+        try:
+            if self._chunk_iter is None:
+                await self._start()
+            # next() returns a sentinel rather than raising StopIteration,
+            # which cannot be set on a future
+            chunk = await self._run(next, self._chunk_iter, _END_OF_QUERY)
+        except BaseException:
+            await self.aclose()
+            raise
+
+        if chunk is _END_OF_QUERY:
+            await self.aclose()
+            raise StopAsyncIteration
+        return chunk
+
+    def _close_query(self):
+        try:
+            if hasattr(self._chunk_iter, 'close'):
+                self._chunk_iter.close()
+        finally:
+            self._chunk_iter = None
+            if self._executor is not None and self._connection is not None:
+                self._connection.session.remove()
+
+    async def aclose(self):
+        """
+        Stop iterating, closing the query and freeing its place under the
+        concurrency limit.  Further iteration raises StopAsyncIteration.
+        """
+        if self._closed:
+            return
+        self._closed = True
+        try:
+            if self._semaphore is not None:
+                await self._run(self._close_query)
+        finally:
+            self._release()
+
+    def _release(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+        if self._semaphore is not None:
+            self._semaphore.release()
+            self._semaphore = None
+
+    def __del__(self):
+        # An iterator abandoned without aclose() closes its query on its own
+        # thread and frees its place from the event loop's thread
+        if self._closed or self._semaphore is None:
+            return
+        self._closed = True
+        if self._executor is not None:
+            self._executor.submit(self._close_query)
+            self._executor.shutdown(wait=False)
+            self._executor = None
+        if not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(self._semaphore.release)
+        self._semaphore = None
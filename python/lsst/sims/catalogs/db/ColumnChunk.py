@@ -0,0 +1,112 @@
+from builtins import str
+from builtins import object
+import numbers
+import numpy
+from collections import OrderedDict
+
+__all__ = ["ColumnChunk"]
+
+
+class ColumnChunk(object):
+    """
+    A chunk of query results stored as one contiguous numpy array per
+    column (a "struct of arrays"), rather than as a numpy.recarray of
+    interleaved records.
+
+    ColumnChunk supports the subset of the numpy.recarray interface that
+    InstanceCatalog relies on:
+
+        chunk['name'] returns the (contiguous) array of the column 'name'
+
+        chunk['name'] = values overwrites the contents of the column 'name'
+
+        chunk[['name1', 'name2']] returns a ColumnChunk of just those columns
+        (the arrays are shared, not copied)
+
+        chunk[indexes] (a slice, boolean mask, integer array or the
+        output of numpy.where) returns a ColumnChunk of the selected rows
+
+        chunk[i] returns row i as a numpy record
+
+        chunk.dtype is the equivalent record dtype, so that
+        chunk.dtype.names lists the columns
+
+        len(chunk) is the number of rows
+
+    Use to_recarray() to get a numpy.recarray of the same data.
+    """
+
+    def __init__(self, columns):
+        """
+        @param [in] columns is an OrderedDict (or list of (name, array)
+        tuples) mapping column names to 1-dimensional numpy arrays,
+        all of the same length
+        """
+        self._columns = OrderedDict(columns)
+        lengths = set(len(column) for column in self._columns.values())
+        if len(lengths) > 1:
+            raise ValueError("The columns of a ColumnChunk must all have "
+                             "the same length; you gave lengths %s" % sorted(lengths))
+        self._len = lengths.pop() if len(lengths) > 0 else 0
+        self._dtype = None
+
+    @classmethod
+    def from_recarray(cls, records):
+        """
+        Return a ColumnChunk containing contiguous copies of the fields
+        of the structured array records
+        """
+        return cls([(name, numpy.ascontiguousarray(records[name]))
+                    for name in records.dtype.names])
+
+    def to_recarray(self):
+        """
+        Return the contents of this ColumnChunk as a numpy.recarray
+        """
+        records = numpy.recarray(self._len, dtype=self.dtype)
+        for name, column in self._columns.items():
+            records[name] = column
+        return records
+
+    @property
+    def dtype(self):
+        if self._dtype is None:
+            self._dtype = numpy.dtype([(name, column.dtype)
+                                       for name, column in self._columns.items()])
+        return self._dtype
+
+    def __len__(self):
+        return self._len
+
+    def __iter__(self):
+        return iter(self.to_recarray())
+
+    def __contains__(self, name):
+        return name in self._columns
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            try:
+                return self._columns[key]
+            except KeyError:
+                raise ValueError("no field of name %s" % key)
+
+        if isinstance(key, list) and len(key) > 0 and \
+           all(isinstance(name, str) for name in key):
+            return ColumnChunk([(name, self[name]) for name in key])
+
+        if isinstance(key, numbers.Integral):
+            return numpy.rec.fromarrays([column[key:key+1 or None]
+                                         for column in self._columns.values()],
+                                        dtype=self.dtype)[0]
+
+        return ColumnChunk([(name, column[key])
+                            for name, column in self._columns.items()])
+
+    def __setitem__(self, name, values):
+        if name not in self._columns:
+            raise ValueError("no field of name %s" % name)
+        self._columns[name][...] = values
+
+    def __repr__(self):
+        return 'ColumnChunk(%d rows; columns %s)' % (self._len, list(self._columns))
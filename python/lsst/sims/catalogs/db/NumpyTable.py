@@ -0,0 +1,300 @@
+from builtins import str
+from builtins import object
+import ast
+import re
+import numpy
+
+from .ColumnChunk import ColumnChunk
+
+__all__ = ["NumpyTable", "NumpyChunkIterator"]
+
+
+# The tokens of the SQL expressions NumpyTable can evaluate
+_SQL_TOKEN = re.compile(r"\s*(?:(?P<number>(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?)|"
+                        r"(?P<string>'(?:[^']|'')*')|"
+                        r"(?P<name>[A-Za-z_][A-Za-z_0-9]*)|"
+                        r"(?P<op><>|!=|<=|>=|==|[-+*/%(),<>=]))")
+
+_SQL_KEYWORDS = {'AND': 'and', 'OR': 'or', 'NOT': 'not'}
+_SQL_OPERATORS = {'=': '==', '<>': '!='}
+
+# The SQL functions NumpyTable can evaluate (including those
+# declareTrigFunctions adds to sqlite databases)
+_SQL_FUNCTIONS = {'ABS': numpy.abs, 'SQRT': numpy.sqrt, 'EXP': numpy.exp,
+                  'LN': numpy.log, 'LOG10': numpy.log10, 'POWER': numpy.power,
+                  'SIN': numpy.sin, 'COS': numpy.cos, 'TAN': numpy.tan,
+                  'ASIN': numpy.arcsin, 'ACOS': numpy.arccos, 'ATAN': numpy.arctan,
+                  'ATAN2': numpy.arctan2, 'RADIANS': numpy.radians,
+                  'DEGREES': numpy.degrees, 'PI': lambda: numpy.pi,
+                  'FLOOR': numpy.floor, 'CEIL': numpy.ceil, 'ROUND': numpy.round}
+
+# The nodes of literal numbers and strings
+# (ast.Num and ast.Str are deprecated in favor of ast.Constant)
+_AST_CONSTANTS = (ast.Constant,) if hasattr(ast, 'Constant') else (ast.Num, ast.Str)
+
+
+def _sql_to_python(sql):
+    """
+    Translate a SQL expression into the equivalent python expression,
+    or raise a ValueError if it contains something other than numbers,
+    strings, names, arithmetic, comparisons, AND, OR, NOT and function calls
+    """
+    tokens = []
+    position = 0
+    sql = sql.strip()
+    while position < len(sql):
+        match = _SQL_TOKEN.match(sql, position)
+        if match is None or match.end() == position:
+            raise ValueError("Cannot evaluate the SQL expression '%s' with numpy" % sql)
+        position = match.end()
+        token = match.group(match.lastgroup)
+        if match.lastgroup == 'name':
+            token = _SQL_KEYWORDS.get(token.upper(), token)
+        elif match.lastgroup == 'string':
+            token = repr(str(token[1:-1].replace("''", "'")))
+        elif match.lastgroup == 'op':
+            token = _SQL_OPERATORS.get(token, token)
+        tokens.append(token)
+    return ' '.join(tokens)
+
+
+class NumpyTable(object):
+    """
+    A table held in memory as a numpy structured array, which evaluates
+    the simple SQL expressions used in CatalogDBObject.columns and in
+    query constraints (e.g. 'mag*2.5', 'RADIANS(ra)', 'mag < 22 AND
+    sedFile = 'a.txt'') on its columns, with vectorized numpy.
+
+    Expressions are made of column names, numbers, quoted strings, the
+    arithmetic operators + - * / %, the comparisons = <> != < <= > >=,
+    AND, OR, NOT, parentheses and the functions in _SQL_FUNCTIONS (e.g.
+    SIN, SQRT, RADIANS, PI()).  Integer division truncates, as in SQL.
+    Anything else (e.g. IN, BETWEEN, IS NULL, LIKE) raises a ValueError.
+    """
+
+    def __init__(self, data):
+        """
+        @param [in] data is a numpy structured array holding the rows of the table
+        """
+        self.data = data
+        self._expressions = {}
+
+    def __len__(self):
+        return len(self.data)
+
+    @property
+    def column_names(self):
+        return self.data.dtype.names
+
+    def _parse(self, sql):
+        parsed = self._expressions.get(sql)
+        if parsed is None:
+            try:
+                parsed = ast.parse(_sql_to_python(sql), mode='eval').body
+            except SyntaxError:
+                raise ValueError("Cannot evaluate the SQL expression '%s' with numpy" % sql)
+            self._expressions[sql] = parsed
+        return parsed
+
+    def evaluate(self, sql, rows=None):
+        """
+        Evaluate the SQL expression sql on the rows (a slice, mask or
+        index array; default all of them) of the table, returning an
+        array (or a scalar if the expression uses no columns)
+        """
+        if rows is None:
+            rows = slice(None)
+        return self._evaluate(self._parse(sql), rows, sql)
+
+    def select(self, constraint):
+        """
+        Return the boolean mask of the rows satisfying the SQL constraint
+        """
+        mask = self.evaluate(constraint)
+        return numpy.broadcast_to(numpy.asarray(mask, dtype=bool), (len(self.data),))
+
+    def _evaluate(self, node, rows, sql):
+        if isinstance(node, ast.BoolOp):
+            combine = numpy.logical_and if isinstance(node.op, ast.And) else numpy.logical_or
+            result = self._evaluate(node.values[0], rows, sql)
+            for value in node.values[1:]:
+                result = combine(result, self._evaluate(value, rows, sql))
+            return result
+
+        if isinstance(node, ast.UnaryOp):
+            operand = self._evaluate(node.operand, rows, sql)
+            if isinstance(node.op, ast.Not):
+                return numpy.logical_not(operand)
+            if isinstance(node.op, ast.USub):
+                return -operand
+            if isinstance(node.op, ast.UAdd):
+                return operand
+
+        if isinstance(node, ast.BinOp):
+            left = self._evaluate(node.left, rows, sql)
+            right = self._evaluate(node.right, rows, sql)
+            if isinstance(node.op, ast.Add):
+                return left + right
+            if isinstance(node.op, ast.Sub):
+                return left - right
+            if isinstance(node.op, ast.Mult):
+                return left*right
+            if isinstance(node.op, ast.Div):
+                if numpy.issubdtype(numpy.result_type(left, right), numpy.integer):
+                    return numpy.trunc(numpy.true_divide(left, right)).astype(int)
+                return numpy.true_divide(left, right)
+            if isinstance(node.op, ast.Mod):
+                return numpy.fmod(left, right)
+
+        if isinstance(node, ast.Compare):
+            result = None
+            left = self._evaluate(node.left, rows, sql)
+            for op, comparator in zip(node.ops, node.comparators):
+                right = self._evaluate(comparator, rows, sql)
+                comparison = self._compare(op, left, right, sql)
+                result = comparison if result is None else numpy.logical_and(result, comparison)
+                left = right
+            return result
+
+        if isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and \
+           node.func.id.upper() in _SQL_FUNCTIONS and len(node.keywords) == 0:
+
+            args = [self._evaluate(arg, rows, sql) for arg in node.args]
+            return _SQL_FUNCTIONS[node.func.id.upper()](*args)
+
+        if isinstance(node, ast.Name):
+            if node.id not in self.data.dtype.names:
+                raise ValueError("Unknown column %s in the SQL expression '%s'" % (node.id, sql))
+            return self.data[node.id][rows]
+
+        if isinstance(node, _AST_CONSTANTS):
+            return node.value if hasattr(node, 'value') else getattr(node, 'n', getattr(node, 's', None))
+
+        raise ValueError("Cannot evaluate the SQL expression '%s' with numpy" % sql)
+
+    def _compare(self, op, left, right, sql):
+        # columns of bytes must be compared with bytes
+        if isinstance(left, numpy.ndarray) and left.dtype.kind == 'S' and isinstance(right, str):
+            right = right.encode('utf-8')
+        elif isinstance(right, numpy.ndarray) and right.dtype.kind == 'S' and isinstance(left, str):
+            left = left.encode('utf-8')
+        if isinstance(op, ast.Eq):
+            return numpy.equal(left, right)
+        if isinstance(op, ast.NotEq):
+            return numpy.not_equal(left, right)
+        if isinstance(op, ast.Lt):
+            return numpy.less(left, right)
+        if isinstance(op, ast.LtE):
+            return numpy.less_equal(left, right)
+        if isinstance(op, ast.Gt):
+            return numpy.greater(left, right)
+        if isinstance(op, ast.GtE):
+            return numpy.greater_equal(left, right)
+        raise ValueError("Cannot evaluate the SQL expression '%s' with numpy" % sql)
+
+
+class NumpyChunkIterator(object):
+    """
+    Iterator over the chunks of a query on a NumpyTable (see fileDBObject),
+    with the interface of ChunkIterator.  Each chunk is built, by evaluating
+    the expressions of the queried columns on its rows, only when it is
+    requested, and is postprocessed by the dbobj like the chunks of a
+    ChunkIterator.
+    """
+
+    def __init__(self, dbobj, table, colnames, rows, chunk_size, layout='records',
+                 memory_budget=None):
+        """
+        @param [in] dbobj is the CatalogDBObject being queried
+
+        @param [in] table is the NumpyTable holding dbobj's rows
+
+        @param [in] colnames is the list of the columns being queried
+
+        @param [in] rows is the array of the indexes of the rows selected by the query
+
+        @param [in] chunk_size is the number of rows returned per chunk
+        (None returns all of the rows in a single chunk)
+
+        @param [in] layout is 'records' if chunks should be numpy.recarrays
+        or 'columns' if they should be ColumnChunks
+
+        @param [in] memory_budget is the number of bytes of memory the chunks
+        should take up, in lieu of chunk_size (see ChunkIterator)
+        """
+        if layout not in ('records', 'columns'):
+            raise ValueError("layout must be 'records' or 'columns'; you gave %s" % layout)
+        if memory_budget is not None and chunk_size is not None:
+            raise ValueError("Cannot specify both chunk_size and memory_budget")
+
+        self.dbobj = dbobj
+        self._table = table
+        self._colnames = list(colnames)
+        self._rows = rows
+        self._dtype = dbobj._get_results_dtype(self._colnames)
+        self._default_values = dbobj._get_results_default_values(self._colnames)
+        self.layout = layout
+        self.memory_budget = memory_budget
+        self._row_overhead = 0
+        if memory_budget is not None:
+            chunk_size = self._budget_chunk_size()
+        self.chunk_size = chunk_size
+        self._position = 0
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self._position >= len(self._rows):
+            raise StopIteration
+
+        if self.chunk_size is None:
+            rows = self._rows
+        else:
+            rows = self._rows[self._position:self._position + self.chunk_size]
+        self._position += len(rows)
+
+        columns = [(name, self._evaluate_column(name, rows)) for name in self._colnames]
+        if self.layout == 'columns':
+            chunk = ColumnChunk(columns)
+        else:
+            chunk = numpy.rec.fromarrays([column for name, column in columns], dtype=self._dtype)
+        return self.dbobj._postprocess_results(chunk)
+
+    def _evaluate_column(self, name, rows):
+        """
+        Return the values of the queried column name in rows, with the
+        default values of dbobj.dbDefaultValues filled in as ChunkIterator
+        fills them in (NaNs are NULLs in the database)
+        """
+        # dbConnection imports this module
+        from .dbConnection import _fill_default_values
+
+        column = numpy.broadcast_to(self._table.evaluate(self.dbobj.columnMap[name], rows),
+                                    (len(rows),)).astype(self._dtype[name])
+        if self._default_values is not None and name in self._default_values:
+            if column.dtype.kind == 'f':
+                column[numpy.isnan(column)] = 0.0
+            column = _fill_default_values(column, self._default_values[name], self._dtype[name])
+        return column
+
+    def _budget_chunk_size(self):
+        nbytes_per_row = self._dtype.itemsize + self._row_overhead
+        return max(1, int(self.memory_budget//max(nbytes_per_row, 1)))
+
+    def set_row_overhead(self, nbytes):
+        """
+        Tell the iterator that the consumer uses nbytes of memory per row
+        of each chunk (see ChunkIterator.set_row_overhead)
+        """
+        if nbytes <= self._row_overhead:
+            return
+        self._row_overhead = nbytes
+        if self.memory_budget is not None:
+            self.chunk_size = self._budget_chunk_size()
+
+    def close(self):
+        """
+        Stop iterating.  Further calls to next() raise StopIteration.
+        """
+        self._position = len(self._rows)
@@ -0,0 +1,316 @@
+from builtins import str
+from builtins import object
+import hashlib
+import json
+import os
+import re
+import shutil
+import uuid
+import numpy
+
+from .ColumnChunk import ColumnChunk
+
+__all__ = ["QueryResultCache"]
+
+
+class QueryResultCache(object):
+    """
+    An on-disk cache of the results of CatalogDBObject.query_columns.
+
+    Each cached query is stored in its own directory as a sequence of
+    .npy files (one per chunk, as the chunks were returned by the database)
+    plus a small JSON manifest.  Cached results are replayed by memory-mapping
+    those files, so repeat queries run at disk speed.
+
+    The cache directory is organized as
+
+        cache_dir/<tableid>/<hash of the query key>/
+
+    so that all of the results from a table can be invalidated at once
+    (see invalidate).  If max_bytes is set, the least recently used entries
+    are evicted whenever storing a new entry would exceed it.
+
+    To use a cache, assign it to the result_cache attribute of a
+    CatalogDBObject (or of a CatalogDBObject class):
+
+        db_obj.result_cache = QueryResultCache('/path/to/cache', max_bytes=10**10)
+    """
+
+    _manifest_name = 'entry.json'
+
+    def __init__(self, cache_dir, max_bytes=None):
+        """
+        @param [in] cache_dir is the directory in which to store results
+        (created if it does not exist)
+
+        @param [in] max_bytes is the maximum total size of the cached results
+        in bytes (default None: unlimited)
+        """
+        self.cache_dir = os.path.abspath(cache_dir)
+        self.max_bytes = max_bytes
+        if not os.path.exists(self.cache_dir):
+            os.makedirs(self.cache_dir)
+
+    def _table_dir(self, tableid):
+        return os.path.join(self.cache_dir, re.sub(r'[^\w.-]', '_', str(tableid)))
+
+    def _entry_dir(self, tableid, key):
+        key_hash = hashlib.sha1(repr(key).encode('utf-8')).hexdigest()
+        return os.path.join(self._table_dir(tableid), key_hash)
+
+    def _read_manifest(self, entry_dir):
+        try:
+            with open(os.path.join(entry_dir, self._manifest_name), 'r') as input_file:
+                return json.load(input_file)
+        except (IOError, OSError, ValueError):
+            return None
+
+    def load(self, tableid, key, chunk_size=None, layout='records', memory_budget=None):
+        """
+        Return an iterator over the chunks of the cached results of the query
+        identified by (tableid, key), or None if they are not in the cache.
+
+        @param [in] chunk_size is the number of rows per chunk (None returns
+        all of the rows in a single chunk)
+
+        @param [in] layout is 'records' or 'columns' (see ChunkIterator)
+
+        @param [in] memory_budget is an optional number of bytes of memory
+        per chunk, in lieu of chunk_size (see ChunkIterator)
+        """
+        entry_dir = self._entry_dir(tableid, key)
+        manifest = self._read_manifest(entry_dir)
+        if manifest is None or manifest['key'] != repr(key):
+            return None
+
+        # record the access for the LRU eviction
+        os.utime(os.path.join(entry_dir, self._manifest_name), None)
+
+        file_names = [os.path.join(entry_dir, name) for name in manifest['files']]
+        return _CachedChunkIterator(file_names, chunk_size, layout, memory_budget)
+
+    def store(self, tableid, key, chunk_iter):
+        """
+        Return an iterator which passes on the chunks of chunk_iter, writing
+        them to the cache as the results of the query identified by
+        (tableid, key).  The entry is only added to the cache once chunk_iter
+        has been exhausted (or, if chunk_iter returns all of the rows in a
+        single chunk, as soon as that chunk has been read).
+        """
+        return _CachingChunkIterator(self, tableid, key, chunk_iter)
+
+    def _add_entry(self, tableid, key, tmp_dir, file_names, nbytes):
+        """
+        Turn the directory tmp_dir, containing the chunk files file_names,
+        into the cache entry for (tableid, key)
+        """
+        manifest = {'key': repr(key), 'files': file_names, 'nbytes': nbytes}
+        with open(os.path.join(tmp_dir, self._manifest_name), 'w') as output_file:
+            json.dump(manifest, output_file)
+
+        entry_dir = self._entry_dir(tableid, key)
+        if os.path.exists(entry_dir):
+            shutil.rmtree(entry_dir, ignore_errors=True)
+        try:
+            os.rename(tmp_dir, entry_dir)
+        except OSError:
+            # another process stored the same entry first
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+        if self.max_bytes is not None:
+            self._evict(self.max_bytes)
+
+    def _new_tmp_dir(self, tableid):
+        tmp_dir = os.path.join(self._table_dir(tableid), '.tmp-%s' % uuid.uuid4().hex)
+        os.makedirs(tmp_dir)
+        return tmp_dir
+
+    def _entries(self):
+        """
+        Return a list of (last access time, size in bytes, directory) for
+        every entry in the cache
+        """
+        entries = []
+        for table_name in os.listdir(self.cache_dir):
+            table_dir = os.path.join(self.cache_dir, table_name)
+            if not os.path.isdir(table_dir):
+                continue
+            for entry_name in os.listdir(table_dir):
+                if entry_name.startswith('.tmp-'):
+                    continue
+                entry_dir = os.path.join(table_dir, entry_name)
+                manifest = self._read_manifest(entry_dir)
+                if manifest is None:
+                    continue
+                access_time = os.path.getmtime(os.path.join(entry_dir, self._manifest_name))
+                entries.append((access_time, manifest['nbytes'], entry_dir))
+        return entries
+
+    @property
+    def nbytes(self):
+        """
+        The total size in bytes of the cached results
+        """
+        return sum(entry[1] for entry in self._entries())
+
+    def _evict(self, max_bytes):
+        """
+        Remove the least recently used entries until the total size
+        of the cache is no more than max_bytes
+        """
+        entries = sorted(self._entries())
+        total = sum(entry[1] for entry in entries)
+        for access_time, nbytes, entry_dir in entries:
+            if total <= max_bytes:
+                break
+            shutil.rmtree(entry_dir, ignore_errors=True)
+            total -= nbytes
+
+    def invalidate(self, tableid):
+        """
+        Remove all of the cached results of queries on the table tableid
+        (from any database connection)
+        """
+        table_dir = self._table_dir(tableid)
+        if os.path.exists(table_dir):
+            shutil.rmtree(table_dir, ignore_errors=True)
+
+    def clear(self):
+        """
+        Remove everything from the cache
+        """
+        for name in os.listdir(self.cache_dir):
+            path = os.path.join(self.cache_dir, name)
+            if os.path.isdir(path):
+                shutil.rmtree(path, ignore_errors=True)
+
+
+class _CachingChunkIterator(object):
+    """
+    Wraps an iterator over query chunks, writing each chunk to a
+    QueryResultCache as it passes through
+    """
+    def __init__(self, cache, tableid, key, chunk_iter):
+        self._cache = cache
+        self._tableid = tableid
+        self._key = key
+        self._chunk_iter = chunk_iter
+        self._tmp_dir = cache._new_tmp_dir(tableid)
+        self._file_names = []
+        self._nbytes = 0
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        try:
+            chunk = next(self._chunk_iter)
+        except StopIteration:
+            self._finish()
+            raise
+
+        if self._tmp_dir is not None:
+            records = chunk.to_recarray() if isinstance(chunk, ColumnChunk) else chunk
+            if records.dtype.hasobject:
+                # object arrays cannot be memory-mapped; do not cache them
+                self._abandon()
+            else:
+                file_name = 'chunk_%06d.npy' % len(self._file_names)
+                numpy.save(os.path.join(self._tmp_dir, file_name), records)
+                self._file_names.append(file_name)
+                self._nbytes += records.nbytes
+                if self._chunk_iter.chunk_size is None:
+                    # there are no more chunks to come
+                    self._finish()
+
+        return chunk
+
+    def _finish(self):
+        if self._tmp_dir is not None:
+            self._cache._add_entry(self._tableid, self._key, self._tmp_dir,
+                                   self._file_names, self._nbytes)
+            self._tmp_dir = None
+
+    def _abandon(self):
+        if self._tmp_dir is not None:
+            shutil.rmtree(self._tmp_dir, ignore_errors=True)
+            self._tmp_dir = None
+
+    def set_row_overhead(self, nbytes):
+        self._chunk_iter.set_row_overhead(nbytes)
+
+    def close(self):
+        """
+        Stop iterating; nothing is added to the cache
+        """
+        self._abandon()
+        self._chunk_iter.close()
+
+    def __del__(self):
+        try:
+            self._abandon()
+        except Exception:
+            pass
+
+
+class _CachedChunkIterator(object):
+    """
+    Iterates over the chunks of results stored in a QueryResultCache,
+    re-chunking them to chunk_size rows
+    """
+    def __init__(self, file_names, chunk_size, layout, memory_budget=None):
+        self.layout = layout
+        self.memory_budget = memory_budget
+        self._arrays = [numpy.load(file_name, mmap_mode='c') for file_name in file_names]
+        self._i_array = 0
+        self._i_row = 0
+        self._row_nbytes = self._arrays[0].dtype.itemsize if len(self._arrays) > 0 else 1
+        self._row_overhead = 0
+        if memory_budget is not None:
+            chunk_size = self._budget_chunk_size()
+        self.chunk_size = chunk_size
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        pieces = []
+        n_wanted = self.chunk_size
+        while self._i_array < len(self._arrays) and (n_wanted is None or n_wanted > 0):
+            array = self._arrays[self._i_array]
+            if n_wanted is None:
+                piece = array[self._i_row:]
+            else:
+                piece = array[self._i_row:self._i_row+n_wanted]
+                n_wanted -= len(piece)
+            self._i_row += len(piece)
+            if self._i_row >= len(array):
+                self._i_array += 1
+                self._i_row = 0
+            if len(piece) > 0:
+                pieces.append(piece)
+
+        if len(pieces) == 0:
+            raise StopIteration
+
+        if len(pieces) == 1:
+            chunk = pieces[0].view(numpy.recarray)
+        else:
+            chunk = numpy.concatenate(pieces).view(numpy.recarray)
+
+        if self.layout == 'columns':
+            return ColumnChunk.from_recarray(chunk)
+        return chunk
+
+    def _budget_chunk_size(self):
+        return max(1, int(self.memory_budget//(self._row_nbytes + self._row_overhead)))
+
+    def set_row_overhead(self, nbytes):
+        if nbytes <= self._row_overhead:
+            return
+        self._row_overhead = nbytes
+        if self.memory_budget is not None:
+            self.chunk_size = self._budget_chunk_size()
+
+    def close(self):
+        self._i_array = len(self._arrays)
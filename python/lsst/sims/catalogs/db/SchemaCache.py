@@ -0,0 +1,143 @@
+from builtins import str
+from builtins import object
+import hashlib
+import os
+import pickle
+import time
+import uuid
+
+from sqlalchemy import Table, Column
+
+__all__ = ["SchemaCache"]
+
+
+class SchemaCache(object):
+    """
+    A cache of the schemas of database tables, so that CatalogDBObjects
+    can be instantiated without reflecting their tables from the database.
+
+    The first time a table is requested, it is reflected from the database
+    and a snapshot of its columns (their names, types, and whether they are
+    nullable or part of the primary key) is kept in memory and, if cache_dir
+    is specified, written to disk.  Later requests (including those from
+    other processes sharing cache_dir) build the table from the snapshot.
+
+    Snapshots older than ttl seconds are discarded and the table reflected
+    again; use refresh (or CatalogDBObject.refresh_schema) to do so
+    explicitly after a table's schema has changed.
+
+    To use a cache, assign it to the schema_cache attribute of
+    CatalogDBObject (or of a subclass):
+
+        CatalogDBObject.schema_cache = SchemaCache('/path/to/cache', ttl=86400)
+    """
+
+    def __init__(self, cache_dir=None, ttl=None):
+        """
+        @param [in] cache_dir is the directory in which to store the
+        snapshots (created if it does not exist).  If None, they are
+        only kept in memory.
+
+        @param [in] ttl is the number of seconds for which a snapshot is
+        used before the table is reflected again (default None: forever)
+        """
+        self.cache_dir = None
+        if cache_dir is not None:
+            self.cache_dir = os.path.abspath(cache_dir)
+            if not os.path.exists(self.cache_dir):
+                os.makedirs(self.cache_dir)
+        self.ttl = ttl
+        self._snapshots = {}
+
+    def _key(self, connection, tableid):
+        return (str(connection.driver), str(connection.host), str(connection.port),
+                str(connection.database), str(tableid))
+
+    def _file_name(self, key):
+        key_hash = hashlib.sha1(repr(key).encode('utf-8')).hexdigest()
+        return os.path.join(self.cache_dir, '%s.pickle' % key_hash)
+
+    def _is_fresh(self, snapshot):
+        return self.ttl is None or time.time() - snapshot[0] <= self.ttl
+
+    def _load(self, key):
+        """
+        Return the fresh snapshot (time, columns) of the table identified
+        by key, or None
+        """
+        snapshot = self._snapshots.get(key)
+        if snapshot is None and self.cache_dir is not None:
+            try:
+                with open(self._file_name(key), 'rb') as input_file:
+                    file_key, snapshot = pickle.load(input_file)
+            except (IOError, OSError, EOFError, pickle.UnpicklingError):
+                return None
+            if file_key != key:
+                return None
+            self._snapshots[key] = snapshot
+
+        if snapshot is None or not self._is_fresh(snapshot):
+            return None
+        return snapshot
+
+    def _store(self, key, table):
+        """
+        Snapshot the columns of the reflected table, which is identified by key
+        """
+        columns = [(column.name, column.type, column.primary_key, column.nullable)
+                   for column in table.c]
+        snapshot = (time.time(), columns)
+        self._snapshots[key] = snapshot
+
+        if self.cache_dir is not None:
+            file_name = self._file_name(key)
+            tmp_name = '%s.tmp-%s' % (file_name, uuid.uuid4().hex)
+            with open(tmp_name, 'wb') as output_file:
+                pickle.dump((key, snapshot), output_file, 2)
+            os.rename(tmp_name, file_name)
+
+    def get_table(self, connection, tableid, refresh=False):
+        """
+        Return the sqlalchemy Table tableid on the DBConnection connection,
+        built from its snapshot if there is a fresh one, otherwise reflected
+        from the database.
+
+        @param [in] refresh is True if the table should be reflected from
+        the database (and its snapshot replaced) regardless
+        """
+        key = self._key(connection, tableid)
+        metadata = connection.metadata
+
+        snapshot = None if refresh else self._load(key)
+
+        if snapshot is not None and tableid in metadata.tables:
+            return metadata.tables[tableid]
+
+        if tableid in metadata.tables:
+            metadata.remove(metadata.tables[tableid])
+
+        if snapshot is not None:
+            return Table(tableid, metadata,
+                         *[Column(name, column_type, primary_key=primary_key, nullable=nullable)
+                           for name, column_type, primary_key, nullable in snapshot[1]])
+
+        table = Table(tableid, metadata, autoload=True)
+        self._store(key, table)
+        return table
+
+    def refresh(self, connection, tableid):
+        """
+        Reflect the table tableid on the DBConnection connection from the
+        database, replacing its snapshot, and return it
+        """
+        return self.get_table(connection, tableid, refresh=True)
+
+    def clear(self):
+        """
+        Remove all of the snapshots (in memory and on disk)
+        """
+        self._snapshots.clear()
+        if self.cache_dir is not None:
+            for name in os.listdir(self.cache_dir):
+                if name.endswith('.pickle'):
+                    os.unlink(os.path.join(self.cache_dir, name))
@@ -1,3 +1,7 @@
+from .ColumnChunk import *
+from .NumpyTable import *
 from .dbConnection import *
+from .QueryResultCache import *
+from .SchemaCache import *
 from .CompoundCatalogDBObject import *
 from .utils import *
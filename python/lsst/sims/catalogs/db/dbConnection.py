@@ -1,5 +1,3 @@
-from future import standard_library
-standard_library.install_aliases()
 import sys
 from builtins import str
 
@@ -17,32 +15,45 @@ if sys.version_info.major == 2:
     str_cast = past_str
 
 from builtins import zip
+from builtins import map
+from builtins import range
 from builtins import object
 import warnings
 import numpy
 import os
+import re
 import inspect
-from io import BytesIO
+import functools
+import itertools
+import queue
+import threading
+import weakref
+from operator import itemgetter
 from collections import OrderedDict
+from urllib.parse import quote, urlencode
 
-from .utils import loadData
-from sqlalchemy.orm import scoped_session, sessionmaker
+from .utils import (loadData, loadCachedData, loadArray, id_generator,
+                    get_sqlite_profile, set_sqlite_pragmas, _unit_vectors, _healpy)
+from .ColumnChunk import ColumnChunk
+from .NumpyTable import NumpyTable, NumpyChunkIterator
 from sqlalchemy.sql import expression
-from sqlalchemy.engine import reflection, url
+from sqlalchemy.engine import reflection, url, ResultProxy
 from sqlalchemy import (create_engine, MetaData,
-                        Table, event, text)
+                        Table, event, text, func, and_, or_)
 from sqlalchemy import exc as sa_exc
-from lsst.daf.butler.registry import DbAuth
-from lsst.sims.utils.CodeUtilities import sims_clean_up
-from lsst.utils import getPackageDir
+from sqlalchemy.pool import SingletonThreadPool
+# sqlalchemy.orm, DbAuth, lsst.utils and lsst.sims.utils are comparatively
+# slow to import, and are only needed once a connection is made, so they
+# are imported where they are used.
 
 #The documentation at http://docs.sqlalchemy.org/en/rel_0_7/core/types.html#sqlalchemy.types.Numeric
 #suggests using the cdecimal module.  Since it is not standard, import decimal.
 #TODO: test for cdecimal and use it if it exists.
 import decimal
-from future.utils import with_metaclass
+import numbers
 
-__all__ = ["ChunkIterator", "DBObject", "CatalogDBObject", "fileDBObject"]
+__all__ = ["ChunkIterator", "PartitionedChunkIterator",
+           "DBObject", "CatalogDBObject", "fileDBObject"]
 
 def valueOfPi():
     """
@@ -68,14 +79,735 @@ def declareTrigFunctions(conn,connection_rec,connection_proxy):
     conn.create_function("POWER",2,numpy.power)
     conn.create_function("PI",0,valueOfPi)
 
+def _sqlite_connect_listener(pragmas):
+    """
+    Return a database event listener which declares the trig functions
+    (see declareTrigFunctions) and sets the pragmas (a list of (name, value)
+    tuples) of each new sqlite connection, once, when it is opened
+    """
+    def on_connect(dbapi_connection, connection_record):
+        declareTrigFunctions(dbapi_connection, connection_record, None)
+        set_sqlite_pragmas(dbapi_connection, pragmas)
+    return on_connect
+
+def _record_connection_pid(dbapi_connection, connection_record):
+    """
+    A database event listener which records the process in which
+    each connection in an engine's pool was opened
+    """
+    connection_record.info['pid'] = os.getpid()
+
+def _check_connection_pid(dbapi_connection, connection_record, connection_proxy):
+    """
+    A database event listener which prevents a forked process from using a
+    pooled connection opened by its parent (whose socket it shares).  The
+    connection is detached from the pool, rather than closed, so that the
+    parent's connection is left intact, and the pool opens a new one.
+
+    see:    http://docs.sqlalchemy.org/en/13/core/pooling.html#using-connection-pools-with-multiprocessing
+    """
+    pid = os.getpid()
+    if connection_record.info.get('pid', pid) != pid:
+        connection_record.connection = connection_proxy.connection = None
+        raise sa_exc.DisconnectionError("Connection record belongs to pid %s, "
+                                        "attempting to check out in pid %s" %
+                                        (connection_record.info['pid'], pid))
+
+def _fill_default_values(column, default_value, dtype):
+    """
+    Replace the NULL (None) or otherwise false values (0, '', False) in a
+    column of query results with a default value.  This reproduces the
+    semantics of CatalogDBObject.dbDefaultValues using a single masked
+    assignment, rather than by testing each value individually.
+
+    Parameters
+    ----------
+    column is a numpy array of query results.  It may be an object array
+    (which is how columns containing NULLs are passed in).
+
+    default_value is the value with which to replace the false entries
+
+    dtype is the numpy dtype the returned column should have
+
+    Returns
+    -------
+    A numpy array of dtype dtype
+    """
+    if column.dtype == object:
+        # casting an object array to bool evaluates the truth value of each
+        # element, so None, 0, '' and False are all flagged
+        is_false = numpy.logical_not(column.astype(bool))
+    elif column.dtype.kind in 'US':
+        is_false = column == ''
+    else:
+        is_false = column == 0
+
+    if is_false.any():
+        column[is_false] = default_value
+
+    return column.astype(dtype, copy=False)
+
+
+def _rows_to_columns(rows, dtype, default_values=None):
+    """
+    Convert a list of rows, as returned by a DBAPI cursor, into a list
+    of contiguous numpy arrays, one per column.
+
+    Each column is extracted from the rows with operator.itemgetter and
+    fed straight into a numpy array, so no per-row Python code is run
+    and no intermediate tuples are built.
+
+    Parameters
+    ----------
+    rows is a list of tuples, one per row returned by the query
+
+    dtype is the numpy dtype of the rows.  Its fields must be in the
+    same order as the columns of the query.
+
+    default_values is an optional dict mapping column names to the
+    values with which NULL (or otherwise false) entries in those columns
+    should be replaced (see CatalogDBObject.dbDefaultValues)
+
+    Returns
+    -------
+    A list of numpy arrays, in the order of dtype.names
+    """
+    n_rows = len(rows)
+    columns = []
+    for i_col, name in enumerate(dtype.names):
+        field_type = dtype[name]
+        has_default = default_values is not None and name in default_values
+        column = None
+        if field_type.kind in 'biuf':
+            try:
+                column = numpy.fromiter(map(itemgetter(i_col), rows),
+                                        dtype=field_type, count=n_rows)
+            except (TypeError, ValueError):
+                # The column contains NULLs or values that fromiter cannot
+                # cast; fall back on numpy's generic sequence conversion,
+                # which behaves like numpy.rec.fromrecords (e.g. NULL
+                # becomes NaN in float columns).
+                pass
+            if column is not None and has_default and field_type.kind == 'f' and \
+               numpy.isnan(column).any():
+                # fromiter turns NULLs into NaNs; go back to the raw values
+                # so that NULLs (but not genuine NaNs) get the default
+                column = None
+        if column is None:
+            values = list(map(itemgetter(i_col), rows))
+            if has_default:
+                # keep the raw values so that NULLs can be identified
+                # and replaced before casting to field_type
+                column = numpy.array(values, dtype=object)
+            else:
+                column = numpy.array(values, dtype=field_type)
+        if has_default:
+            column = _fill_default_values(column, default_values[name], field_type)
+        columns.append(column)
+
+    return columns
+
+
+def _rows_to_recarray(rows, dtype, default_values=None):
+    """
+    Convert a list of rows, as returned by a DBAPI cursor, into a numpy
+    recarray.
+
+    Rather than converting the rows one record at a time (as
+    numpy.rec.fromrecords does), the rows are converted into one array
+    per column (see _rows_to_columns) and the fields of a preallocated
+    recarray are filled from those arrays.
+
+    Parameters
+    ----------
+    rows is a list of tuples, one per row returned by the query
+
+    dtype is the numpy dtype of the output.  Its fields must be in the
+    same order as the columns of the query.
+
+    default_values is an optional dict mapping column names to the
+    values with which NULL (or otherwise false) entries in those columns
+    should be replaced
+
+    Returns
+    -------
+    A numpy recarray with len(rows) records
+    """
+    retresults = numpy.recarray((len(rows),), dtype=dtype)
+    if len(rows) == 0:
+        return retresults
+
+    for name, column in zip(dtype.names, _rows_to_columns(rows, dtype, default_values)):
+        retresults[name] = column
+
+    return retresults
+
+def _validate_column_names(names):
+    """
+    Turn the column names reported by a query into valid numpy field
+    names, following the conventions of numpy.genfromtxt (which is what
+    DBObject originally used to name the columns of arbitrary queries):
+    spaces become underscores, punctuation is removed, and duplicated
+    names have '_1', '_2', etc. appended.
+    """
+    deletechars = set("""~!@#$%^&*()-=+~\\|]}[{';: /?.>,<""")
+    excludelist = ['return', 'file', 'print']
+    validated = []
+    seen = {}
+    n_empty = 0
+    for name in names:
+        name = str_cast(name).strip().replace(' ', '_')
+        name = ''.join([cc for cc in name if cc not in deletechars])
+        if name == '':
+            name = 'f%i' % n_empty
+            while name in names:
+                n_empty += 1
+                name = 'f%i' % n_empty
+            n_empty += 1
+        elif name in excludelist:
+            name += '_'
+        ct = seen.get(name, 0)
+        if ct > 0:
+            validated.append(str_cast(name + '_%d' % ct))
+        else:
+            validated.append(str_cast(name))
+        seen[name] = ct + 1
+    return validated
+
+
+def _derive_column_type(values, type_code=None, dbapi=None):
+    """
+    Return the numpy type (or (type, length) tuple) appropriate for a
+    column of query results.
+
+    Parameters
+    ----------
+    values is an iterable of the values returned in the column
+
+    type_code is the type_code reported for the column in the DBAPI
+    cursor.description (optional)
+
+    dbapi is the DBAPI module that reported type_code (optional).  Its
+    PEP 249 type objects (STRING, BINARY, NUMBER) are used to type columns
+    that contain only NULLs.
+    """
+    values = [vv for vv in values if vv is not None]
+    value_types = set(map(type, values))
+
+    if len(value_types) == 0:
+        if type_code is not None and dbapi is not None:
+            if type_code == getattr(dbapi, 'STRING', None):
+                return (str_cast, 1)
+            if type_code == getattr(dbapi, 'BINARY', None):
+                return (bytes, 1)
+        # NULLs become NaN in a float column
+        return float
+
+    if all(issubclass(tt, (bool, numpy.bool_)) for tt in value_types):
+        return bool
+    if all(issubclass(tt, numbers.Integral) for tt in value_types):
+        return int
+    if all(issubclass(tt, (numbers.Real, decimal.Decimal)) for tt in value_types):
+        return float
+    if all(issubclass(tt, bytes) for tt in value_types) and bytes is not str:
+        return (bytes, max(1, max(map(len, values))))
+    return (str_cast, max(1, max(len(str(vv)) for vv in values)))
+
+
+def _derive_results_dtype(rows, names, type_codes=None, dbapi=None):
+    """
+    Derive the numpy dtype of the results of an arbitrary query from the
+    column names and type codes reported by the cursor and the types of
+    the values actually returned (some databases, e.g. sqlite, do not
+    enforce the declared types of their columns, so the values are the
+    only reliable guide).
+
+    Parameters
+    ----------
+    rows is a list of rows returned by the query (may be empty)
+
+    names is a list of the names of the columns returned by the query
+
+    type_codes is an optional list of the DBAPI type_codes of the columns
+
+    dbapi is the DBAPI module that produced the rows (optional)
+
+    Returns
+    -------
+    A numpy dtype
+    """
+    if type_codes is None:
+        type_codes = [None]*len(names)
+
+    dt_list = []
+    for i_col, (name, type_code) in enumerate(zip(_validate_column_names(names), type_codes)):
+        column = list(map(itemgetter(i_col), rows))
+        col_type = _derive_column_type(column, type_code=type_code, dbapi=dbapi)
+        if col_type is int and None in column:
+            # integer columns containing NULLs are returned as floats
+            col_type = float
+        if isinstance(col_type, tuple):
+            dt_list.append((name,) + col_type)
+        else:
+            dt_list.append((name, col_type))
+    return numpy.dtype(dt_list)
+
+
+def _widen_string_fields(rows, dtype):
+    """
+    Return a copy of dtype in which any string fields are wide enough to
+    hold the longest string in the corresponding column of rows (string
+    fields are never narrowed, so values are never truncated).
+    """
+    dt_list = []
+    changed = False
+    for i_col, name in enumerate(dtype.names):
+        field_type = dtype[name]
+        if field_type.kind in 'US' and len(rows) > 0:
+            lengths = [len(vv) for vv in map(itemgetter(i_col), rows) if vv is not None]
+            if len(lengths) > 0:
+                max_len = max(lengths)
+                if field_type.kind == 'U':
+                    width = field_type.itemsize//numpy.dtype('U1').itemsize
+                else:
+                    width = field_type.itemsize
+                if max_len > width:
+                    field_type = numpy.dtype((field_type.type, max_len))
+                    changed = True
+        dt_list.append((name, field_type))
+
+    if not changed:
+        return dtype
+    return numpy.dtype(dt_list)
+
+#------------------------------------------------------------
+# Two-stage spatial filtering (see CatalogDBObject.query_columns)
+
+# Labels of the RA and Dec columns added to a query filtered by a bounding
+# box, from which the exact cut is made
+_BOUNDS_RA = '_bounds_ra'
+_BOUNDS_DEC = '_bounds_dec'
+
+# Padding (in degrees) of the bounding box, so that round-off cannot
+# exclude rows which the exact cut would keep
+_BOUNDING_BOX_PAD = 1.0e-6
+
+# The number of HEALPix pixels spanned by the radius of the bounds at the
+# resolution at which _healpix_ranges looks for the pixels overlapping them
+_HEALPIX_PIXELS_PER_RADIUS = 4
+
+# The most pixels (roughly) whose ranges of ids _healpix_ranges merges
+_HEALPIX_MAX_PIXELS = 1024
+
+# The most ranges of pixel ids _healpix_ranges returns (it finds the pixels
+# at lower resolutions until there are no more)
+_HEALPIX_MAX_RANGES = 64
+
+# The most pieces into which _healpix_ranges splits a box in Dec
+_HEALPIX_MAX_DEC_SPLITS = 16
+
+
+def _ra_ranges(ra_min, ra_max):
+    """
+    Return the RA range [ra_min, ra_max] (in degrees) as a list of
+    (min, max) ranges within [0, 360], or None if it covers all RA
+    """
+    ra_min -= _BOUNDING_BOX_PAD
+    ra_max += _BOUNDING_BOX_PAD
+    if ra_max - ra_min >= 360.0:
+        return None
+    width = ra_max - ra_min
+    ra_min = ra_min % 360.0
+    ra_max = ra_min + width
+    if ra_max > 360.0:
+        return [(ra_min, 360.0), (0.0, ra_max - 360.0)]
+    return [(ra_min, ra_max)]
+
+
+def _bounding_box(bounds):
+    """
+    Return the RA/Dec box (in degrees) containing bounds as (ra_ranges,
+    dec_min, dec_max), where ra_ranges is a list of (min, max) RA ranges,
+    or None if the box spans all RA (e.g. because a circle contains a pole).
+    Returns None if bounds is neither a circle nor a box.
+    """
+    if bounds.boundType == 'circle':
+        dec_min = bounds.DECdeg - bounds.radiusdeg - _BOUNDING_BOX_PAD
+        dec_max = bounds.DECdeg + bounds.radiusdeg + _BOUNDING_BOX_PAD
+        if dec_min <= -90.0 or dec_max >= 90.0:
+            return None, dec_min, dec_max
+        # the largest RA offset of any point on a circle of radius r
+        # about Dec d is arcsin(sin(r)/cos(d))
+        half_width = numpy.degrees(numpy.arcsin(min(1.0, numpy.sin(bounds.radius)/numpy.cos(bounds.DEC))))
+        return _ra_ranges(bounds.RAdeg - half_width, bounds.RAdeg + half_width), dec_min, dec_max
+
+    if bounds.boundType == 'box':
+        dec_min = bounds.DECminDeg - _BOUNDING_BOX_PAD
+        dec_max = bounds.DECmaxDeg + _BOUNDING_BOX_PAD
+        if bounds.RAminDeg <= bounds.RAmaxDeg:
+            ra_ranges = _ra_ranges(bounds.RAminDeg, bounds.RAmaxDeg)
+        else:
+            ra_ranges = _ra_ranges(bounds.RAminDeg, bounds.RAmaxDeg + 360.0)
+        return ra_ranges, dec_min, dec_max
+
+    return None
+
+
+def _merge_bounding_boxes(bounds_list):
+    """
+    Return a list of (ra_min, ra_max, dec_min, dec_max) RA/Dec boxes (in
+    degrees), disjoint in RA, whose union contains all of bounds_list.  The
+    bounding boxes of bounds which overlap in RA are merged, so that
+    overlapping bounds give few boxes.  Returns None if any of bounds_list
+    is neither a circle nor a box.
+    """
+    boxes = []
+    for bounds in bounds_list:
+        box = _bounding_box(bounds)
+        if box is None:
+            return None
+        ra_ranges, dec_min, dec_max = box
+        if ra_ranges is None:
+            ra_ranges = [(0.0, 360.0)]
+        boxes.extend((ra_min, ra_max, dec_min, dec_max) for ra_min, ra_max in ra_ranges)
+
+    boxes.sort()
+    merged = [list(boxes[0])]
+    for ra_min, ra_max, dec_min, dec_max in boxes[1:]:
+        last = merged[-1]
+        if ra_min <= last[1]:
+            last[1] = max(last[1], ra_max)
+            last[2] = min(last[2], dec_min)
+            last[3] = max(last[3], dec_max)
+        else:
+            merged.append([ra_min, ra_max, dec_min, dec_max])
+    return [tuple(box) for box in merged]
+
+
+def _box_disc(ra_min, ra_max, dec_min, dec_max):
+    """
+    Return the (center, radius) of the disc about the center of the box
+    ra_min <= RA <= ra_max, dec_min <= Dec <= dec_max (in radians; the box
+    must be less than 180 degrees wide) through its farthest corner, which
+    contains the box
+    """
+    center = _unit_vectors(numpy.array([0.5*(ra_min + ra_max)]),
+                           numpy.array([0.5*(dec_min + dec_max)]))[0]
+    corners = _unit_vectors(numpy.array([ra_min, ra_min, ra_max, ra_max]),
+                            numpy.array([dec_min, dec_max, dec_min, dec_max]))
+    return center, numpy.arccos(numpy.clip(numpy.dot(corners, center), -1.0, 1.0)).max()
+
+
+def _healpix_ranges(bounds, nside):
+    """
+    Return the list of the (min, max) ranges (inclusive) of the ids of the
+    HEALPix pixels (in the nested scheme, at resolution nside) which may
+    overlap bounds, or None if bounds is neither a circle nor a box (or is a
+    circle 90 degrees or more in radius).  The pixels are found at a
+    resolution at which the bounds span about _HEALPIX_PIXELS_PER_RADIUS
+    pixels (or lower, so that the bounds cover at most about
+    _HEALPIX_MAX_PIXELS pixels and there are at most _HEALPIX_MAX_RANGES
+    ranges);
+    each pixel at that resolution is a single range of ids at resolution
+    nside.
+
+    A box is covered by the pixels in its band of Dec which are also in the
+    discs about the sub-boxes it is split into, at most 90 degrees wide in RA
+    and each in one hemisphere, so that none of the discs is near 90 degrees
+    in radius: healpy.query_disc does not find all the pixels overlapping
+    such large discs.
+    """
+    healpy = _healpy()
+    pad = numpy.radians(_BOUNDING_BOX_PAD)
+    if bounds.boundType == 'circle':
+        radius = bounds.radius + pad
+        if radius >= 0.5*numpy.pi:
+            return None
+        discs = [(_unit_vectors(numpy.array([bounds.RA]), numpy.array([bounds.DEC]))[0], radius)]
+        strip = None
+        size = radius
+        area = 2.0*numpy.pi*(1.0 - numpy.cos(radius))
+    elif bounds.boundType == 'box':
+        ra_min = numpy.radians(bounds.RAminDeg) - pad
+        ra_max = numpy.radians(bounds.RAmaxDeg) + pad
+        if bounds.RAmaxDeg < bounds.RAminDeg:
+            ra_max += 2.0*numpy.pi
+        dec_min = max(numpy.radians(bounds.DECminDeg) - pad, -0.5*numpy.pi)
+        dec_max = min(numpy.radians(bounds.DECmaxDeg) + pad, 0.5*numpy.pi)
+        # the cosine of the Dec of the widest parallel of the box
+        cos_dec = 1.0 if dec_min < 0.0 < dec_max else numpy.cos(min(abs(dec_min), abs(dec_max)))
+        n_ra = max(int(numpy.ceil((ra_max - ra_min)/(0.5*numpy.pi))), 1)
+        ra_edges = numpy.linspace(ra_min, ra_max, n_ra + 1)
+        # tall sub-boxes are split into (up to _HEALPIX_MAX_DEC_SPLITS)
+        # roughly square ones, which their discs cover more closely
+        n_dec = int(numpy.ceil((dec_max - dec_min)/max((ra_edges[1] - ra_edges[0])*cos_dec, pad)))
+        dec_edges = numpy.linspace(dec_min, dec_max, min(max(n_dec, 1), _HEALPIX_MAX_DEC_SPLITS) + 1)
+        if dec_min < 0.0 < dec_max:
+            dec_edges = numpy.union1d(dec_edges, [0.0])
+        discs = []
+        for sub_ra_min, sub_ra_max in zip(ra_edges[:-1], ra_edges[1:]):
+            for sub_dec_min, sub_dec_max in zip(dec_edges[:-1], dec_edges[1:]):
+                center, radius = _box_disc(sub_ra_min, sub_ra_max, sub_dec_min, sub_dec_max)
+                discs.append((center, radius + pad))
+        strip = (0.5*numpy.pi - dec_max, 0.5*numpy.pi - dec_min)
+        # half the narrower side of the box, across its widest parallel
+        size = 0.5*min((ra_max - ra_min)*cos_dec, dec_max - dec_min)
+        area = (ra_max - ra_min)*(numpy.sin(dec_max) - numpy.sin(dec_min))
+    else:
+        return None
+
+    query_nside = nside
+    while query_nside > 1 and (healpy.nside2resol(query_nside)*_HEALPIX_PIXELS_PER_RADIUS < size or
+                               area > _HEALPIX_MAX_PIXELS*healpy.nside2pixarea(query_nside)):
+        query_nside //= 2
+    while True:
+        pixels = numpy.unique(numpy.concatenate([healpy.query_disc(query_nside, center, radius,
+                                                                   inclusive=True, nest=True)
+                                                 for center, radius in discs]))
+        if strip is not None:
+            # the pixels in a strip are a single range of ids in the ring scheme
+            # (and query_strip can only number them in that scheme)
+            strip_pixels = healpy.query_strip(query_nside, strip[0], strip[1], inclusive=True)
+            ring_pixels = healpy.nest2ring(query_nside, pixels)
+            pixels = pixels[(ring_pixels >= strip_pixels.min()) & (ring_pixels <= strip_pixels.max())]
+        if len(pixels) == 0:
+            return [(0, -1)]
+
+        # runs of consecutive pixels are merged into single ranges
+        breaks = numpy.flatnonzero(numpy.diff(pixels) != 1) + 1
+        if len(breaks) < _HEALPIX_MAX_RANGES or query_nside == 1:
+            break
+        query_nside //= 2
+
+    starts = pixels[numpy.concatenate(([0], breaks))]
+    ends = pixels[numpy.concatenate((breaks - 1, [len(pixels) - 1]))]
+    n_sub_pixels = (nside//query_nside)**2
+    return [(int(start)*n_sub_pixels, (int(end) + 1)*n_sub_pixels - 1)
+            for start, end in zip(starts, ends)]
+
+
+def _bounds_key(bounds):
+    """
+    Return a string identifying the region bounds (a circle or box, or None)
+    selects, for keys of cached results
+    """
+    if bounds is None:
+        return 'None'
+    if bounds.boundType == 'circle':
+        return 'circle(%.17g, %.17g, %.17g)' % (bounds.RA, bounds.DEC, bounds.radius)
+    return 'box(%.17g, %.17g, %.17g, %.17g)' % (bounds.RAminDeg, bounds.RAmaxDeg,
+                                                bounds.DECminDeg, bounds.DECmaxDeg)
+
+
+def _bounds_membership(bounds_list, ra, dec):
+    """
+    Return a boolean array whose [i, j] element is True if the point with
+    RA ra[i] and Dec dec[i] (in degrees) is inside bounds_list[j].  All of
+    the circles are tested at once, as a matrix product of unit vectors.
+    """
+    membership = numpy.zeros((len(ra), len(bounds_list)), dtype=bool)
+    i_circles = [ii for ii, bounds in enumerate(bounds_list) if bounds.boundType == 'circle']
+    if len(i_circles) > 0:
+        circles = [bounds_list[ii] for ii in i_circles]
+        points = _unit_vectors(numpy.radians(ra), numpy.radians(dec))
+        centers = _unit_vectors(numpy.array([bounds.RA for bounds in circles]),
+                                numpy.array([bounds.DEC for bounds in circles]))
+        cos_radii = numpy.cos(numpy.array([bounds.radius for bounds in circles]))
+        membership[:, i_circles] = numpy.dot(points, centers.T) > cos_radii
+
+    for ii, bounds in enumerate(bounds_list):
+        if bounds.boundType != 'circle':
+            membership[:, ii] = _in_bounds(bounds, ra, dec)
+    return membership
+
+
+def _in_bounds(bounds, ra, dec):
+    """
+    Return a boolean mask selecting the points with RA ra and Dec dec
+    (numpy arrays in degrees) which are inside bounds (a circle or box),
+    making the same test as bounds.to_SQL
+    """
+    if bounds.boundType == 'circle':
+        ra = numpy.radians(ra)
+        dec = numpy.radians(dec)
+        haversine = numpy.sin(0.5*(dec - bounds.DEC))**2 + \
+                    numpy.cos(dec)*numpy.cos(bounds.DEC)*numpy.sin(0.5*(ra - bounds.RA))**2
+        return 2.0*numpy.arcsin(numpy.sqrt(numpy.minimum(haversine, 1.0))) < bounds.radius
+
+    in_dec = (dec >= bounds.DECminDeg) & (dec <= bounds.DECmaxDeg)
+    if bounds.RAminDeg <= bounds.RAmaxDeg:
+        return in_dec & (ra >= bounds.RAminDeg) & (ra <= bounds.RAmaxDeg)
+    return in_dec & ((ra >= bounds.RAminDeg) | (ra <= bounds.RAmaxDeg))
+
 #------------------------------------------------------------
 # Iterator for database chunks
 
+def _as_statement(query):
+    """
+    Return query (a string, ORM query or sqlalchemy expression) as
+    an executable sqlalchemy expression
+    """
+    if hasattr(query, '__clause_element__'):
+        return query.__clause_element__()
+    if isinstance(query, expression.ClauseElement):
+        return query
+    return text(query)
+
+
+# Placed on the prefetch queue by the background thread once the query
+# is exhausted
+_END_OF_QUERY = object()
+
+
+class _PrefetchError(object):
+    """Wraps an exception raised in the prefetching thread"""
+    def __init__(self, error):
+        self.error = error
+
+
+def _prefetch_chunks(iterator_ref, connection, chunk_queue, stop_event):
+    """
+    Target of the thread that prefetches chunks for a ChunkIterator.
+
+    @param [in] iterator_ref is a weakref to the ChunkIterator.  Only a weak
+    reference is held between chunks so that an iterator which is abandoned
+    before it is exhausted can be garbage collected, which stops this thread.
+
+    @param [in] connection is the DBConnection of the iterator's dbobj.
+    Because DBConnection.session is a scoped_session, the query is executed
+    on a session (and database connection) belonging to this thread.
+
+    @param [in] chunk_queue is the bounded queue.Queue onto which
+    postprocessed chunks are put
+
+    @param [in] stop_event is a threading.Event set when the consumer
+    closes the iterator
+    """
+
+    def put(item):
+        # Block on the full queue, but give up if the consumer goes away.
+        while not stop_event.is_set() and iterator_ref() is not None:
+            try:
+                chunk_queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    try:
+        chunk_iter = iterator_ref()
+        if chunk_iter is not None:
+            chunk_iter._execute()
+        del chunk_iter
+
+        while not stop_event.is_set():
+            chunk_iter = iterator_ref()
+            if chunk_iter is None:
+                break
+            try:
+                item = chunk_iter._next_chunk()
+            except StopIteration:
+                item = _END_OF_QUERY
+            del chunk_iter
+            if not put(item) or item is _END_OF_QUERY:
+                break
+    except BaseException as error:
+        put(_PrefetchError(error))
+    finally:
+        chunk_iter = iterator_ref()
+        if chunk_iter is not None:
+            chunk_iter._close_query()
+        del chunk_iter
+        connection.session.remove()
+
+
 class ChunkIterator(object):
     """Iterator for query chunks"""
-    def __init__(self, dbobj, query, chunk_size, arbitrarySQL = False):
+    def __init__(self, dbobj, query, chunk_size, arbitrarySQL = False, columnar = True,
+                 prefetch = 0, stream = False, limit = None, layout = 'records',
+                 memory_budget = None, row_nbytes = None, exact_bounds = None,
+                 postprocess = True):
+        """
+        @param [in] dbobj is the DBObject being queried
+
+        @param [in] query is the query to execute
+
+        @param [in] chunk_size is the number of rows returned per chunk
+        (None returns all of the rows in a single chunk)
+
+        @param [in] arbitrarySQL is True if the chunks should be postprocessed
+        as the results of an arbitrary query (see get_arbitrary_chunk_iterator)
+
+        @param [in] columnar is True if rows should be read directly from the
+        DBAPI cursor and converted into a recarray column-by-column
+
+        @param [in] prefetch is the number of chunks to fetch and postprocess
+        ahead of the consumer in a background thread, so that database latency
+        overlaps with whatever the consumer does with each chunk (default 0,
+        i.e. no background thread).  When prefetch > 0 the query is executed
+        on the background thread's own session; errors raised there are
+        re-raised by next().  Call close() to stop iterating early.
+        Engines which give each thread its own connection (e.g. in-memory
+        sqlite databases, where another thread would see an empty database)
+        ignore prefetch.
+
+        @param [in] stream is True if the query should be streamed so that
+        memory usage is bounded by chunk_size rather than by the size of the
+        whole result set (only used if chunk_size is not None).  Dialects
+        which support server-side cursors execute the query with
+        stream_results.  Otherwise, if dbobj provides a keyset column (see
+        CatalogDBObject._get_keyset_column) and query is an ORM query, the
+        results are paginated on that column: each chunk is a separate query
+        for the next chunk_size rows ordered by it.  The keyset column must
+        be unique and must be the first column of the query.
+
+        @param [in] limit is the maximum number of rows to return.  It is
+        applied to query here (rather than by the caller) so that a streamed
+        query can be paginated.
+
+        @param [in] layout is 'records' if chunks should be numpy.recarrays
+        or 'columns' if they should be ColumnChunks of contiguous per-column
+        arrays.  With 'columns', dbobj._final_pass is passed a ColumnChunk.
+
+        @param [in] memory_budget is the number of bytes of memory the chunks
+        should take up.  If specified, chunk_size must be None; the number of
+        rows per chunk is then chosen to fit the budget (counting chunks held
+        in the prefetch queue) and is adjusted as the consumer reports its own
+        memory use per row through set_row_overhead.
+
+        @param [in] row_nbytes is the number of bytes taken up by each row
+        of query results (i.e. the itemsize of their dtype); required
+        if memory_budget is specified.
+
+        @param [in] exact_bounds is the bounds (a circle or box) to which
+        each chunk is cut, in numpy, before it is postprocessed, if query
+        was only filtered by a bounding box (see
+        CatalogDBObject._filter_bounding_box).  Chunks may then have fewer
+        than chunk_size rows, and may be empty.
+
+        @param [in] postprocess is False if chunks should be returned as they
+        are read from the database, without being passed to dbobj's
+        _postprocess_results (and so to its _final_pass)
+        """
+        if layout not in ('records', 'columns'):
+            raise ValueError("layout must be 'records' or 'columns'; you gave %s" % layout)
+
+        if memory_budget is not None:
+            if chunk_size is not None:
+                raise ValueError("Cannot specify both chunk_size and memory_budget")
+            if row_nbytes is None:
+                raise ValueError("Must specify row_nbytes along with memory_budget")
+
+        if isinstance(dbobj.connection.engine.pool, SingletonThreadPool):
+            prefetch = 0
+
         self.dbobj = dbobj
-        self.exec_query = dbobj.connection.session.execute(query)
+        self.prefetch = prefetch
+        self.memory_budget = memory_budget
+        self._row_nbytes = row_nbytes
+        self._row_overhead = 0
+        if memory_budget is not None:
+            chunk_size = self._budget_chunk_size()
         self.chunk_size = chunk_size
 
         #arbitrarySQL exists in case a CatalogDBObject calls
@@ -84,26 +816,396 @@ class ChunkIterator(object):
         #rather than _postprocess_results
         self.arbitrarySQL = arbitrarySQL
 
+        self._query = query
+        self._use_columnar = columnar
+        self.layout = layout
+        self._exact_bounds = exact_bounds
+        self._postprocess = postprocess
+        self.exec_query = None
+
+        self.stream = stream and chunk_size is not None
+        self._limit = limit
+        self._keyset_column = None
+        self._keyset_query = None
+        if self.stream and \
+           not dbobj.connection.engine.dialect.supports_server_side_cursors and \
+           hasattr(query, 'filter'):
+
+            self._keyset_column = dbobj._get_keyset_column()
+
+        if self._keyset_column is not None:
+            self._keyset_query = query
+        elif limit is not None:
+            self._query = query.limit(limit)
+
+        #If columnar is True, rows are read directly from the DBAPI cursor
+        #and converted into a recarray column-by-column, bypassing the
+        #per-row objects sqlalchemy would otherwise build.  If the dtype
+        #of the results is not known ahead of time (i.e. an arbitrary query
+        #for which no dtype was specified), it is derived from the cursor
+        #description and the first rows returned (see DBObject).
+        self._dtype = None
+        self._default_values = None
+        self._description = None
+        self.columnar = False
+
+        self._prefetch_queue = None
+        self._prefetch_thread = None
+        self._prefetch_stop = None
+        self._exhausted = False
+
+        if prefetch > 0:
+            self._prefetch_queue = queue.Queue(maxsize=prefetch)
+            self._prefetch_stop = threading.Event()
+            self._prefetch_thread = threading.Thread(target=_prefetch_chunks,
+                                                     args=(weakref.ref(self),
+                                                           dbobj.connection,
+                                                           self._prefetch_queue,
+                                                           self._prefetch_stop))
+            self._prefetch_thread.daemon = True
+            self._prefetch_thread.start()
+        else:
+            self._execute()
+
+    def _execute(self):
+        """
+        Execute the query on the current thread's session
+        """
+        if self._keyset_column is not None:
+            self._execute_keyset_page(None)
+        elif self.stream:
+            self.exec_query = self.dbobj.connection.session.execute(
+                _as_statement(self._query).execution_options(stream_results=True))
+        else:
+            self.exec_query = self.dbobj.connection.session.execute(self._query)
+
+        if self._use_columnar and type(self.exec_query) is ResultProxy and \
+           self.exec_query.cursor is not None:
+
+            self.columnar = True
+            self._description = self.exec_query.cursor.description
+            colnames = [str_cast(name) for name in self.exec_query.keys()]
+            if self.arbitrarySQL:
+                self._dtype = self.dbobj._get_arbitrary_results_dtype(colnames)
+            else:
+                self._dtype = self.dbobj._get_results_dtype(colnames)
+                self._default_values = self.dbobj._get_results_default_values(colnames)
+
     def __iter__(self):
         return self
 
     def __next__(self):
+        if self._prefetch_queue is None:
+            return self._next_chunk()
+
+        if self._exhausted:
+            raise StopIteration
+
+        item = self._prefetch_queue.get()
+        if item is _END_OF_QUERY:
+            self.close()
+            raise StopIteration
+        if isinstance(item, _PrefetchError):
+            self.close()
+            raise item.error
+        return item
+
+    def _next_chunk(self):
+        """
+        Fetch and postprocess the next chunk of the query
+        """
         if self.chunk_size is None and not self.exec_query.closed:
-            chunk = self.exec_query.fetchall()
+            chunk = self._fetch(None)
             return self._postprocess_results(chunk)
         elif self.chunk_size is not None:
-            chunk = self.exec_query.fetchmany(self.chunk_size)
+            chunk = self._fetch(self.chunk_size)
             return self._postprocess_results(chunk)
         else:
             raise StopIteration
 
+    def _budget_chunk_size(self):
+        """
+        Return the number of rows per chunk that fits self.memory_budget
+        """
+        nbytes_per_row = self._row_nbytes*(1 + self.prefetch) + self._row_overhead
+        return max(1, int(self.memory_budget//max(nbytes_per_row, 1)))
+
+    def set_row_overhead(self, nbytes):
+        """
+        Tell the iterator that the consumer uses nbytes of memory per row of
+        each chunk, on top of the query results themselves (e.g. the columns
+        calculated by an InstanceCatalog's getters).  If the iterator has a
+        memory_budget, subsequent chunks are resized to keep within it.  The
+        largest overhead reported is used.
+        """
+        if nbytes <= self._row_overhead:
+            return
+        self._row_overhead = nbytes
+        if self.memory_budget is not None:
+            self.chunk_size = self._budget_chunk_size()
+
+    def close(self):
+        """
+        Stop iterating, shutting down the prefetching thread (if any) and
+        releasing the query results.  Further calls to next() raise
+        StopIteration.
+        """
+        if self._prefetch_thread is not None:
+            self._exhausted = True
+            self._prefetch_stop.set()
+            # empty the queue so that a thread blocked on it can exit
+            while self._prefetch_thread.is_alive():
+                try:
+                    while True:
+                        self._prefetch_queue.get_nowait()
+                except queue.Empty:
+                    pass
+                self._prefetch_thread.join(0.1)
+            self._prefetch_thread = None
+            return
+
+        self._close_query()
+
+    def _close_query(self):
+        if self.exec_query is not None and not self.exec_query.closed:
+            self.exec_query.close()
+
+    def _execute_keyset_page(self, last_key):
+        """
+        Execute the query for the chunk of rows following the row whose
+        keyset column has the value last_key (the first chunk if None)
+        """
+        page_size = self.chunk_size
+        if self._limit is not None:
+            page_size = min(page_size, self._limit)
+            self._limit -= page_size
+
+        page = self._keyset_query
+        if last_key is not None:
+            page = page.filter(self._keyset_column > last_key)
+        page = page.order_by(self._keyset_column).limit(page_size)
+        self.exec_query = self.dbobj.connection.session.execute(page)
+        self._page_size = page_size
+
+    def _next_keyset_page(self, rows):
+        """
+        Having read rows from the current keyset page, execute the query
+        for the next page if there may be one
+        """
+        if not self.exec_query.closed:
+            self.exec_query.close()
+        if len(rows) == self._page_size and (self._limit is None or self._limit > 0):
+            self._execute_keyset_page(rows[-1][0])
+
+    def _fetch(self, n_rows):
+        """
+        Fetch n_rows from the query (all remaining rows if n_rows is None)
+        """
+        if not self.columnar:
+            if self.exec_query.closed:
+                return []
+            if n_rows is None:
+                rows = self.exec_query.fetchall()
+            else:
+                rows = self.exec_query.fetchmany(n_rows)
+            if self._keyset_column is not None:
+                self._next_keyset_page(rows)
+            return rows
+
+        if self.exec_query.closed:
+            return []
+
+        cursor = self.exec_query.cursor
+        if n_rows is None:
+            rows = cursor.fetchall()
+        else:
+            rows = cursor.fetchmany(n_rows)
+
+        # Because we read from the DBAPI cursor directly, sqlalchemy does
+        # not know when the results are exhausted.  Close them ourselves.
+        if self._keyset_column is not None:
+            self._next_keyset_page(rows)
+        elif n_rows is None or len(rows) < n_rows:
+            self.exec_query.close()
+
+        if len(rows) == 0:
+            return rows
+
+        if self._dtype is None:
+            return self.dbobj._arbitrary_rows_to_recarray(rows, self._description, self._query)
+
+        if self.layout == 'columns':
+            return ColumnChunk(zip(self._dtype.names,
+                                   _rows_to_columns(rows, self._dtype,
+                                                    default_values=self._default_values)))
+
+        return _rows_to_recarray(rows, self._dtype, default_values=self._default_values)
+
     def _postprocess_results(self, chunk):
         if len(chunk)==0:
             raise StopIteration
-        if self.arbitrarySQL:
-            return self.dbobj._postprocess_arbitrary_results(chunk)
+        if self._exact_bounds is not None:
+            chunk = self.dbobj._apply_exact_bounds(chunk, self._exact_bounds)
+        if self._postprocess:
+            if self.arbitrarySQL:
+                chunk = self.dbobj._postprocess_arbitrary_results(chunk)
+            else:
+                chunk = self.dbobj._postprocess_results(chunk)
+        if self.layout == 'columns' and not isinstance(chunk, ColumnChunk):
+            chunk = ColumnChunk.from_recarray(chunk)
+        return chunk
+
+
+def _query_partitions(iterator_ref, dbobj, chunk_size, layout, tasks,
+                      partition_queues, stop_event):
+    """
+    Target of the threads that execute the partitions of a
+    PartitionedChunkIterator.
+
+    Each thread takes (index, query) tasks from the queue tasks until it is
+    empty, and puts (index, chunk) for each chunk of the query onto
+    partition_queues[index], followed by (index, _END_OF_QUERY).  Errors are
+    put onto the queue as (index, _PrefetchError).  As in _prefetch_chunks,
+    only a weak reference to the PartitionedChunkIterator is held, and the
+    queries are executed on this thread's own session.
+    """
+
+    def put(i_partition, item):
+        while not stop_event.is_set() and iterator_ref() is not None:
+            try:
+                partition_queues[i_partition].put((i_partition, item), timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    try:
+        while not stop_event.is_set():
+            try:
+                i_partition, query = tasks.get_nowait()
+            except queue.Empty:
+                break
+
+            try:
+                for chunk in ChunkIterator(dbobj, query, chunk_size, layout=layout):
+                    if not put(i_partition, chunk):
+                        return
+            except BaseException as error:
+                put(i_partition, _PrefetchError(error))
+                return
+
+            put(i_partition, _END_OF_QUERY)
+    finally:
+        dbobj.connection.session.remove()
+
+
+class PartitionedChunkIterator(object):
+    """
+    Iterator over the chunks of several queries (usually disjoint partitions
+    of one query; see CatalogDBObject.query_columns_partitioned) which are
+    executed concurrently
+    """
+    def __init__(self, dbobj, queries, chunk_size, n_workers=None, ordered=True,
+                 queue_depth=2, layout='records'):
+        """
+        @param [in] dbobj is the DBObject being queried
+
+        @param [in] queries is a list of the queries to execute
+
+        @param [in] chunk_size is the number of rows returned per chunk
+        (None returns all of the rows of each query in a single chunk)
+
+        @param [in] n_workers is the number of threads (each with its own
+        database connection) executing queries at once (default: one per query)
+
+        @param [in] ordered is True if all of the chunks of queries[0] should be
+        returned before those of queries[1], etc.  Otherwise chunks are returned
+        in the order in which they are fetched.
+
+        @param [in] queue_depth is the number of chunks of each query (if ordered)
+        or of each thread (if not) which can be fetched ahead of the consumer
+
+        @param [in] layout is 'records' or 'columns' (see ChunkIterator)
+
+        Engines which give each thread its own connection (e.g. in-memory sqlite
+        databases) execute the queries one after the other in the calling thread.
+        """
+        self.dbobj = dbobj
+        self.ordered = ordered
+        self._n_remaining = len(queries)
+        self._i_current = 0
+        self._exhausted = len(queries) == 0
+        self._serial_chunks = None
+        self._workers = []
+        self._stop = threading.Event()
+
+        if n_workers is None:
+            n_workers = len(queries)
+        n_workers = min(n_workers, len(queries))
+
+        if isinstance(dbobj.connection.engine.pool, SingletonThreadPool) or n_workers < 1:
+            self._serial_chunks = itertools.chain.from_iterable(
+                ChunkIterator(dbobj, query, chunk_size, layout=layout) for query in queries)
+            return
+
+        tasks = queue.Queue()
+        for i_partition, query in enumerate(queries):
+            tasks.put((i_partition, query))
+
+        if ordered:
+            self._queues = [queue.Queue(maxsize=queue_depth) for query in queries]
         else:
-            return self.dbobj._postprocess_results(chunk)
+            self._queues = [queue.Queue(maxsize=queue_depth*n_workers)]*len(queries)
+
+        for i_worker in range(n_workers):
+            worker = threading.Thread(target=_query_partitions,
+                                      args=(weakref.ref(self), dbobj, chunk_size, layout,
+                                            tasks, self._queues, self._stop))
+            worker.daemon = True
+            worker.start()
+            self._workers.append(worker)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self._serial_chunks is not None and not self._exhausted:
+            return next(self._serial_chunks)
+
+        while not self._exhausted:
+            i_partition, item = self._queues[self._i_current].get()
+            if item is _END_OF_QUERY:
+                self._n_remaining -= 1
+                if self.ordered:
+                    self._i_current += 1
+                if self._n_remaining == 0:
+                    self.close()
+                continue
+            if isinstance(item, _PrefetchError):
+                self.close()
+                raise item.error
+            return item
+
+        raise StopIteration
+
+    def close(self):
+        """
+        Stop iterating, shutting down the threads executing the queries.
+        Further calls to next() raise StopIteration.
+        """
+        self._exhausted = True
+        self._stop.set()
+        for worker in self._workers:
+            # empty the queues so that a thread blocked on them can exit
+            while worker.is_alive():
+                for partition_queue in self._queues:
+                    try:
+                        while True:
+                            partition_queue.get_nowait()
+                    except queue.Empty:
+                        pass
+                worker.join(0.1)
+        self._workers = []
 
 
 class DBConnection(object):
@@ -113,7 +1215,9 @@ class DBConnection(object):
     sqlalchemy connection, when appropriate.
     """
 
-    def __init__(self, database=None, driver=None, host=None, port=None, verbose=False):
+    def __init__(self, database=None, driver=None, host=None, port=None, verbose=False,
+                 pool_size=None, max_overflow=None, pool_recycle=None, pool_pre_ping=False,
+                 lazy=False, read_only=False, sqlite_profile=None):
         """
         @param [in] database is the name of the database file being connected to
 
@@ -124,6 +1228,43 @@ class DBConnection(object):
         @param [in] port is the port on the remote host to connect to, if appropriate
 
         @param [in] verbose is a boolean controlling sqlalchemy's verbosity
+
+        @param [in] pool_size is the number of connections the engine keeps
+        open (default None: sqlalchemy's default for the dialect).  Only
+        dialects which pool connections (i.e. not sqlite) accept it.
+
+        @param [in] max_overflow is the number of connections the engine
+        may open beyond pool_size (default None: sqlalchemy's default).
+        Only dialects which pool connections accept it.
+
+        @param [in] pool_recycle is the number of seconds after which a
+        pooled connection is replaced by a new one, e.g. to stay within a
+        server's idle timeout (default None: never)
+
+        @param [in] pool_pre_ping is True if pooled connections should be
+        tested (and replaced if they have gone stale) each time they are
+        checked out
+
+        @param [in] lazy is True if the engine, session and metadata should
+        only be created the first time one of them is used, rather than now
+        (so that objects which never query the database cost nothing to
+        create).  The connection parameters are validated either way.
+
+        @param [in] read_only is True if the database should be opened
+        read-only (only sqlite database files can be)
+
+        @param [in] sqlite_profile is the name of the profile (see
+        db.utils.SQLITE_PROFILES: 'bulk_load', 'read', 'immutable' or 'wal')
+        with whose URI parameters a sqlite database file is opened, and whose
+        pragmas are set on each of its connections (default None: sqlite's
+        defaults)
+
+        A DBConnection may be used in processes forked from the one which
+        created it (e.g. by multiprocessing): the first time a forked process
+        uses it, it gets its own session, and the connections pooled by the
+        parent are replaced by new ones (without closing the parent's).
+        In-memory sqlite databases are the exception, since the forked process's
+        copy of the database is only reachable through the parent's connection.
         """
 
         self._database = database
@@ -131,9 +1272,17 @@ class DBConnection(object):
         self._host = host
         self._port = port
         self._verbose = verbose
+        self._pool_size = pool_size
+        self._max_overflow = max_overflow
+        self._pool_recycle = pool_recycle
+        self._pool_pre_ping = pool_pre_ping
+        self._read_only = read_only
+        self._sqlite_profile = sqlite_profile
+        self._engine = None
 
         self._validate_conn_params()
-        self._connect_to_engine()
+        if not lazy:
+            self._connect_to_engine()
 
     def __del__(self):
         try:
@@ -155,6 +1304,9 @@ class DBConnection(object):
 
         #DbAuth will not look up hosts that are None, '' or 0
         if self._host:
+            from lsst.daf.butler.registry import DbAuth
+            from lsst.utils import getPackageDir
+
             # This is triggered when you need to connect to a remote database.
             # Use 'HOME' as the default location (backwards compatibility) but fail graciously
             authdir = os.getenv('HOME')
@@ -174,20 +1326,70 @@ class DBConnection(object):
                             database=self._database,
                             username=username,
                             password=password)
+        elif self._sqlite_uri_params():
+            dbUrl = url.URL(self._driver,
+                            database='file:%s?%s' % (quote(os.path.abspath(self._database)),
+                                                     urlencode(sorted(self._sqlite_uri_params().items()))),
+                            query={'uri': 'true'})
         else:
             dbUrl = url.URL(self._driver,
                             database=self._database)
 
 
-        self._engine = create_engine(dbUrl, echo=self._verbose)
+        engine_kwargs = {}
+        for name, value in (('pool_size', self._pool_size),
+                            ('max_overflow', self._max_overflow),
+                            ('pool_recycle', self._pool_recycle)):
+            if value is not None:
+                engine_kwargs[name] = value
+        if self._pool_pre_ping:
+            engine_kwargs['pool_pre_ping'] = True
 
-        if self._engine.dialect.name == 'sqlite':
-            event.listen(self._engine, 'checkout', declareTrigFunctions)
+        self._engine = create_engine(dbUrl, echo=self._verbose, **engine_kwargs)
 
-        self._session = scoped_session(sessionmaker(autoflush=True,
-                                                    bind=self._engine))
+        if self._engine.dialect.name == 'sqlite':
+            pragmas = []
+            if self._sqlite_profile is not None:
+                pragmas = get_sqlite_profile(self._sqlite_profile)['pragmas']
+            event.listen(self._engine, 'connect', _sqlite_connect_listener(pragmas))
+
+        # Connections to an in-memory sqlite database are not shared with
+        # the database server, so a forked process can keep using them.
+        self._fork_safe = not isinstance(self._engine.pool, SingletonThreadPool)
+        if self._fork_safe:
+            event.listen(self._engine, 'connect', _record_connection_pid)
+            event.listen(self._engine, 'checkout', _check_connection_pid)
+
+        self._pid = os.getpid()
+        self._inherited_sessions = []
+        self._session = self._new_session()
         self._metadata = MetaData(bind=self._engine)
 
+    def _new_session(self):
+        """
+        Return a new (thread-local) scoped_session bound to the engine
+        """
+        from sqlalchemy.orm import scoped_session, sessionmaker
+        return scoped_session(sessionmaker(autoflush=True, bind=self._engine))
+
+    def _check_pid(self):
+        """
+        Create the engine if this DBConnection is lazy and has not been used
+        yet.  If this process was forked from the one which last used this
+        DBConnection, give it a session of its own.
+        """
+        if self._engine is None:
+            self._connect_to_engine()
+            return
+        if self._pid == os.getpid() or not self._fork_safe:
+            return
+        # The parent's sessions may hold connections checked out of the pool.
+        # Keep them referenced (but unused) so that they are never finalized
+        # here, which would roll back the parent's transactions.
+        self._inherited_sessions.append(self._session)
+        self._session = self._new_session()
+        self._pid = os.getpid()
+
 
     def _validate_conn_params(self):
         """Validate connection parameters
@@ -232,6 +1434,28 @@ class DBConnection(object):
             self._host = None
             self._port = None
 
+        if self._sqlite_profile is not None:
+            if 'sqlite' not in self._driver:
+                raise ValueError("sqlite_profile can only be used with sqlite databases; "
+                                 "you gave %s" % self._driver)
+            get_sqlite_profile(self._sqlite_profile)
+
+        if self._sqlite_uri_params() and ('sqlite' not in self._driver or self._database == ':memory:'):
+            raise ValueError("Only sqlite database files can be opened read-only or with URI "
+                             "parameters; you gave %s database %s" % (self._driver, self._database))
+
+    def _sqlite_uri_params(self):
+        """
+        Return the dict of the URI parameters with which
+        to open a sqlite database file
+        """
+        params = {}
+        if self._sqlite_profile is not None:
+            params.update(get_sqlite_profile(self._sqlite_profile)['uri'])
+        if self._read_only:
+            params['mode'] = 'ro'
+        return params
+
 
     def __eq__(self, other):
         return (str(self._database) == str(other._database)) and \
@@ -242,15 +1466,18 @@ class DBConnection(object):
 
     @property
     def engine(self):
+        self._check_pid()
         return self._engine
 
     @property
     def session(self):
+        self._check_pid()
         return self._session
 
 
     @property
     def metadata(self):
+        self._check_pid()
         return self._metadata
 
     @property
@@ -273,11 +1500,113 @@ class DBConnection(object):
     def verbose(self):
         return self._verbose
 
+    @property
+    def connected(self):
+        """
+        True if the engine has been created (always, unless this
+        DBConnection is lazy and has not been used yet)
+        """
+        return self._engine is not None
+
+    @property
+    def pool_size(self):
+        return self._pool_size
+
+    @property
+    def max_overflow(self):
+        return self._max_overflow
+
+    @property
+    def pool_recycle(self):
+        return self._pool_recycle
+
+    @property
+    def pool_pre_ping(self):
+        return self._pool_pre_ping
+
+    @property
+    def read_only(self):
+        return self._read_only
+
+    @property
+    def sqlite_profile(self):
+        return self._sqlite_profile
+
+    def dispose(self):
+        """
+        Close the connections pooled by the engine.  The engine remains
+        usable (it opens new connections as needed).  Does nothing to an
+        in-memory sqlite database (whose contents would be lost) or to a
+        DBConnection inherited from a parent process (whose connections
+        belong to the parent).
+        """
+        if self._engine is not None and self._fork_safe and self._pid == os.getpid():
+            self._engine.dispose()
+
+
+class _ConnectionCache(OrderedDict):
+    """
+    A dict of DBConnections, keyed on their connection parameters, which
+    holds at most max_size connections.  When it is full, the least
+    recently used connection is removed (and its pooled connections
+    closed) to make room for a new one.
+    """
+
+    def __init__(self, max_size=None):
+        """
+        @param [in] max_size is the maximum number of connections to hold
+        (None for no maximum)
+        """
+        super(_ConnectionCache, self).__init__()
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._registered = False
+
+    def get_connection(self, key):
+        """
+        Return the DBConnection stored under key (marking it as the most
+        recently used), or None
+        """
+        conn = self.get(key)
+        if conn is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        del self[key]
+        self[key] = conn
+        return conn
+
+    def add_connection(self, key, conn):
+        """
+        Store the DBConnection conn under key, evicting the least recently
+        used connections if the cache is full
+        """
+        if not self._registered:
+            # registered here, rather than when the module is imported,
+            # so that importing it does not import lsst.sims.utils
+            from lsst.sims.utils.CodeUtilities import sims_clean_up
+            sims_clean_up.targets.append(self)
+            self._registered = True
+        self[key] = conn
+        self.evict()
+
+    def evict(self):
+        """
+        Remove the least recently used connections until no more than
+        max_size remain
+        """
+        if self.max_size is None:
+            return
+        while len(self) > self.max_size:
+            key, conn = self.popitem(last=False)
+            conn.dispose()
+
 
 class DBObject(object):
 
     def __init__(self, database=None, driver=None, host=None, port=None, verbose=False,
-                 connection=None, cache_connection=True):
+                 connection=None, cache_connection=True, lazy=False):
         """
         Initialize DBObject.
 
@@ -297,6 +1626,9 @@ class DBObject(object):
 
         @param [in] cache_connection is a boolean.  If True, DBObject will use a cache of
         DBConnections (if available) to get the connection to this database.
+
+        @param [in] lazy is a boolean.  If True, the connection to the database is
+        only made when it is first used (see DBConnection).
         """
 
         self.dtype = None
@@ -315,7 +1647,7 @@ class DBObject(object):
                     setattr(self, key, value)
 
             self.connection = self._get_connection(self.database, self.driver, self.host, self.port,
-                                                   use_cache=cache_connection)
+                                                   use_cache=cache_connection, lazy=lazy)
 
         else:
             self.connection = connection
@@ -325,13 +1657,18 @@ class DBObject(object):
             self.port = connection.port
             self.verbose = connection.verbose
 
-    def _get_connection(self, database, driver, host, port, use_cache=True):
+    def _get_connection(self, database, driver, host, port, use_cache=True, lazy=False):
         """
         Search self._connection_cache (if it exists; it won't for DBObject, but
         will for CatalogDBObject) for a DBConnection matching the specified
         parameters.  If it exists, return it.  If not, open a connection to
         the specified database, add it to the cache, and return the connection.
 
+        The cache is keyed on the process ID as well as on the connection
+        parameters, so that a forked process opens its own connections rather
+        than reusing its parent's (though those are also safe to use; see
+        DBConnection).
+
         Parameters
         ----------
         database is the name of the database file being connected to
@@ -345,20 +1682,22 @@ class DBObject(object):
         use_cache is a boolean specifying whether or not we try to use the
         cache of database connections (you don't want to if opening many
         connections in many threads).
+
+        lazy is a boolean specifying whether a new connection should defer
+        creating its engine until it is first used
         """
 
-        if use_cache and hasattr(self, '_connection_cache'):
-            for conn in self._connection_cache:
-                if str(conn.database) == str(database):
-                    if str(conn.driver) == str(driver):
-                        if str(conn.host) == str(host):
-                            if str(conn.port) == str(port):
-                                return conn
+        use_cache = use_cache and hasattr(self, '_connection_cache')
+        if use_cache:
+            cache_key = (os.getpid(), str(database), str(driver), str(host), str(port))
+            conn = self._connection_cache.get_connection(cache_key)
+            if conn is not None:
+                return conn
 
-        conn = DBConnection(database=database, driver=driver, host=host, port=port)
+        conn = DBConnection(database=database, driver=driver, host=host, port=port, lazy=lazy)
 
-        if use_cache and hasattr(self, '_connection_cache'):
-            self._connection_cache.append(conn)
+        if use_cache:
+            self._connection_cache.add_connection(cache_key, conn)
 
         return conn
 
@@ -405,49 +1744,8 @@ class DBObject(object):
             Determine the dtype from the data.
             Store it in a global variable so we do not have to repeat on every chunk.
             """
-            dataString = ''
-
-            # We are going to detect the dtype by reading in a single row
-            # of data with np.genfromtxt.  To do this, we must pass the
-            # row as a string delimited by a specified character.  Here we
-            # select a character that does not occur anywhere in the data.
-            delimit_char_list = [',', ';', '|', ':', '/', '\\']
-            delimit_char = None
-            for cc in delimit_char_list:
-                is_valid = True
-                for xx in results[0]:
-                    if cc in str(xx):
-                        is_valid = False
-                        break
-
-                if is_valid:
-                    delimit_char = cc
-                    break
-
-            if delimit_char is None:
-                raise RuntimeError("DBObject could not detect the dtype of your return rows\n"
-                                   "Please specify a dtype with the 'dtype' kwarg.")
-
-            for xx in results[0]:
-                if dataString != '':
-                    dataString += delimit_char
-                dataString += str(xx)
             names = [str_cast(ww) for ww in results[0].keys()]
-            dataArr = numpy.genfromtxt(BytesIO(dataString.encode()), dtype=None,
-                                       names=names, delimiter=delimit_char,
-                                       encoding='utf-8')
-            dt_list = []
-            for name in dataArr.dtype.names:
-                type_name = str(dataArr.dtype[name])
-                sub_list = [name]
-                if type_name.startswith('S') or type_name.startswith('|S'):
-                    sub_list.append(str_cast)
-                    sub_list.append(int(type_name.replace('S','').replace('|','')))
-                else:
-                    sub_list.append(dataArr.dtype[name])
-                dt_list.append(tuple(sub_list))
-
-            self.dtype = numpy.dtype(dt_list)
+            self.dtype = _derive_results_dtype(results, names)
 
         if len(results) == 0:
             return numpy.recarray((0,), dtype = self.dtype)
@@ -455,6 +1753,78 @@ class DBObject(object):
         retresults = numpy.rec.fromrecords([tuple(xx) for xx in results],dtype = self.dtype)
         return retresults
 
+    def _arbitrary_rows_to_recarray(self, rows, description, query):
+        """
+        Convert the rows returned by an arbitrary query (for which the user
+        did not specify a dtype) into a recarray.
+
+        The dtype is derived from the cursor description and the values
+        returned, and is cached on the text of the query, so that it is
+        only derived once per query.  If later rows contain longer strings
+        than those seen so far, the string fields are widened (never
+        narrowed) so that no values are truncated.
+
+        Parameters
+        ----------
+        rows is a list of rows as returned by the DBAPI cursor
+
+        description is the DBAPI cursor.description of the query
+
+        query is the query that produced the rows
+
+        Returns
+        -------
+        A numpy recarray
+        """
+        if not hasattr(self, '_arbitrary_dtype_cache'):
+            self._arbitrary_dtype_cache = {}
+
+        query_key = str(query)
+        if query_key in self._arbitrary_dtype_cache:
+            dtype = _widen_string_fields(rows, self._arbitrary_dtype_cache[query_key])
+        else:
+            dtype = _derive_results_dtype(rows, [dd[0] for dd in description],
+                                          type_codes=[dd[1] for dd in description],
+                                          dbapi=self.connection.engine.dialect.dbapi)
+        self._arbitrary_dtype_cache[query_key] = dtype
+
+        return _rows_to_recarray(rows, dtype)
+
+    def _get_arbitrary_results_dtype(self, colnames):
+        """
+        Return the numpy dtype of the rows returned by an arbitrary query
+        with the columns colnames, or None if the dtype can only be
+        determined by inspecting the rows themselves.
+        """
+        if self.dtype is None:
+            return None
+        dtype = numpy.dtype(self.dtype)
+        if len(dtype) != len(colnames):
+            return None
+        return dtype
+
+    def _get_results_dtype(self, colnames):
+        """
+        This wrapper exists so that a ChunkIterator built from a DBObject
+        can have the same API as a ChunkIterator built from a CatalogDBObject
+        """
+        return self._get_arbitrary_results_dtype(colnames)
+
+    def _get_results_default_values(self, colnames):
+        """
+        DBObjects do not substitute default values for NULLs.  This method
+        exists so that a ChunkIterator built from a DBObject can have the
+        same API as a ChunkIterator built from a CatalogDBObject
+        """
+        return None
+
+    def _get_keyset_column(self):
+        """
+        Return the column on which a streamed ChunkIterator can paginate
+        queries, or None.  Arbitrary queries cannot be paginated.
+        """
+        return None
+
     def _postprocess_results(self, results):
         """
         This wrapper exists so that a ChunkIterator built from a DBObject
@@ -465,7 +1835,7 @@ class DBObject(object):
 
     def _postprocess_arbitrary_results(self, results):
 
-        if not isinstance(results, numpy.recarray):
+        if not isinstance(results, (numpy.recarray, ColumnChunk)):
             retresults = self._convert_results_to_numpy_recarray_dbobj(results)
         else:
             retresults = results
@@ -494,18 +1864,27 @@ class DBObject(object):
                 raise RuntimeError("query made to DBObject execute contained %s " % badCommand)
 
         self.dtype = dtype
-        retresults = self._postprocess_arbitrary_results(self.connection.session.execute(query).fetchall())
+        chunk_iter = ChunkIterator(self, query, None, arbitrarySQL=True)
+        results = chunk_iter._fetch(None)
+        if len(results) == 0 and chunk_iter.columnar:
+            # an empty query; we can still get the dtype from the cursor
+            if chunk_iter._dtype is not None:
+                results = numpy.recarray((0,), dtype=chunk_iter._dtype)
+            else:
+                results = self._arbitrary_rows_to_recarray([], chunk_iter._description, query)
+        retresults = self._postprocess_arbitrary_results(results)
         return retresults
 
-    def get_arbitrary_chunk_iterator(self, query, chunk_size = None, dtype =None):
+    def get_arbitrary_chunk_iterator(self, query, chunk_size = None, dtype =None, prefetch = 0):
         """
         This wrapper exists so that CatalogDBObjects can refer to
         get_arbitrary_chunk_iterator and DBObjects can refer to
         get_chunk_iterator
         """
-        return self.get_chunk_iterator(query, chunk_size = chunk_size, dtype = dtype)
+        return self.get_chunk_iterator(query, chunk_size = chunk_size, dtype = dtype,
+                                       prefetch = prefetch)
 
-    def get_chunk_iterator(self, query, chunk_size = None, dtype = None):
+    def get_chunk_iterator(self, query, chunk_size = None, dtype = None, prefetch = 0):
         """
         Take an arbitrary, user-specified query and return a ChunkIterator that
         executes that query
@@ -515,9 +1894,12 @@ class DBObject(object):
 
         If 'None', then _postprocess_results will just guess the datatype
         and return generic names for the columns.
+
+        prefetch is the number of chunks to fetch ahead of the consumer
+        in a background thread (see ChunkIterator).
         """
         self.dtype = dtype
-        return ChunkIterator(self, query, chunk_size, arbitrarySQL = True)
+        return ChunkIterator(self, query, chunk_size, arbitrarySQL = True, prefetch = prefetch)
 
 class CatalogDBObjectMeta(type):
     """Meta class for registering new objects.
@@ -582,7 +1964,7 @@ class CatalogDBObjectMeta(type):
         outstr += "+++++++++++++++++++++++++++++++++++++++++++++"
         return outstr
 
-class CatalogDBObject(with_metaclass(CatalogDBObjectMeta, DBObject)):
+class CatalogDBObject(DBObject, metaclass=CatalogDBObjectMeta):
     """Database Object base class
 
     """
@@ -599,7 +1981,40 @@ class CatalogDBObject(with_metaclass(CatalogDBObjectMeta, DBObject)):
     raColName = None
     decColName = None
 
-    _connection_cache = []  # a list to store open database connections in
+    #: An optional QueryResultCache in which query_columns stores its results
+    #: and from which it replays them when the same query is repeated
+    result_cache = None
+
+    #: An optional SchemaCache from which tables are built at instantiation,
+    #: instead of being reflected from the database
+    schema_cache = None
+
+    #: How query_columns applies the bounds of obs_metadata: 'sql' to filter
+    #: on bounds.to_SQL in the database, or 'numpy' to send the database only
+    #: an RA/Dec bounding box and make the exact cut in numpy
+    spatial_filter = 'sql'
+
+    #: The names of the (x, y, z) columns holding the Cartesian unit vectors
+    #: pointing to raColName and decColName (see db.utils.addUnitVectorColumns),
+    #: or None if there are none.  If they are set, filter tests circular
+    #: bounds with a dot product of these columns rather than with bounds.to_SQL,
+    #: so that no trigonometric functions are evaluated per row.
+    unitVectorColNames = None
+
+    #: The name of the column holding the id of the HEALPix pixel (in the
+    #: nested scheme, at resolution healpixNside) containing raColName and
+    #: decColName (see db.utils.addHealpixColumn), or None if there is none.
+    #: If it is set, filter only tests bounds on the rows in the ranges of
+    #: pixel ids overlapping them, which are read from the column's index.
+    healpixColName = None
+    healpixNside = 1024
+
+    # whether tableid is a sqlite table with rowids (None until it is known;
+    # see _is_rowid_table)
+    _rowid_table = None
+
+    # a dict to store open database connections in (see set_connection_cache_size)
+    _connection_cache = _ConnectionCache(max_size=32)
 
     #Provide information if this object should be tested in the unit test
     doRunTest = False
@@ -629,7 +2044,10 @@ class CatalogDBObject(with_metaclass(CatalogDBObjectMeta, DBObject)):
 
     def __init__(self, database=None, driver=None, host=None, port=None, verbose=False,
                  table=None, objid=None, idColKey=None, connection=None,
-                 cache_connection=True):
+                 cache_connection=True, lazy=False):
+        # If lazy is True, neither the connection to the database nor the
+        # reflection of the table (and the columnMap and typeMap derived from
+        # it) happen until table, columnMap or typeMap is first used.
         if not verbose:
             with warnings.catch_warnings():
                 warnings.simplefilter("ignore", category=sa_exc.SAWarning)
@@ -674,8 +2092,27 @@ class CatalogDBObject(with_metaclass(CatalogDBObjectMeta, DBObject)):
                           "possible.")
 
         super(CatalogDBObject, self).__init__(database=database, driver=driver, host=host, port=port,
-                                              verbose=verbose, connection=connection, cache_connection=True)
+                                              verbose=verbose, connection=connection, cache_connection=True,
+                                              lazy=lazy)
+
+        if lazy:
+            self._schema_pending = True
+        else:
+            self._load_schema()
+
+    def __getattr__(self, name):
+        # Only called for attributes which are not set; those which
+        # _load_schema sets are loaded on first use by lazy objects
+        if name in ('table', 'columnMap', 'typeMap') and self.__dict__.get('_schema_pending', False):
+            self._load_schema()
+            return getattr(self, name)
+        raise AttributeError("'%s' object has no attribute '%s'" % (self.__class__.__name__, name))
 
+    def _load_schema(self):
+        """
+        Get this object's table from the database and build the column and
+        type maps, which are partly filled in from the table's columns
+        """
         try:
             self._get_table()
         except sa_exc.OperationalError as e:
@@ -696,6 +2133,41 @@ class CatalogDBObject(with_metaclass(CatalogDBObjectMeta, DBObject)):
         # build column mapping and type mapping dicts from columns
         self._make_column_map()
         self._make_type_map()
+        self._schema_pending = False
+
+    @classmethod
+    def set_connection_cache_size(cls, max_size):
+        """
+        Set the maximum number of DBConnections (None for no maximum) held
+        by the cache shared by all CatalogDBObjects.  If there are more,
+        the least recently used are removed and their pooled connections
+        closed (CatalogDBObjects still using them remain usable).
+        """
+        cls._connection_cache.max_size = max_size
+        cls._connection_cache.evict()
+
+    @classmethod
+    def connection_cache_info(cls):
+        """
+        Return a dict describing the cache of DBConnections shared by all
+        CatalogDBObjects: the number of times it has been searched for a
+        connection and found one ('hits') or not ('misses'), the number of
+        connections in it ('size') and its maximum size ('max_size')
+        """
+        return {'hits': cls._connection_cache.hits,
+                'misses': cls._connection_cache.misses,
+                'size': len(cls._connection_cache),
+                'max_size': cls._connection_cache.max_size}
+
+    @staticmethod
+    def set_async_concurrency(max_concurrency):
+        """
+        Set the maximum number of queries (from query_columns_async) and
+        catalog writes (from InstanceCatalog.write_catalog_async) in flight
+        at once on an asyncio event loop (default 8)
+        """
+        from .AsyncQuery import set_async_concurrency
+        set_async_concurrency(max_concurrency)
 
     def show_mapped_columns(self):
         for col in self.columnMap.keys():
@@ -720,8 +2192,26 @@ class CatalogDBObject(with_metaclass(CatalogDBObjectMeta, DBObject)):
         return self.objectTypeId
 
     def _get_table(self):
-        self.table = Table(self.tableid, self.connection.metadata,
-                           autoload=True)
+        if self.schema_cache is not None:
+            self.table = self.schema_cache.get_table(self.connection, self.tableid)
+        else:
+            self.table = Table(self.tableid, self.connection.metadata,
+                               autoload=True)
+
+    def refresh_schema(self):
+        """
+        Reflect this object's table from the database again (replacing its
+        snapshot in self.schema_cache, if any), e.g. after its schema has
+        changed.  Columns which were filled in from the table (see
+        generateDefaultColumnMap) are not updated; instantiate the class
+        again to pick up new ones.
+        """
+        if self.schema_cache is not None:
+            self.table = self.schema_cache.refresh(self.connection, self.tableid)
+        else:
+            self.connection.metadata.remove(self.table)
+            self._get_table()
+        self._rowid_table = None
 
     def _make_column_map(self):
         self.columnMap = OrderedDict([(el[0], el[1] if el[1] else el[0])
@@ -792,73 +2282,235 @@ class CatalogDBObject(with_metaclass(CatalogDBObjectMeta, DBObject)):
     def filter(self, query, bounds):
         """Filter the query by the associated metadata"""
         if bounds is not None:
-            on_clause = bounds.to_SQL(self.raColName,self.decColName)
+            if self.unitVectorColNames is not None and bounds.boundType == 'circle':
+                on_clause = self._cone_to_SQL(bounds)
+            else:
+                on_clause = bounds.to_SQL(self.raColName,self.decColName)
+            if self.healpixColName is not None:
+                pixel_clause = self._healpix_to_SQL(bounds)
+                if pixel_clause is not None:
+                    if self._is_rowid_table():
+                        # sqlite would rather search an index on decColName than
+                        # OR the searches of the pixel ranges, so they are
+                        # made a subquery which only that index can serve
+                        pixel_clause = '%s.rowid IN (SELECT rowid FROM %s WHERE %s)' % (self.tableid,
+                                                                                       self.tableid,
+                                                                                       pixel_clause)
+                    on_clause = '%s AND (%s)' % (pixel_clause, on_clause)
             query = query.filter(text(on_clause))
         return query
 
-    def _convert_results_to_numpy_recarray_catalogDBObj(self, results):
-        """Post-process the query results to put them
-        in a structured array.
+    def _is_rowid_table(self):
+        """
+        Return whether tableid is a sqlite table with rowids (rather than a
+        view, a WITHOUT ROWID table or a table in another database)
+        """
+        if self._rowid_table is None:
+            self._rowid_table = False
+            if self.connection is not None and self.connection.engine.dialect.name == 'sqlite':
+                rows = self.connection.engine.execute(text("SELECT type, sql FROM sqlite_master "
+                                                           "WHERE name = :name"),
+                                                      name=self.tableid).fetchall()
+                if len(rows) == 1 and rows[0][0] == 'table':
+                    self._rowid_table = re.search(r'\bWITHOUT\s+ROWID\b', rows[0][1],
+                                                  re.IGNORECASE) is None
+        return self._rowid_table
+
+    def _healpix_to_SQL(self, bounds):
+        """
+        Return the SQL constraint selecting the rows whose healpixColName is
+        in one of the ranges of the ids of the pixels which may overlap
+        bounds, or None if bounds is neither a circle nor a box
+        """
+        ranges = _healpix_ranges(bounds, self.healpixNside)
+        if ranges is None:
+            return None
+        return '(%s)' % ' OR '.join('%s BETWEEN %d AND %d' % (self.healpixColName, pixel_min, pixel_max)
+                                    for pixel_min, pixel_max in ranges)
 
-        **Parameters**
+    def _cone_to_SQL(self, bounds):
+        """
+        Return the SQL constraint selecting the rows inside the circular
+        bounds, using the columns unitVectorColNames: a row is inside if the
+        dot product of its unit vector with that of the center of the circle
+        is greater than the cosine of the radius.  This is preceded by a box
+        prefilter on z (which is indexed) and, as in bounds.to_SQL, on RA
+        (in degrees), which only compare columns to constants.
+        """
+        x_col, y_col, z_col = self.unitVectorColNames
+        center = _unit_vectors(numpy.array([bounds.RA]), numpy.array([bounds.DEC]))[0]
+        ra_ranges, dec_min, dec_max = _bounding_box(bounds)
+        clauses = ['%s BETWEEN %.17g AND %.17g' %
+                   (z_col, numpy.sin(numpy.radians(max(dec_min, -90.0))),
+                    numpy.sin(numpy.radians(min(dec_max, 90.0))))]
+        if ra_ranges is not None:
+            clauses.append('(%s)' % ' OR '.join('%s BETWEEN %.17g AND %.17g' % (self.raColName, ra_min, ra_max)
+                                                for ra_min, ra_max in ra_ranges))
+        clauses.append('%s*%.17g + %s*%.17g + %s*%.17g > %.17g' %
+                       (x_col, center[0], y_col, center[1], z_col, center[2], numpy.cos(bounds.radius)))
+        return ' AND '.join(clauses)
+
+    def _filter_bounding_box(self, query, bounds_list):
+        """
+        Filter the query by RA/Dec boxes containing all of bounds_list.
+        Unlike bounds.to_SQL, the filter only compares raColName and
+        decColName to constants, so no trigonometric functions are evaluated
+        per row and the database can use indexes on those columns.
+        raColName and decColName (which must be in degrees) are added to the
+        query as the last columns, so that the exact cut can be made on the
+        results with _apply_exact_bounds.
+
+        Returns the filtered query, or None if any of bounds_list is neither
+        a circle nor a box.
+        """
+        boxes = _merge_bounding_boxes(bounds_list)
+        if boxes is None:
+            return None
+
+        ra_col = expression.literal_column(self.raColName)
+        dec_col = expression.literal_column(self.decColName)
+        box_clauses = []
+        for ra_min, ra_max, dec_min, dec_max in boxes:
+            if ra_min <= 0.0 and ra_max >= 360.0:
+                box_clauses.append(dec_col.between(dec_min, dec_max))
+            else:
+                box_clauses.append(and_(ra_col.between(ra_min, ra_max),
+                                        dec_col.between(dec_min, dec_max)))
 
-            * results : a result set as returned by execution of the query
+        return query.filter(or_(*box_clauses)).add_columns(ra_col.label(_BOUNDS_RA),
+                                                           dec_col.label(_BOUNDS_DEC))
 
-        **Returns**
+    def _apply_exact_bounds(self, results, bounds):
+        """
+        Cut the results of a query filtered by _filter_bounding_box to
+        the rows inside bounds, and drop the columns it added
+        """
+        if not isinstance(results, (numpy.recarray, ColumnChunk)):
+            results = self._convert_results_to_numpy_recarray_catalogDBObj(results)
 
-            * _final_pass(retresults) : the result of calling the _final_pass method on a
-              structured array constructed from the query data.
+        in_bounds = _in_bounds(bounds, results[_BOUNDS_RA], results[_BOUNDS_DEC])
+        return self._select_bounded_rows(results, in_bounds)
+
+    def _select_bounded_rows(self, results, rows):
         """
+        Return the rows (a mask or index array) of results, a recarray or
+        ColumnChunk from a query filtered by _filter_bounding_box, without
+        the columns _filter_bounding_box added
+        """
+        names = [name for name in results.dtype.names if name not in (_BOUNDS_RA, _BOUNDS_DEC)]
 
-        if len(results) > 0:
-            cols = [str(k) for k in results[0].keys()]
-        else:
-            return results
+        if isinstance(results, ColumnChunk):
+            return results[names][rows]
+
+        return numpy.rec.fromarrays([results[name][rows] for name in names],
+                                    dtype=self._make_results_dtype(names))
+
+    def _make_results_dtype(self, cols):
+        """
+        Return the numpy dtype of query results containing the columns
+        cols, as specified by self.typeMap
+        """
+        cols = tuple(cols)
+        if not hasattr(self, '_results_dtype_cache'):
+            self._results_dtype_cache = {}
+        elif cols in self._results_dtype_cache:
+            return self._results_dtype_cache[cols]
+
+        type_map = self.typeMap
+        if _BOUNDS_RA in cols:
+            type_map = dict(self.typeMap)
+            type_map[_BOUNDS_RA] = (float,)
+            type_map[_BOUNDS_DEC] = (float,)
 
         if sys.version_info.major == 2:
             dt_list = []
             for k in cols:
                 sub_list = [past_str(k)]
-                if self.typeMap[k][0] is not str:
-                    for el in self.typeMap[k]:
+                if type_map[k][0] is not str:
+                    for el in type_map[k]:
                         sub_list.append(el)
                 else:
                     sub_list.append(past_str)
-                    for el in self.typeMap[k][1:]:
+                    for el in type_map[k][1:]:
                         sub_list.append(el)
                 dt_list.append(tuple(sub_list))
 
             dtype = numpy.dtype(dt_list)
 
         else:
-            dtype = numpy.dtype([(k,)+self.typeMap[k] for k in cols])
+            dtype = numpy.dtype([(k,)+type_map[k] for k in cols])
+
+        self._results_dtype_cache[cols] = dtype
+        return dtype
+
+    def _get_results_dtype(self, colnames):
+        """
+        Return the numpy dtype of the rows returned by query_columns
+        when querying the columns colnames
+        """
+        return self._make_results_dtype(colnames)
+
+    def _get_results_default_values(self, colnames):
+        """
+        Return a dict mapping those of colnames which appear in
+        self.dbDefaultValues to their default values (None if there
+        are no such columns)
+        """
+        default_values = dict((name, self.dbDefaultValues[name])
+                              for name in colnames if name in self.dbDefaultValues)
+        if len(default_values) == 0:
+            return None
+        return default_values
 
-        if len(set(cols)&set(self.dbDefaultValues)) > 0:
+    def _get_keyset_column(self):
+        """
+        Return the column on which a streamed ChunkIterator paginates the
+        queries built by query_columns (the idColKey column, which
+        _get_column_query always puts first)
+        """
+        return self.table.c[self.columnMap[self.idColKey]]
 
-            results_array = []
+    def _convert_results_to_numpy_recarray_catalogDBObj(self, results):
+        """Post-process the query results to put them
+        in a structured array.
 
-            for result in results:
-                results_array.append(tuple(result[colName]
-                                           if result[colName] or
-                                           colName not in self.dbDefaultValues
-                                           else self.dbDefaultValues[colName]
-                                           for colName in cols))
+        **Parameters**
+
+            * results : a result set as returned by execution of the query
+
+        **Returns**
+
+            * _final_pass(retresults) : the result of calling the _final_pass method on a
+              structured array constructed from the query data.
+        """
 
+        if len(results) > 0:
+            cols = [str(k) for k in results[0].keys()]
         else:
-            results_array = [tuple(rr) for rr in results]
+            return results
 
-        retresults = numpy.rec.fromrecords(results_array, dtype=dtype)
+        dtype = self._make_results_dtype(cols)
+
+        # Columns with dbDefaultValues are converted column-by-column so
+        # that the defaults can be filled in with a masked assignment.
+        default_values = self._get_results_default_values(cols)
+        if default_values is not None:
+            return _rows_to_recarray(results, dtype, default_values=default_values)
+
+        retresults = numpy.rec.fromrecords([tuple(rr) for rr in results], dtype=dtype)
         return retresults
 
     def _postprocess_results(self, results):
-        if not isinstance(results, numpy.recarray):
+        if not isinstance(results, (numpy.recarray, ColumnChunk)):
             retresults = self._convert_results_to_numpy_recarray_catalogDBObj(results)
         else:
             retresults = results
         return self._final_pass(retresults)
 
     def query_columns(self, colnames=None, chunk_size=None,
-                      obs_metadata=None, constraint=None, limit=None):
+                      obs_metadata=None, constraint=None, limit=None, prefetch=0,
+                      stream=False, layout='records', memory_budget=None,
+                      spatial_filter=None):
         """Execute a query
 
         **Parameters**
@@ -878,6 +2530,45 @@ class CatalogDBObject(with_metaclass(CatalogDBObjectMeta, DBObject)):
               a string which is interpreted as SQL and used as a predicate on the query
             * limit : int (optional)
               limits the number of rows returned by the query
+            * prefetch : int (optional)
+              the number of chunks to fetch and postprocess ahead of the
+              consumer in a background thread, so that database latency
+              overlaps with the processing of each chunk (default 0: no
+              background thread).  Call close() on the returned iterator
+              to abandon it before it is exhausted.
+            * stream : bool (optional)
+              if True (and chunk_size is specified), stream the results so
+              that memory usage is bounded by chunk_size even for drivers
+              which would otherwise buffer the whole result set.  Uses a
+              server-side cursor where the dialect supports one; otherwise
+              the query is paginated on the idColKey column, which must then
+              be unique, and the rows are returned in order of idColKey.
+            * layout : str (optional)
+              'records' (the default) to return each chunk as a
+              numpy.recarray, or 'columns' to return it as a ColumnChunk,
+              which stores each column as a contiguous array (so that
+              vectorized operations on a column, and selecting rows, do not
+              touch the other columns).  With 'columns', _final_pass is
+              passed a ColumnChunk.
+            * memory_budget : int (optional)
+              the number of bytes of memory each chunk may take up; use
+              instead of chunk_size to have the number of rows per chunk
+              derived from the itemsize of the query results (see
+              ChunkIterator.set_row_overhead for how consumers can account
+              for the memory they use per row)
+            * spatial_filter : str (optional)
+              'sql' to filter on obs_metadata.bounds in the database, or
+              'numpy' to have the database filter only on the RA/Dec box
+              containing the bounds (which can use indexes on raColName and
+              decColName, and needs no trigonometric SQL functions) and make
+              the exact cut on each chunk in numpy.  raColName and decColName
+              must then be in degrees, chunks may have fewer than
+              chunk_size rows, and limit counts the rows in the box rather
+              than those in the bounds.  Defaults to self.spatial_filter.
+
+        If self.result_cache is set, results are replayed from it when the
+        same query has already been run to completion (prefetch and stream
+        are then ignored), and are otherwise stored in it as they are read.
 
         **Returns**
 
@@ -886,6 +2577,202 @@ class CatalogDBObject(with_metaclass(CatalogDBObjectMeta, DBObject)):
               items which match the specified query.  If chunk_size is specified,
               then result is an iterator over lists of the given size.
 
+        """
+        if spatial_filter is None:
+            spatial_filter = self.spatial_filter
+        if spatial_filter not in ('sql', 'numpy'):
+            raise ValueError("spatial_filter must be 'sql' or 'numpy'; you gave %s" % spatial_filter)
+
+        query = self._get_column_query(colnames)
+
+        exact_bounds = None
+        if obs_metadata is not None:
+            box_query = None
+            if spatial_filter == 'numpy' and obs_metadata.bounds is not None:
+                box_query = self._filter_bounding_box(query, [obs_metadata.bounds])
+            if box_query is not None:
+                query = box_query
+                exact_bounds = obs_metadata.bounds
+            else:
+                query = self.filter(query, obs_metadata.bounds)
+
+        if constraint is not None:
+            query = query.filter(text(constraint))
+
+        row_nbytes = None
+        if memory_budget is not None:
+            query_colnames = [str_cast(column['name']) for column in query.column_descriptions]
+            row_nbytes = self._get_results_dtype(query_colnames).itemsize
+
+        if self.result_cache is not None:
+            key = self._result_cache_key(query, limit, exact_bounds)
+            cached_results = self.result_cache.load(self.tableid, key, chunk_size=chunk_size,
+                                                    layout=layout, memory_budget=memory_budget)
+            if cached_results is not None:
+                return cached_results
+
+        chunk_iter = ChunkIterator(self, query, chunk_size, prefetch=prefetch,
+                                   stream=stream, limit=limit, layout=layout,
+                                   memory_budget=memory_budget, row_nbytes=row_nbytes,
+                                   exact_bounds=exact_bounds)
+
+        if self.result_cache is not None:
+            return self.result_cache.store(self.tableid, key, chunk_iter)
+
+        return chunk_iter
+
+    def _result_cache_key(self, query, limit, exact_bounds=None):
+        """
+        Return the key identifying the results of query (returning at most
+        limit rows, and cut to exact_bounds in numpy, if they are not None)
+        in self.result_cache: the database connection, the table, the SQL of
+        the query (which encodes the columns queried, their definitions, the
+        bounds and the constraint), the exact bounds, the dtype of the results
+        and this object's class (whose _final_pass the cached results have
+        been through)
+        """
+        query_colnames = [str_cast(column['name']) for column in query.column_descriptions]
+        sql = query.statement.compile(dialect=self.connection.engine.dialect,
+                                      compile_kwargs={'literal_binds': True})
+        return (str(self.connection.driver), str(self.connection.host),
+                str(self.connection.port), str(self.connection.database),
+                str(self.tableid), str(sql), limit,
+                str(self._get_results_dtype(query_colnames).descr),
+                _bounds_key(exact_bounds),
+                '%s.%s' % (type(self).__module__, type(self).__qualname__))
+
+    def invalidate_result_cache(self):
+        """
+        Remove the cached results of all queries on this object's table
+        from self.result_cache
+        """
+        if self.result_cache is not None:
+            self.result_cache.invalidate(self.tableid)
+
+    def query_columns_async(self, colnames=None, chunk_size=None, **kwargs):
+        """Execute a query from an asyncio event loop
+
+        **Parameters**
+
+            * colnames, chunk_size, and any other keyword arguments :
+              as for query_columns
+
+        The query is executed, and its chunks fetched and postprocessed, on
+        a thread of its own so that the event loop is not blocked (except
+        for engines which give each thread its own connection, e.g. in-memory
+        sqlite databases, which are queried on the event loop's thread).
+        The number of queries and catalog writes in flight at once is bounded
+        (see set_async_concurrency); the query waits for a place when its
+        first chunk is requested.
+
+        **Returns**
+
+            * result : AsyncChunkIterator
+              an asynchronous iterator over the chunks query_columns would
+              return.  Call its aclose() coroutine, or use it as an async
+              context manager, to abandon it before it is exhausted.
+
+        """
+        from .AsyncQuery import AsyncChunkIterator
+        return AsyncChunkIterator(self.connection,
+                                  functools.partial(self.query_columns, colnames=colnames,
+                                                    chunk_size=chunk_size, **kwargs))
+
+    def query_columns_multi(self, obs_metadata_list, colnames=None, chunk_size=None,
+                            constraint=None, layout='records'):
+        """Query the rows inside each of many pointings with a single scan
+
+        **Parameters**
+
+            * obs_metadata_list : list
+              the ObservationMetaData of the pointings, each of which must
+              have circle or box bounds
+            * colnames, constraint, layout :
+              as for query_columns
+            * chunk_size : int (optional)
+              the number of rows read from the database at a time (default:
+              all of them at once).  Each row is returned once for every
+              pointing containing it, so a chunk read from the database
+              can give rise to chunks for many pointings.
+
+        The database is scanned once, for the rows in the RA/Dec boxes
+        containing the union of the pointings (see _filter_bounding_box;
+        raColName and decColName must be in degrees).  The rows of each
+        chunk read are then tested against all of the pointings at once
+        in numpy.
+
+        **Returns**
+
+            * result : iterator
+              an iterator over (index, chunk) pairs, where chunk contains
+              rows inside obs_metadata_list[index], as would have been
+              returned by query_columns for that pointing (passed through
+              _final_pass).  The rows of a pointing are spread over many
+              chunks, interleaved with those of the other pointings, and
+              are returned in the order in which they are read; pointings
+              containing no rows are never returned.  Call close() on the
+              iterator to abandon it before it is exhausted.
+        """
+        bounds_list = [obs_metadata.bounds for obs_metadata in obs_metadata_list]
+        if len(bounds_list) == 0:
+            raise ValueError("Must specify at least one ObservationMetaData")
+
+        query = self._get_column_query(colnames)
+        query = self._filter_bounding_box(query, bounds_list)
+        if query is None:
+            raise ValueError("query_columns_multi can only be used with circle or box bounds")
+
+        if constraint is not None:
+            query = query.filter(text(constraint))
+
+        chunk_iter = ChunkIterator(self, query, chunk_size, layout=layout, postprocess=False)
+        return self._iterate_pointings(chunk_iter, bounds_list)
+
+    def _iterate_pointings(self, chunk_iter, bounds_list):
+        """
+        Generator yielding the (index, chunk) pairs of query_columns_multi
+        from chunk_iter, an iterator over the unprocessed chunks of a
+        query filtered by _filter_bounding_box(query, bounds_list)
+        """
+        try:
+            for results in chunk_iter:
+                membership = _bounds_membership(bounds_list, results[_BOUNDS_RA],
+                                                results[_BOUNDS_DEC])
+                for i_pointing in numpy.where(membership.any(axis=0))[0]:
+                    chunk = self._select_bounded_rows(results, membership[:, i_pointing])
+                    yield int(i_pointing), self._postprocess_results(chunk)
+        finally:
+            chunk_iter.close()
+
+    def query_columns_partitioned(self, colnames=None, chunk_size=None,
+                                  obs_metadata=None, constraint=None,
+                                  n_partitions=4, partition_by='id',
+                                  n_workers=None, ordered=True, layout='records'):
+        """Execute a query as several disjoint partitions which run concurrently
+
+        **Parameters**
+
+            * colnames, chunk_size, obs_metadata, constraint, layout :
+              as for query_columns
+            * n_partitions : int (optional)
+              the number of partitions into which to split the query
+            * partition_by : str (optional)
+              'id' to split the query into equal ranges of idColKey, or
+              'dec' to split it into equal-area bands of decColName
+            * n_workers : int (optional)
+              the number of partitions to execute at once, each on its own
+              thread and database connection (default: all of them)
+            * ordered : bool (optional)
+              if True (the default), all of the chunks of one partition are
+              returned before any of the next (in order of increasing id or
+              declination); otherwise chunks are returned as they are fetched
+
+        **Returns**
+
+            * result : PartitionedChunkIterator
+              an iterator over chunks of the query results.  Call close() on it
+              to abandon it before it is exhausted.
+
         """
         query = self._get_column_query(colnames)
 
@@ -895,33 +2782,121 @@ class CatalogDBObject(with_metaclass(CatalogDBObjectMeta, DBObject)):
         if constraint is not None:
             query = query.filter(text(constraint))
 
-        if limit is not None:
-            query = query.limit(limit)
+        queries = self._partition_query(query, n_partitions, partition_by)
+
+        return PartitionedChunkIterator(self, queries, chunk_size, n_workers=n_workers,
+                                        ordered=ordered, layout=layout)
+
+    def _partition_query(self, query, n_partitions, partition_by):
+        """
+        Split query into a list of n_partitions (or fewer) queries which return
+        disjoint sets of rows whose union is the results of query.
 
-        return ChunkIterator(self, query, chunk_size)
+        partition_by is 'id' (equal ranges of idColKey) or 'dec' (bands of
+        decColName of equal area on the sky).  Rows in which the partitioning
+        column is NULL are returned by the last partition.  Raises a ValueError
+        if the partitioning column is not numeric.
+        """
+        if partition_by == 'id':
+            column = self._get_keyset_column()
+        elif partition_by == 'dec':
+            column = expression.literal_column(self.decColName)
+        else:
+            raise ValueError("partition_by must be 'id' or 'dec'; you gave %s" % partition_by)
+
+        range_query = query.add_columns(column.label('partition_column')).subquery()
+        col_min, col_max = self.connection.session.query(
+            func.min(range_query.c.partition_column),
+            func.max(range_query.c.partition_column)).one()
+        if col_min is not None and not all(isinstance(value, (numbers.Real, decimal.Decimal))
+                                           for value in (col_min, col_max)):
+            raise ValueError("Cannot partition the query on the values of %s, which are not numbers; "
+                             "use partition_by='dec'" % column)
+        if n_partitions < 2 or col_min is None or col_min == col_max:
+            return [query]
+        col_min = float(col_min)
+        col_max = float(col_max)
+
+        if partition_by == 'dec':
+            sin_edges = numpy.linspace(numpy.sin(numpy.radians(col_min)),
+                                       numpy.sin(numpy.radians(col_max)),
+                                       n_partitions+1)
+            edges = numpy.degrees(numpy.arcsin(sin_edges))
+        else:
+            edges = numpy.linspace(col_min, col_max, n_partitions+1)
+
+        # only the interior edges are used, so that roundoff at the ends
+        # cannot exclude any rows
+        edges = numpy.unique(edges[1:-1])
+
+        queries = [query.filter(column < float(edges[0]))]
+        for lower, upper in zip(edges[:-1], edges[1:]):
+            queries.append(query.filter(and_(column >= float(lower), column < float(upper))))
+        queries.append(query.filter(or_(column >= float(edges[-1]), column.is_(None))))
+        return queries
 
-sims_clean_up.targets.append(CatalogDBObject._connection_cache)
 
 class fileDBObject(CatalogDBObject):
     ''' Class to read a file into a database and then query it'''
     #Column names to index.  Specify compound indexes using tuples of column names
     indexCols = []
+
+    #: Where the rows of the file are kept: 'sql' to load them into a
+    #: database table, or 'numpy' to keep them in memory as a NumpyTable
+    backend = 'sql'
+
+    #: Mapping of numpy dtype kinds to python types, used to create the
+    #: default columns of the numpy backend (strings are handled separately)
+    numpyKindMap = {'i': (int,), 'u': (int,), 'f': (float,), 'b': (bool,)}
+
+    #: Directory in which to cache the sqlite databases files are loaded
+    #: into, so that they are only loaded once (None: do not cache them)
+    cacheDir = None
+
     def __init__(self, dataLocatorString, runtable=None, driver="sqlite", host=None, port=None, database=":memory:",
-                dtype=None, numGuess=1000, delimiter=None, verbose=False, idColKey=None, **kwargs):
+                dtype=None, numGuess=1000, delimiter=None, verbose=False, idColKey=None, backend=None,
+                cacheDir=None, unitVectorColNames=None, healpixColName=None, healpixNside=None,
+                **kwargs):
         """
         Initialize an object for querying databases loaded from a file
 
         Keyword arguments:
-        @param dataLocatorString: Path to the file to load
+        @param dataLocatorString: Path to the file to load: a delimited text file, or a .npy, .npz or
+        FITS (.fits or .fit, optionally gzipped) file, which is read directly (memory-mapped where
+        possible, see db.utils._read_binary_table) rather than parsed
         @param runtable: The name of the table to create.  If None, a random table name will be used.
         @param driver: name of database driver (e.g. 'sqlite', 'mssql+pymssql')
         @param host: hostname for database connection (None if sqlite)
         @param port: port for database connection (None if sqlite)
         @param database: name of database (filename if sqlite)
-        @param dtype: The numpy dtype to use when loading the file.  If None, it the dtype will be guessed.
+        @param dtype: The numpy dtype to use when loading the file.  If None, it the dtype will be guessed
+        (or, for binary files, read from the file's header).
         @param numGuess: The number of lines to use in guessing the dtype from the file.
         @param delimiter: The delimiter to use when parsing the file default is white space.
         @param idColKey: The name of the column that uniquely identifies each row in the database
+        @param n_processes: The number of processes in which to parse the file (default 1); the
+        parsed rows are inserted in order by this process (see db.utils.loadTable)
+        @param sqliteProfile: The sqlite profile with which the file is loaded (see db.utils.loadTable);
+        'bulk_load' by default when it is loaded into the default in-memory database
+        @param backend: 'sql' to load the file into a database table (the default), or 'numpy' to
+        keep it in memory as numpy arrays.  With 'numpy' there is no database connection: columns,
+        constraints and bounds are evaluated with numpy (see NumpyTable for the SQL expressions it
+        supports; raColName and decColName must be in degrees), and query_columns returns a
+        NumpyChunkIterator.  Defaults to self.backend.
+        @param cacheDir: Directory in which to cache the sqlite database the file is loaded into
+        (with the 'sql' backend, the default driver and database only).  The database is keyed
+        by the path, size, modification time and contents of the file, dtype, indexCols and the
+        other loading options; if it is already in the cache it is opened read-only rather than
+        loaded again (see db.utils.loadCachedData).  Defaults to self.cacheDir.
+        @param unitVectorColNames: The names of (x, y, z) columns to add to the table (with the 'sql'
+        backend), holding the unit vectors pointing to raColName and decColName (in degrees), with
+        which circular bounds are tested without trigonometric functions (see
+        CatalogDBObject.unitVectorColNames).  Defaults to self.unitVectorColNames.
+        @param healpixColName: The name of a column to add to the table (with the 'sql' backend),
+        holding the id of the HEALPix pixel (nested scheme) containing raColName and decColName (in
+        degrees), with which bounds are tested on only a few ranges of its index (see
+        CatalogDBObject.healpixColName; needs healpy).  Defaults to self.healpixColName.
+        @param healpixNside: The HEALPix resolution of healpixColName.  Defaults to self.healpixNside.
         """
         self.verbose = verbose
 
@@ -937,19 +2912,73 @@ class fileDBObject(CatalogDBObject):
                           "been set.  Input files for phosim are not "
                           "possible.")
 
-        if os.path.exists(dataLocatorString):
+        if backend is not None:
+            self.backend = backend
+        if self.backend not in ('sql', 'numpy'):
+            raise ValueError("backend must be 'sql' or 'numpy'; you gave %s" % self.backend)
+
+        if cacheDir is not None:
+            self.cacheDir = cacheDir
+
+        if unitVectorColNames is not None:
+            self.unitVectorColNames = unitVectorColNames
+        if healpixColName is not None:
+            self.healpixColName = healpixColName
+        if healpixNside is not None:
+            self.healpixNside = healpixNside
+        if self.backend == 'sql' and (self.unitVectorColNames is not None or self.healpixColName is not None):
+            if self.raColName is None or self.decColName is None:
+                raise ValueError("unitVectorColNames and healpixColName can only be used "
+                                 "if raColName and decColName are set")
+            kwargs['raDecCols'] = (self.raColName, self.decColName)
+            if self.unitVectorColNames is not None:
+                kwargs['unitVectorCols'] = tuple(self.unitVectorColNames)
+            if self.healpixColName is not None:
+                kwargs['healpixCol'] = self.healpixColName
+                kwargs['healpixNside'] = self.healpixNside
+        if self.cacheDir is not None and self.backend == 'sql' and \
+           (driver != 'sqlite' or database != ':memory:'):
+            raise ValueError("cacheDir can only be used with the default sqlite database; "
+                             "you gave %s database %s" % (driver, database))
+
+        self._numpy_table = None
+        if not os.path.exists(dataLocatorString):
+            raise ValueError("Could not locate file %s."%(dataLocatorString))
+        elif self.backend == 'numpy':
+            self.driver = None
+            self.host = None
+            self.port = None
+            self.database = None
+            self.connection = None
+            self.table = None
+            self.tableid = runtable if runtable is not None else id_generator()
+            self._numpy_table = NumpyTable(loadArray(dataLocatorString, dtype, delimiter,
+                                                     numGuess, **kwargs))
+        elif self.cacheDir is not None:
+            self.driver = driver
+            self.host = None
+            self.port = None
+            self.database, self.tableid = loadCachedData(dataLocatorString, dtype, delimiter, runtable,
+                                                         self.idColKey, numGuess, self.cacheDir,
+                                                         indexCols=self.indexCols, **kwargs)
+            # the cached databases are never changed once they are loaded
+            self.connection = DBConnection(database=self.database, driver=self.driver,
+                                           verbose=verbose, sqlite_profile='immutable')
+            self._get_table()
+        else:
             self.driver = driver
             self.host = host
             self.port = port
             self.database = database
             self.connection = DBConnection(database=self.database, driver=self.driver, host=self.host,
                                            port=self.port, verbose=verbose)
+            if self.driver == 'sqlite' and self.database == ':memory:':
+                # nothing else is in a new in-memory database
+                kwargs.setdefault('sqliteProfile', 'bulk_load')
             self.tableid = loadData(dataLocatorString, dtype, delimiter, runtable, self.idColKey,
                                     self.connection.engine, self.connection.metadata, numGuess,
                                     indexCols=self.indexCols, **kwargs)
             self._get_table()
-        else:
-            raise ValueError("Could not locate file %s."%(dataLocatorString))
 
         if self.generateDefaultColumnMap:
             self._make_default_columns()
@@ -957,6 +2986,73 @@ class fileDBObject(CatalogDBObject):
         self._make_column_map()
         self._make_type_map()
 
+    def _make_default_columns(self):
+        if self._numpy_table is None:
+            super(fileDBObject, self)._make_default_columns()
+            return
+
+        if not self.columns:
+            self.columns = []
+        colnames = [el[0] for el in self.columns]
+        dtype = self._numpy_table.data.dtype
+        for col in dtype.names:
+            if col in colnames:
+                continue
+            if dtype[col].kind == 'U':
+                self.columns.append((col, col, str, dtype[col].itemsize//4))
+            elif dtype[col].kind == 'S':
+                self.columns.append((col, col, str, dtype[col].itemsize))
+            elif dtype[col].kind in self.numpyKindMap:
+                self.columns.append((col, col)+self.numpyKindMap[dtype[col].kind])
+            elif self.verbose:
+                warnings.warn("Can't create default column for %s.  There is no mapping "%(col)+
+                              "for dtype %s.  Modify the numpyKindMap, or make a custom columns "%(dtype[col])+
+                              "list.")
+
+    def query_columns(self, colnames=None, chunk_size=None,
+                      obs_metadata=None, constraint=None, limit=None, prefetch=0,
+                      stream=False, layout='records', memory_budget=None,
+                      spatial_filter=None):
+        """Execute a query
+
+        With the 'sql' backend, this is CatalogDBObject.query_columns.
+
+        With the 'numpy' backend, the rows inside obs_metadata.bounds and
+        satisfying constraint are selected, and a NumpyChunkIterator over
+        them is returned; the columns of each chunk are evaluated only when
+        it is requested.  prefetch, stream and spatial_filter are ignored.
+        The other parameters are as for CatalogDBObject.query_columns.
+        """
+        if self._numpy_table is None:
+            return super(fileDBObject, self).query_columns(colnames=colnames, chunk_size=chunk_size,
+                                                           obs_metadata=obs_metadata,
+                                                           constraint=constraint, limit=limit,
+                                                           prefetch=prefetch, stream=stream,
+                                                           layout=layout, memory_budget=memory_budget,
+                                                           spatial_filter=spatial_filter)
+
+        if colnames is None:
+            colnames = [k for k in self.columnMap]
+        offending_columns = [col for col in colnames if col not in self.columnMap]
+        if len(offending_columns) > 0:
+            raise ValueError('entries in colnames must be in self.columnMap. '
+                             'These:\n%s\nare not' % '\n'.join(offending_columns))
+
+        table = self._numpy_table
+        selected = numpy.ones(len(table), dtype=bool)
+        if obs_metadata is not None and obs_metadata.bounds is not None:
+            selected &= _in_bounds(obs_metadata.bounds, table.evaluate(self.raColName),
+                                   table.evaluate(self.decColName))
+        if constraint is not None:
+            selected &= table.select(constraint)
+
+        rows = numpy.flatnonzero(selected)
+        if limit is not None:
+            rows = rows[:limit]
+
+        return NumpyChunkIterator(self, table, colnames, rows, chunk_size, layout=layout,
+                                  memory_budget=memory_budget)
+
     @classmethod
     def from_objid(cls, objid, *args, **kwargs):
         """Given a string objid, return an instance of
@@ -1,15 +1,22 @@
 from __future__ import with_statement
 from __future__ import print_function
-from future import standard_library
-standard_library.install_aliases()
 from builtins import str
 from builtins import range
 import numpy as np
-from io import BytesIO
+from io import BytesIO, TextIOWrapper
 from sqlalchemy import (types as satypes, Column, Table, Index,
-                        create_engine, MetaData)
+                        create_engine, MetaData, select, bindparam)
+from sqlalchemy.schema import CreateIndex
+import hashlib
+import itertools
+import json
+import multiprocessing
+import os
 import string
 import random
+import tempfile
+import time
+from collections import deque
 
 
 def np_to_sql_type(input_type):
@@ -27,12 +34,83 @@ def np_to_sql_type(input_type):
         return satypes.BIGINT()
     if name == 'int32':
         return satypes.Integer()
+    if input_type.kind in ('i', 'u'):
+        if size >= 4:
+            return satypes.BIGINT()
+        return satypes.Integer()
+    if input_type.kind == 'b':
+        return satypes.Boolean()
     if name.startswith('str') or str(input_type).startswith('S') or str(input_type).startswith('|S'):
         return satypes.String(length=size)
 
     raise RuntimeError("Do not know how to map %s to SQL" % str(input_type))
 
 
+#: Named sets of sqlite connection settings.  'uri' holds the parameters with
+#: which the database file is opened (as a URI), and 'pragmas' the PRAGMA
+#: statements run on each new connection.
+#:
+#: 'bulk_load' is for loading fresh databases: without a rollback journal or
+#: syncing to disk, a crash or rollback part way through a load can leave the
+#: database corrupt, so it should only be used for databases which can be
+#: rebuilt.  'read' opens a database read-only and memory-maps it.
+#: 'immutable' does the same for databases which nothing will change while
+#: they are open (sqlite then skips all locking).  'wal' puts the database in
+#: write-ahead-log mode, in which readers do not block (and are not blocked
+#: by) a writer.
+SQLITE_PROFILES = {
+    'bulk_load': {'uri': {},
+                  'pragmas': [('journal_mode', 'OFF'), ('synchronous', 'OFF'),
+                              ('cache_size', -262144), ('temp_store', 'MEMORY')]},
+    'read': {'uri': {'mode': 'ro'},
+             'pragmas': [('mmap_size', 1 << 30), ('cache_size', -65536),
+                         ('temp_store', 'MEMORY')]},
+    'immutable': {'uri': {'mode': 'ro', 'immutable': '1'},
+                  'pragmas': [('mmap_size', 1 << 30), ('cache_size', -65536),
+                              ('temp_store', 'MEMORY')]},
+    'wal': {'uri': {},
+            'pragmas': [('journal_mode', 'WAL'), ('synchronous', 'NORMAL'),
+                        ('mmap_size', 1 << 30)]}
+}
+
+
+def get_sqlite_profile(name):
+    """
+    Return the settings of the named sqlite connection profile
+    (see SQLITE_PROFILES), or raise a ValueError if there is none
+    """
+    if name not in SQLITE_PROFILES:
+        raise ValueError("There is no sqlite profile %s; the profiles are %s" %
+                         (name, ', '.join(sorted(SQLITE_PROFILES))))
+    return SQLITE_PROFILES[name]
+
+
+def set_sqlite_pragmas(connection, pragmas):
+    """
+    Run PRAGMA statements on a sqlite DBAPI connection
+
+    Parameters
+    ----------
+    connection is the sqlite3 connection
+    pragmas is a list of (name, value) tuples, e.g. the 'pragmas' of one
+    of SQLITE_PROFILES
+
+    Returns
+    -------
+    The list of the (name, value) tuples of the previous values of the
+    pragmas, with which they can be restored
+    """
+    cursor = connection.cursor()
+    try:
+        previous = []
+        for name, value in pragmas:
+            previous.append((name, cursor.execute('PRAGMA %s' % name).fetchone()[0]))
+            cursor.execute('PRAGMA %s = %s' % (name, value))
+        return previous
+    finally:
+        cursor.close()
+
+
 # from http://stackoverflow.com/questions/2257441/python-random-string-generation-with-upper-case-letters-and-digits
 def id_generator(size=8, chars=string.ascii_lowercase):
     return ''.join(random.choice(chars) for x in range(size))
@@ -84,53 +162,454 @@ def createSQLTable(dtype, tableid, idCol, metadata):
     return datatable
 
 
-def loadTable(datapath, datatable, delimiter, dtype, engine,
-              indexCols=[], skipLines=1, chunkSize=100000, **kwargs):
-    cnt = 0
+def _parse_lines(lines, dtype, delimiter, **kwargs):
+    """
+    Parse a list of lines of text into a numpy array with the given dtype.
+
+    Lines are parsed with numpy.loadtxt, which is much faster than
+    numpy.genfromtxt, unless genfromtxt-specific kwargs are given or
+    loadtxt cannot parse them (e.g. because of missing values).
+    """
+    if len(kwargs) == 0:
+        try:
+            return np.loadtxt(lines, dtype=dtype, delimiter=delimiter, ndmin=1)
+        except ValueError:
+            pass
+    # If there is only one line, the result of genfromtxt is a 0-d array
+    return np.atleast_1d(np.genfromtxt(lines, dtype=dtype, delimiter=delimiter, **kwargs))
+
+
+def _parse_chunks(datapath, dtype, delimiter, skipLines, chunkSize, kwargs):
+    """
+    Generator yielding the rows of a text file parsed chunkSize lines at a time
+    """
     with open(datapath) as fh:
-        while cnt < skipLines:
-            fh.readline()
-            cnt += 1
-        cnt = 0
-        tmpstr = ''
-        for l in fh:
-            tmpstr += l
-            cnt += 1
-            if cnt%chunkSize == 0:
-                print("Loading chunk #%i"%(int(cnt/chunkSize)))
-                dataArr = np.genfromtxt(BytesIO(tmpstr.encode()), dtype=dtype, delimiter=delimiter, **kwargs)
-                engine.execute(datatable.insert(),
-                               [dict((name, np.asscalar(l[name])) for name in l.dtype.names)
-                                for l in dataArr])
-                tmpstr = ''
-        # Clean up the last chunk
-        if len(tmpstr) > 0:
-            dataArr = np.genfromtxt(BytesIO(tmpstr.encode()), dtype=dtype, delimiter=delimiter, **kwargs)
-            try:
-                engine.execute(datatable.insert(),
-                               [dict((name, np.asscalar(l[name])) for name in l.dtype.names)
-                                for l in dataArr])
-            # If the file only has one line, the result of genfromtxt is a 0-d array, so cannot be iterated
-            except TypeError:
-                engine.execute(datatable.insert(),
-                               [dict((name, np.asscalar(dataArr[name])) for name in dataArr.dtype.names), ])
-
-    for col in indexCols:
-        if hasattr(col, "__iter__"):
-            print("Creating index on %s"%(",".join(col)))
-            colArr = (datatable.c[c] for c in col)
-            i = Index('%sidx'%''.join(col), *colArr)
+        for line in itertools.islice(fh, skipLines):
+            pass
+        while True:
+            lines = list(itertools.islice(fh, chunkSize))
+            if len(lines) == 0:
+                break
+            yield _parse_lines(lines, dtype, delimiter, **kwargs)
+
+
+def _line_aligned_ranges(datapath, skipLines, chunkSize):
+    """
+    Return a list of (start, end) byte offsets splitting a text file (after
+    its first skipLines lines) into ranges of whole lines, each of roughly
+    chunkSize lines (estimated from the length of the first lines)
+    """
+    file_size = os.path.getsize(datapath)
+    with open(datapath, 'rb') as fh:
+        for line in itertools.islice(fh, skipLines):
+            pass
+        start = fh.tell()
+        sample = list(itertools.islice(fh, min(chunkSize, 1000)))
+        if len(sample) == 0:
+            return []
+        range_size = max(1, chunkSize*sum(len(line) for line in sample)//len(sample))
+
+        ranges = []
+        while start < file_size:
+            end = start + range_size
+            if end < file_size:
+                # extend the range to the end of the line it falls within
+                fh.seek(end - 1)
+                fh.readline()
+                end = fh.tell()
+            end = min(end, file_size)
+            ranges.append((start, end))
+            start = end
+    return ranges
+
+
+def _parse_byte_range(datapath, byte_range, dtype, delimiter, kwargs):
+    """
+    Parse the lines between the (start, end) byte offsets byte_range of a
+    text file.  This is run in the worker processes of _parse_chunks_parallel.
+    """
+    with open(datapath, 'rb') as fh:
+        fh.seek(byte_range[0])
+        text = fh.read(byte_range[1] - byte_range[0])
+    # decode and split the lines exactly as open(datapath) would
+    lines = TextIOWrapper(BytesIO(text)).readlines()
+    return _parse_lines(lines, dtype, delimiter, **kwargs)
+
+
+def _parse_chunks_parallel(datapath, dtype, delimiter, skipLines, chunkSize, n_processes, kwargs):
+    """
+    Generator yielding the rows of a text file, as _parse_chunks does, but
+    parsed in a pool of n_processes processes.  The file is split into byte
+    ranges of whole lines which are parsed concurrently and yielded in order.
+    At most 2*n_processes ranges are parsed ahead of the consumer.
+    """
+    ranges = _line_aligned_ranges(datapath, skipLines, chunkSize)
+    pool = multiprocessing.Pool(n_processes)
+    try:
+        pending = deque()
+        for byte_range in ranges:
+            pending.append(pool.apply_async(_parse_byte_range,
+                                            (datapath, byte_range, dtype, delimiter, kwargs)))
+            if len(pending) >= 2*n_processes:
+                yield pending.popleft().get()
+        while len(pending) > 0:
+            yield pending.popleft().get()
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+# The extensions of the binary formats which are read directly,
+# rather than being parsed as text (see _read_binary_table)
+_BINARY_EXTENSIONS = (('.npy', 'npy'), ('.npz', 'npz'), ('.fits', 'fits'), ('.fit', 'fits'),
+                      ('.fits.gz', 'fits'), ('.fit.gz', 'fits'))
+
+
+def _binary_format(dataPath):
+    """
+    Return the binary format ('npy', 'npz' or 'fits') of the file dataPath,
+    judging by its extension, or None if it is a text file
+    """
+    lower_path = dataPath.lower()
+    for extension, file_format in _BINARY_EXTENSIONS:
+        if lower_path.endswith(extension):
+            return file_format
+    return None
+
+
+def _fits_table(dataPath):
+    """
+    Return the first table in the FITS file dataPath as a numpy structured
+    array: memory-mapped if none of its columns need converting (i.e. have
+    no scaling or offset and are neither logical nor strings), otherwise a
+    copy with the conversions applied.  Requires astropy.
+    """
+    try:
+        from astropy.io import fits
+        from astropy.table import Table as AstropyTable
+    except ImportError:
+        raise ImportError("astropy is needed to read the FITS file %s" % dataPath)
+
+    with fits.open(dataPath, memmap=True) as hdu_list:
+        for hdu in hdu_list:
+            if isinstance(hdu, (fits.BinTableHDU, fits.TableHDU)) and hdu.data is not None:
+                break
         else:
-            print("Creating index on %s"%(col))
-            i = Index('%sidx'%col, datatable.c[col])
+            raise ValueError("There is no table in the FITS file %s" % dataPath)
 
-        i.create(engine)
+        data = hdu.data
+        if isinstance(hdu, fits.BinTableHDU) and \
+           all(column.bscale in (None, 1) and column.bzero in (None, 0) and
+               column.format[-1:] not in ('L', 'A') for column in data.columns):
 
+            return data.view(type=np.ndarray, dtype=np.dtype(data.dtype.descr))
+
+        return AstropyTable(data).as_array()
+
+
+def _read_binary_table(dataPath, file_format, dtype=None):
+    """
+    Read a binary file (a .npy or .npz file, or a FITS table) as a numpy
+    structured array.  The rows of .npy files (and of FITS tables, where
+    possible) are memory-mapped rather than read.
+
+    A .npz file must either contain a single structured array, or one
+    1-dimensional array per column (named after the column).
+
+    If dtype is not None, the columns it names are selected from the file
+    and converted to its types (which copies them).
+    """
+    if file_format == 'npy':
+        data = np.load(dataPath, mmap_mode='r')
+    elif file_format == 'npz':
+        with np.load(dataPath) as npz_file:
+            names = list(npz_file.keys())
+            if len(names) == 1 and npz_file[names[0]].dtype.names is not None:
+                data = npz_file[names[0]]
+            else:
+                data = np.rec.fromarrays([npz_file[name] for name in names], names=names)
+                data = data.view(type=np.ndarray, dtype=np.dtype(data.dtype.descr))
+    else:
+        data = _fits_table(dataPath)
+
+    if data.dtype.names is None or data.ndim != 1:
+        raise ValueError("%s does not contain a 1-dimensional table" % dataPath)
+    for name in data.dtype.names:
+        if data.dtype[name].shape != ():
+            raise ValueError("Column %s of %s has more than one value per row" % (name, dataPath))
+
+    if dtype is not None:
+        data = np.rec.fromarrays([data[name] for name in dtype.names], dtype=dtype)
+        data = data.view(type=np.ndarray, dtype=np.dtype(data.dtype.descr))
+    return data
+
+
+def _array_chunks(data, chunkSize):
+    """
+    Generator yielding the rows of the structured array data chunkSize at a
+    time, with strings of bytes decoded (so that they are stored as text)
+    """
+    dtype = np.dtype([(name, data.dtype[name].str.replace('S', 'U'))
+                      if data.dtype[name].kind == 'S' else (name, data.dtype[name])
+                      for name in data.dtype.names])
+    for i_start in range(0, len(data), chunkSize):
+        yield data[i_start:i_start + chunkSize].astype(dtype)
+
+
+def _read_chunks(datapath, dtype, delimiter, skipLines, chunkSize, n_processes, kwargs):
+    """
+    Return a generator yielding the rows of the file datapath chunkSize at
+    a time: read from a binary file, or parsed from a text file (in a pool
+    of n_processes processes if n_processes > 1)
+    """
+    file_format = _binary_format(datapath)
+    if file_format is not None:
+        return _array_chunks(_read_binary_table(datapath, file_format, dtype=dtype), chunkSize)
+    if n_processes > 1:
+        return _parse_chunks_parallel(datapath, dtype, delimiter, skipLines, chunkSize,
+                                      n_processes, kwargs)
+    return _parse_chunks(datapath, dtype, delimiter, skipLines, chunkSize, kwargs)
+
+
+def _unit_vectors(ra, dec):
+    """
+    Return the (N, 3) array of Cartesian unit vectors pointing to RA ra and
+    Dec dec (in radians)
+    """
+    cos_dec = np.cos(dec)
+    return np.column_stack((cos_dec*np.cos(ra), cos_dec*np.sin(ra), np.sin(dec)))
+
+
+def _healpy():
+    """
+    Return the healpy module, which is only needed (and so only
+    imported) to compute HEALPix pixel ids
+    """
+    try:
+        import healpy
+    except ImportError:
+        raise ImportError("healpy is needed to compute HEALPix pixels; install it, "
+                          "or do not use HEALPix pixel id columns")
+    return healpy
+
+
+def _healpix_ids(ra, dec, nside):
+    """
+    Return the ids of the HEALPix pixels (in the nested scheme, at
+    resolution nside) containing RA ra and Dec dec (in degrees)
+    """
+    return _healpy().ang2pix(nside, ra, dec, nest=True, lonlat=True).astype(np.int64)
+
+
+def _derived_columns(unitVectorCols, healpixCol):
+    """
+    Return the list of the (name, type) of the columns which loadTable
+    derives from RA and Dec
+    """
+    columns = []
+    if unitVectorCols is not None:
+        columns += [(name, float) for name in unitVectorCols]
+    if healpixCol is not None:
+        columns.append((healpixCol, np.int64))
+    return columns
+
+
+def _add_derived_columns(dataArr, raDecCols, unitVectorCols, healpixCol, healpixNside):
+    """
+    Return a copy of the structured array dataArr with the columns derived
+    from its columns raDecCols (RA, Dec, in degrees) appended: the (x, y, z)
+    unit vectors unitVectorCols and the HEALPix pixel id healpixCol (either
+    of which may be None)
+    """
+    dtype = np.dtype(dataArr.dtype.descr + _derived_columns(unitVectorCols, healpixCol))
+    result = np.empty(len(dataArr), dtype=dtype)
+    for name in dataArr.dtype.names:
+        result[name] = dataArr[name]
+    ra = dataArr[raDecCols[0]]
+    dec = dataArr[raDecCols[1]]
+    if unitVectorCols is not None:
+        vectors = _unit_vectors(np.radians(ra), np.radians(dec))
+        for i_col, name in enumerate(unitVectorCols):
+            result[name] = vectors[:, i_col]
+    if healpixCol is not None:
+        result[healpixCol] = _healpix_ids(ra, dec, healpixNside)
+    return result
+
+
+def _insert_rows(cursor, statement, names, dataArr):
+    """
+    Insert the rows of the numpy array dataArr with a single executemany
+    on the DBAPI cursor.
+
+    statement is the insert (or update) statement compiled for the cursor's
+    dialect and names are the names of its bound parameters.
+    """
+    # tolist converts the numpy scalars into python objects
+    # much more quickly than converting them one at a time
+    rows = dataArr[names].tolist()
+    if statement.positional:
+        cursor.executemany(str(statement), rows)
+    else:
+        cursor.executemany(str(statement), [dict(zip(names, row)) for row in rows])
+
+
+def loadTable(datapath, datatable, delimiter, dtype, engine,
+              indexCols=[], skipLines=1, chunkSize=100000, n_processes=1, sqliteProfile=None,
+              raDecCols=None, unitVectorCols=None, healpixCol=None, healpixNside=1024, **kwargs):
+    """
+    Load the rows of a file into a database table.
+
+    Parameters
+    ----------
+    datapath is the path to the file: a text file, or a binary .npy, .npz
+    or FITS (.fits, .fit, optionally gzipped) file (see _read_binary_table)
+    datatable is the sqlalchemy Table into which to load the rows
+    delimiter is the delimiter between columns (None for whitespace)
+    dtype is a numpy dtype describing the columns in the file
+    engine is the sqlalchemy engine connected to the database
+    indexCols is a list of the columns (or tuples of columns, for compound
+    indexes) on which to create indexes once the rows are loaded
+    skipLines is the number of lines at the start of the file to skip
+    chunkSize is the number of lines read, parsed and inserted at a time
+    n_processes is the number of processes in which to parse the file
+    sqliteProfile is the name of the sqlite profile (see SQLITE_PROFILES,
+    e.g. 'bulk_load') whose pragmas are set while the rows are loaded into
+    a sqlite database (default None: leave the pragmas as they are)
+    raDecCols is the (RA, Dec) pair of the names of the columns holding
+    RA and Dec in degrees (only needed with unitVectorCols or healpixCol)
+    unitVectorCols is the (x, y, z) triple of the names of columns of
+    datatable (but not of the file) in which to store the Cartesian unit
+    vectors pointing to raDecCols (default None: there are none); an
+    index is created on the z column (see addUnitVectorColumns)
+    healpixCol is the name of a column of datatable (but not of the file)
+    in which to store the id of the HEALPix pixel (in the nested scheme, at
+    resolution healpixNside) containing raDecCols (default None: there is
+    none); an index is created on it (see addHealpixColumn)
+    kwargs are passed on to numpy.genfromtxt
+
+    The file is streamed chunkSize lines at a time; each chunk is inserted
+    with a single executemany on the DBAPI connection, and all of the chunks
+    are inserted in one transaction.  If n_processes > 1, the file is split
+    into byte ranges of whole lines (of roughly chunkSize lines each) which
+    are parsed in a pool of n_processes processes, and inserted in order
+    by this process.  Binary files are read chunkSize rows at a time
+    (delimiter, skipLines, n_processes and kwargs are then ignored).
+
+    Returns
+    -------
+    The number of rows loaded
+    """
+    names = list(dtype.names)
+    derived_columns = _derived_columns(unitVectorCols, healpixCol)
+    if len(derived_columns) > 0:
+        if raDecCols is None:
+            raise ValueError("loadTable needs raDecCols to compute unitVectorCols and healpixCol")
+        names += [name for name, columnType in derived_columns]
+        for col in (unitVectorCols[2] if unitVectorCols is not None else None, healpixCol):
+            if col is not None and col not in indexCols:
+                indexCols = list(indexCols) + [col]
+    statement = datatable.insert().compile(dialect=engine.dialect, column_keys=names)
+    if statement.positional:
+        names = list(statement.positiontup)
+
+    t_start = time.time()
+    n_rows = 0
+    connection = engine.raw_connection()
+    previous_pragmas = []
+    try:
+        if sqliteProfile is not None and engine.dialect.name == 'sqlite':
+            previous_pragmas = set_sqlite_pragmas(connection,
+                                                  get_sqlite_profile(sqliteProfile)['pragmas'])
+        cursor = connection.cursor()
+        chunks = _read_chunks(datapath, dtype, delimiter, skipLines, chunkSize, n_processes, kwargs)
+        try:
+            for i_chunk, dataArr in enumerate(chunks):
+                print("Loading chunk #%i" % (i_chunk + 1))
+                if len(dataArr) > 0:
+                    if len(derived_columns) > 0:
+                        dataArr = _add_derived_columns(dataArr, raDecCols, unitVectorCols,
+                                                       healpixCol, healpixNside)
+                    _insert_rows(cursor, statement, names, dataArr)
+                    n_rows += len(dataArr)
+        finally:
+            chunks.close()
+        connection.commit()
+
+        duration = time.time() - t_start
+        print("Loaded %i rows in %.2f s (%.0f rows/s)" % (n_rows, duration, n_rows/max(duration, 1.0e-6)))
+
+        # Indexes are only created once the rows are loaded, rather than
+        # being updated as each row is inserted (and on the same connection,
+        # so with the same pragmas)
+        for col in indexCols:
+            if isinstance(col, (tuple, list)):
+                print("Creating index on %s"%(",".join(col)))
+                colArr = (datatable.c[c] for c in col)
+                i = Index('%sidx'%''.join(col), *colArr)
+            else:
+                print("Creating index on %s"%(col))
+                i = Index('%sidx'%col, datatable.c[col])
+
+            cursor.execute(str(CreateIndex(i).compile(dialect=engine.dialect)))
+        cursor.close()
+        connection.commit()
+    except:
+        connection.rollback()
+        raise
+    finally:
+        try:
+            set_sqlite_pragmas(connection, previous_pragmas)
+        finally:
+            connection.close()
+
+    return n_rows
+
+
+def loadArray(dataPath, dtype, delimiter, numGuess, skipLines=1, chunkSize=100000,
+              n_processes=1, **kwargs):
+    """
+    Read a file into a numpy structured array, as loadData would
+    before loading it into a database table.
+
+    Parameters
+    ----------
+    dataPath is the path to the file (text, or binary as for loadTable)
+    dtype is a numpy dtype describing the columns in the file (if None, it
+    is read from the header of a binary file, or guessed from the first
+    numGuess lines of a text file)
+    delimiter, skipLines, chunkSize, n_processes and kwargs are as for loadTable
+
+    Returns
+    -------
+    A numpy structured array of the rows in the file (memory-mapped
+    from .npy files, and from FITS files where possible)
+    """
+    file_format = _binary_format(dataPath)
+    if file_format is not None:
+        return _read_binary_table(dataPath, file_format, dtype=dtype)
 
-def loadData(dataPath, dtype, delimiter, tableId, idCol, engine, metaData, numGuess, append=False, **kwargs):
     if dtype is None:
         dtype = guessDtype(dataPath, numGuess, delimiter)
 
+    chunks = _read_chunks(dataPath, dtype, delimiter, skipLines, chunkSize, n_processes, kwargs)
+    try:
+        arrays = list(chunks)
+    finally:
+        chunks.close()
+
+    if len(arrays) == 0:
+        return np.zeros(0, dtype=dtype)
+    return np.concatenate(arrays)
+
+
+def loadData(dataPath, dtype, delimiter, tableId, idCol, engine, metaData, numGuess, append=False, **kwargs):
+    file_format = _binary_format(dataPath)
+    if file_format is not None:
+        # the dtype comes from the header of the file
+        dtype = _read_binary_table(dataPath, file_format, dtype=dtype).dtype
+    elif dtype is None:
+        dtype = guessDtype(dataPath, numGuess, delimiter)
+
     tableExists = False
 
     if tableId is not None:
@@ -140,8 +619,259 @@ def loadData(dataPath, dtype, delimiter, tableId, idCol, engine, metaData, numGu
     elif tableExists and not append:
         raise ValueError("Append is False but table exists")
     elif not tableExists:
-        dataTable = createSQLTable(dtype, tableId, idCol, metaData)
+        tableDtype = np.dtype(dtype.descr + _derived_columns(kwargs.get('unitVectorCols'),
+                                                             kwargs.get('healpixCol')))
+        dataTable = createSQLTable(tableDtype, tableId, idCol, metaData)
     else:
         dataTable = Table(tableId, metaData, autoload=True)
     loadTable(dataPath, dataTable, delimiter, dtype, engine, **kwargs)
     return dataTable.name
+
+
+def _execute_compiled(cursor, statement, params):
+    """
+    Execute statement, compiled for the dialect of the DBAPI cursor,
+    with the values params of its bound parameters
+    """
+    values = statement.construct_params(params)
+    if statement.positional:
+        cursor.execute(str(statement), [values[name] for name in statement.positiontup])
+    else:
+        cursor.execute(str(statement), values)
+
+
+def _add_columns_to_table(engine, tableId, idCol, raCol, decCol, columns, derive, indexCol,
+                          chunkSize):
+    """
+    Add columns derived from the RA and Dec of each row to an existing
+    table, and an index on one of them.
+
+    columns is the list of the (name, numpy type) of the columns to add,
+    derive is a function returning the list of their values given arrays
+    of RA and Dec (in degrees), and indexCol is the column to index.  The
+    other parameters are as for addUnitVectorColumns.
+
+    Returns the number of rows updated
+    """
+    with engine.begin() as connection:
+        for name, columnType in columns:
+            sqlType = np_to_sql_type(np.dtype(columnType)).compile(dialect=engine.dialect)
+            connection.execute('ALTER TABLE %s ADD %s %s' % (tableId, name, sqlType))
+
+    table = Table(tableId, MetaData(bind=engine), autoload=True)
+    id_col = table.c[idCol]
+    # the rows are read a chunk at a time, in order of idCol
+    query = select([id_col, table.c[raCol], table.c[decCol]]).order_by(id_col).limit(chunkSize)
+    first_query = query.compile(dialect=engine.dialect)
+    next_query = query.where(id_col > bindparam('_last')).compile(dialect=engine.dialect)
+    # the parameters cannot be named after the columns they set
+    update = table.update().where(id_col == bindparam('_id'))
+    update = update.values(dict((name, bindparam('_%s' % name)) for name, columnType in columns))
+    update = update.compile(dialect=engine.dialect)
+    names = ['_%s' % name for name, columnType in columns] + ['_id']
+    if update.positional:
+        names = list(update.positiontup)
+
+    n_rows = 0
+    connection = engine.raw_connection()
+    try:
+        cursor = connection.cursor()
+        _execute_compiled(cursor, first_query, {})
+        rows = cursor.fetchall()
+        while len(rows) > 0:
+            ids = np.array([row[0] for row in rows])
+            ra = np.array([row[1] for row in rows], dtype=float)
+            dec = np.array([row[2] for row in rows], dtype=float)
+            updates = np.empty(len(rows), dtype=[('_%s' % name, columnType) for name, columnType in columns] +
+                                                [('_id', ids.dtype)])
+            updates['_id'] = ids
+            for (name, columnType), values in zip(columns, derive(ra, dec)):
+                updates['_%s' % name] = values
+            _insert_rows(cursor, update, names, updates)
+            n_rows += len(rows)
+
+            _execute_compiled(cursor, next_query, {'_last': rows[-1][0]})
+            rows = cursor.fetchall()
+
+        index = Index('%sidx' % indexCol, table.c[indexCol])
+        cursor.execute(str(CreateIndex(index).compile(dialect=engine.dialect)))
+        cursor.close()
+        connection.commit()
+    except:
+        connection.rollback()
+        raise
+    finally:
+        connection.close()
+
+    return n_rows
+
+
+def addUnitVectorColumns(engine, tableId, idCol, raCol, decCol, unitVectorCols=('x', 'y', 'z'),
+                         chunkSize=100000):
+    """
+    Add columns holding the Cartesian unit vectors pointing to the RA and
+    Dec of each row to an existing table, and an index on the z column.
+    A CatalogDBObject whose unitVectorColNames are these columns tests
+    circular bounds with a dot product, rather than with trigonometric
+    functions (which sqlite evaluates in python for each row).
+
+    Parameters
+    ----------
+    engine is the sqlalchemy engine connected to the database
+    tableId is the name of the table
+    idCol is the name of the table's (unique) primary key
+    raCol and decCol are the names of the columns holding RA and Dec in degrees
+    unitVectorCols are the names of the (x, y, z) columns to add
+    chunkSize is the number of rows updated at a time
+
+    Returns
+    -------
+    The number of rows updated
+    """
+    def derive(ra, dec):
+        return _unit_vectors(np.radians(ra), np.radians(dec)).T
+
+    return _add_columns_to_table(engine, tableId, idCol, raCol, decCol,
+                                 [(name, float) for name in unitVectorCols], derive,
+                                 unitVectorCols[2], chunkSize)
+
+
+def addHealpixColumn(engine, tableId, idCol, raCol, decCol, healpixCol='healpix', nside=1024,
+                     chunkSize=100000):
+    """
+    Add a column holding the id of the HEALPix pixel (in the nested scheme)
+    containing the RA and Dec of each row to an existing table, and an index
+    on it.  A CatalogDBObject whose healpixColName is this column (and whose
+    healpixNside is nside) selects the rows inside bounds from a few ranges
+    of the index, before testing them exactly.  Needs healpy.
+
+    Parameters
+    ----------
+    engine is the sqlalchemy engine connected to the database
+    tableId is the name of the table
+    idCol is the name of the table's (unique) primary key
+    raCol and decCol are the names of the columns holding RA and Dec in degrees
+    healpixCol is the name of the column to add
+    nside is the HEALPix resolution (a power of 2)
+    chunkSize is the number of rows updated at a time
+
+    Returns
+    -------
+    The number of rows updated
+    """
+    def derive(ra, dec):
+        return [_healpix_ids(ra, dec, nside)]
+
+    return _add_columns_to_table(engine, tableId, idCol, raCol, decCol, [(healpixCol, np.int64)],
+                                 derive, healpixCol, chunkSize)
+
+
+def _file_digest(dataPath, blockSize=1 << 20):
+    """
+    Return the sha1 hex digest of the contents of the file dataPath
+    """
+    digest = hashlib.sha1()
+    with open(dataPath, 'rb') as input_file:
+        for block in iter(lambda: input_file.read(blockSize), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _load_options(dtype, delimiter, tableId, idCol, numGuess, indexCols, kwargs):
+    """
+    Return the list of everything other than the file which determines
+    the contents of the database loadCachedData loads it into
+    """
+    # chunkSize, n_processes and sqliteProfile change how the file is loaded, not what is loaded
+    options = sorted((name, repr(value)) for name, value in kwargs.items()
+                     if name not in ('chunkSize', 'n_processes', 'sqliteProfile'))
+    return [None if dtype is None else str(np.dtype(dtype).descr), delimiter, tableId, idCol,
+            numGuess if dtype is None else None,
+            [list(col) if isinstance(col, (tuple, list)) else col for col in indexCols],
+            options]
+
+
+def _cache_key(fileKey, options):
+    """
+    Return the key under which loadCachedData caches what it knows of a
+    file identified by fileKey (a list), loaded with options (see
+    _load_options)
+    """
+    return hashlib.sha1(json.dumps([fileKey, options]).encode('utf-8')).hexdigest()
+
+
+def loadCachedData(dataPath, dtype, delimiter, tableId, idCol, numGuess, cacheDir,
+                   indexCols=[], **kwargs):
+    """
+    Load a file into a sqlite database file kept in cacheDir, unless
+    it has already been loaded there, as loadData would.
+
+    Parameters
+    ----------
+    dataPath is the path to the file (text, or binary as for loadTable)
+    dtype, delimiter, idCol and numGuess are as for loadData
+    tableId is the name of the table (if None, a name derived from the
+    cache key is used, so that it is the same each time)
+    cacheDir is the directory holding the cached databases (created if
+    it does not exist)
+    indexCols and kwargs are as for loadTable
+
+    The databases are keyed by the contents (sha1) of the file, as well as
+    by dtype, delimiter, tableId, idCol, indexCols and the parsing options in
+    kwargs, so that a file which changes (or is loaded differently) is loaded
+    again.  Hashing the file takes a pass over it, so the database is also
+    recorded under the path, size and modification time of the file, and
+    the file is only hashed if they do not match a recorded database.  A
+    database is built under a temporary name and then renamed, so that a
+    partially loaded database is never found in the cache.  It is loaded with
+    the 'bulk_load' sqlite profile unless kwargs give another sqliteProfile.
+
+    Returns
+    -------
+    The path to the sqlite database file and the name of the table in it
+    """
+    options = _load_options(dtype, delimiter, tableId, idCol, numGuess, indexCols, kwargs)
+    stat = os.stat(dataPath)
+    statPath = os.path.join(cacheDir, '%s.json' % _cache_key([os.path.abspath(dataPath), stat.st_size,
+                                                              stat.st_mtime_ns], options))
+    databasePath = None
+    if os.path.exists(statPath):
+        with open(statPath, 'r') as statFile:
+            databasePath = os.path.join(cacheDir, json.load(statFile)['database'])
+
+    if databasePath is None or not os.path.exists(databasePath):
+        key = _cache_key([_file_digest(dataPath)], options)
+        databasePath = os.path.join(cacheDir, '%s.db' % key)
+        if not os.path.exists(databasePath):
+            if not os.path.isdir(cacheDir):
+                os.makedirs(cacheDir)
+            kwargs.setdefault('sqliteProfile', 'bulk_load')
+            fd, tmpPath = tempfile.mkstemp(dir=cacheDir, prefix='%s.' % key, suffix='.tmp')
+            os.close(fd)
+            try:
+                engine, metaData = make_engine('sqlite:///%s' % tmpPath)
+                try:
+                    loadData(dataPath, dtype, delimiter,
+                             'cached_%s' % key[:16] if tableId is None else tableId, idCol,
+                             engine, metaData, numGuess, indexCols=indexCols, **kwargs)
+                finally:
+                    engine.dispose()
+                os.rename(tmpPath, databasePath)
+            except:
+                if os.path.exists(tmpPath):
+                    os.unlink(tmpPath)
+                raise
+
+        fd, tmpPath = tempfile.mkstemp(dir=cacheDir, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w') as statFile:
+                json.dump({'database': os.path.basename(databasePath)}, statFile)
+            os.rename(tmpPath, statPath)
+        except:
+            if os.path.exists(tmpPath):
+                os.unlink(tmpPath)
+            raise
+
+    if tableId is None:
+        tableId = 'cached_%s' % os.path.basename(databasePath)[:16]
+    return databasePath, tableId
@@ -143,7 +143,8 @@ class CompoundInstanceCatalog(object):
         return True
 
 
-    def write_catalog(self, filename, chunk_size=None, write_header=True, write_mode='w'):
+    def write_catalog(self, filename, chunk_size=None, write_header=True, write_mode='w',
+                      prefetch=0):
         """
         Write the stored list of InstanceCatalogs to a single ASCII output catalog.
 
@@ -159,6 +160,10 @@ class CompoundInstanceCatalog(object):
 
         @param [in] write_mode is 'w' if you want to overwrite the output file or
         'a' if you want to append to an existing output file (default: 'w')
+
+        @param [in] prefetch is the number of chunks to query ahead of the
+        one being written, in a background thread (default 0; only useful
+        if chunk_size is set)
         """
 
         instantiated_ic_list = [None]*len(self._ic_list)
@@ -189,7 +194,8 @@ class CompoundInstanceCatalog(object):
                 ic._query_and_write(filename, chunk_size=chunk_size,
                                     write_header=write_header, write_mode=write_mode,
                                     obs_metadata=self._obs_metadata,
-                                    constraint=self._constraint)
+                                    constraint=self._constraint,
+                                    prefetch=prefetch)
                 write_mode = 'a'
                 write_header = False
 
@@ -240,12 +246,12 @@ class CompoundInstanceCatalog(object):
 
                 self._write_compound(catList, compound_dbo, filename,
                                      chunk_size=chunk_size, write_header=write_header,
-                                     write_mode=write_mode)
+                                     write_mode=write_mode, prefetch=prefetch)
                 write_mode = 'a'
                 write_header = False
 
     def _write_compound(self, catList, compound_dbo, filename,
-                        chunk_size=None, write_header=False, write_mode='a'):
+                        chunk_size=None, write_header=False, write_mode='a', prefetch=0):
         """
         Write out a set of InstanceCatalog instantiations that have been
         determined to query the same database table.
@@ -267,6 +273,9 @@ class CompoundInstanceCatalog(object):
 
         @param [in] write_mode is 'w' if you want to overwrite the output file or
         'a' if you want to append to an existing output file (default: 'w')
+
+        @param [in] prefetch is the number of chunks to query ahead of the
+        one being written, in a background thread (default 0)
         """
 
         colnames = []
@@ -286,10 +295,12 @@ class CompoundInstanceCatalog(object):
             master_colnames.append(localNames)
             name_map.append(local_map)
 
+        prefetch_kwargs = {'prefetch': prefetch} if prefetch > 0 else {}
         master_results = compound_dbo.query_columns(colnames=colnames,
                                                     obs_metadata=self._obs_metadata,
                                                     constraint=self._constraint,
-                                                    chunk_size=chunk_size)
+                                                    chunk_size=chunk_size,
+                                                    **prefetch_kwargs)
 
         with open(filename, write_mode) as file_handle:
             if write_header:
@@ -10,13 +10,21 @@ import inspect
 import re
 import copy
 from collections import OrderedDict
-from lsst.sims.utils import defaultSpecMap
-from lsst.sims.utils import ObservationMetaData
-from future.utils import with_metaclass
 
 __all__ = ["InstanceCatalog"]
 
 
+class _DefaultSpecMap(object):
+    """
+    The default InstanceCatalog.specFileMap: lsst.sims.utils.defaultSpecMap,
+    which is only imported when it is first used (lsst.sims.utils is slow
+    to import)
+    """
+    def __get__(self, instance, owner):
+        from lsst.sims.utils import defaultSpecMap
+        return defaultSpecMap
+
+
 class InstanceCatalogMeta(type):
     """Meta class for registering instance catalogs.
 
@@ -118,7 +126,7 @@ class _MimicRecordArray(object):
         return 0
 
 
-class InstanceCatalog(with_metaclass(InstanceCatalogMeta, object)):
+class InstanceCatalog(object, metaclass=InstanceCatalogMeta):
     """ Base class for instance catalogs generated by simulations.
 
     Instance catalogs include a dictionary of numpy arrays which contains
@@ -134,7 +142,7 @@ class InstanceCatalog(with_metaclass(InstanceCatalogMeta, object)):
     # These are the class attributes to be specified in any derived class:
     catalog_type = 'instance_catalog'
     column_outputs = None
-    specFileMap = defaultSpecMap
+    specFileMap = _DefaultSpecMap()
     default_columns = []
     cannot_be_null = None  # will be a list of columns which, if null, cause a row not to be printed by write_catalog()
                            # Note: these columns will be filtered on even if they are not included in column_outputs
@@ -147,6 +155,8 @@ class InstanceCatalog(with_metaclass(InstanceCatalogMeta, object)):
     endline = "\n"
     _pre_screen = False  # if true, write_catalog() will check database query results against
                          # cannot_be_null before calculating getter columns
+    chunk_layout = 'records'  # if 'columns', database query results are held as ColumnChunks of
+                              # contiguous per-column arrays rather than as numpy.recarrays
 
     @classmethod
     def new_catalog(cls, catalog_type, *args, **kwargs):
@@ -219,11 +229,13 @@ class InstanceCatalog(with_metaclass(InstanceCatalogMeta, object)):
 
         self.db_obj = db_obj
         self._current_chunk = None
+        self._getter_row_nbytes = None
 
         # this dict will contain information telling the user where the columns in
         # the catalog come from
         self._column_origins = {}
 
+        from lsst.sims.utils import ObservationMetaData
         if obs_metadata is not None:
             if not isinstance(obs_metadata, ObservationMetaData):
                 raise ValueError("You passed InstanceCatalog something that was not ObservationMetaData")
@@ -464,7 +476,8 @@ class InstanceCatalog(with_metaclass(InstanceCatalogMeta, object)):
                           self.endline)
 
     def write_catalog(self, filename, chunk_size=None,
-                      write_header=True, write_mode='w'):
+                      write_header=True, write_mode='w', prefetch=0,
+                      memory_budget=None):
         """
         Write query self.db_obj and write the resulting InstanceCatalog to
         an ASCII output file
@@ -480,6 +493,15 @@ class InstanceCatalog(with_metaclass(InstanceCatalogMeta, object)):
 
         @param [in] write_mode is 'w' if you want to overwrite the output file or
         'a' if you want to append to an existing output file (default: 'w')
+
+        @param [in] prefetch is the number of chunks to query ahead of the
+        one being written, in a background thread (default 0; only useful
+        if chunk_size or memory_budget is set)
+
+        @param [in] memory_budget is an optional number of bytes of memory
+        to use, in lieu of chunk_size.  The number of rows queried at a time
+        is derived from the size of the database rows and is reduced after
+        each chunk to account for the memory used by the catalog's getters.
         """
 
         self._write_pre_process()
@@ -488,10 +510,32 @@ class InstanceCatalog(with_metaclass(InstanceCatalogMeta, object)):
                               write_header=write_header,
                               write_mode=write_mode,
                               obs_metadata=self.obs_metadata,
-                              constraint=self.constraint)
+                              constraint=self.constraint,
+                              prefetch=prefetch,
+                              memory_budget=memory_budget)
+
+    def write_catalog_async(self, filename, chunk_size=None,
+                            write_header=True, write_mode='w', prefetch=0,
+                            memory_budget=None):
+        """
+        Return an awaitable which writes the catalog as write_catalog does,
+        for use from an asyncio event loop.  The catalog is queried and
+        written on a thread of its own, once the bound on the number of
+        queries and catalog writes in flight at once allows (see
+        CatalogDBObject.set_async_concurrency).  A catalog must not be
+        written more than once at the same time.
+
+        The parameters are as for write_catalog.
+        """
+        from lsst.sims.catalogs.db.AsyncQuery import run_blocking
+        return run_blocking(self.db_obj.connection, self.write_catalog, filename,
+                            chunk_size=chunk_size, write_header=write_header,
+                            write_mode=write_mode, prefetch=prefetch,
+                            memory_budget=memory_budget)
 
     def _query_and_write(self, filename, chunk_size=None, write_header=True,
-                         write_mode='w', obs_metadata=None, constraint=None):
+                         write_mode='w', obs_metadata=None, constraint=None,
+                         prefetch=0, memory_budget=None):
         """
         This method queries db_obj, and then writes the resulting recarray
         to the specified ASCII output file.
@@ -512,19 +556,54 @@ class InstanceCatalog(with_metaclass(InstanceCatalogMeta, object)):
 
         @param [in] write_mode is 'w' if you want to overwrite the output file or
         'a' if you want to append to an existing output file (default: 'w')
+
+        @param [in] prefetch is the number of chunks to query ahead of the
+        one being written, in a background thread (default 0)
+
+        @param [in] memory_budget is an optional number of bytes of memory
+        to use, in lieu of chunk_size
         """
 
         with open(filename, write_mode) as file_handle:
             if write_header:
                 self.write_header(file_handle)
 
-            query_result = self.db_obj.query_columns(colnames=self._active_columns,
-                                                     obs_metadata=obs_metadata,
-                                                     constraint=constraint,
-                                                     chunk_size=chunk_size)
+            query_result = self._query_db_obj(chunk_size=chunk_size,
+                                              obs_metadata=obs_metadata,
+                                              constraint=constraint,
+                                              prefetch=prefetch,
+                                              memory_budget=memory_budget)
 
+            self._getter_row_nbytes = None
             for chunk in query_result:
                 self._write_recarray(chunk, file_handle)
+                if memory_budget is not None and self._getter_row_nbytes is not None:
+                    query_result.set_row_overhead(self._getter_row_nbytes)
+
+    def _query_db_obj(self, chunk_size=None, obs_metadata=None, constraint=None,
+                      prefetch=0, memory_budget=None):
+        """
+        Query self.db_obj for the columns this catalog needs and return
+        the iterator over the resulting chunks.
+
+        prefetch, memory_budget and self.chunk_layout are only passed on to
+        db_obj.query_columns if they differ from their defaults, so that
+        db_obj classes which override query_columns without those
+        arguments continue to work.
+        """
+        query_kwargs = {}
+        if prefetch > 0:
+            query_kwargs['prefetch'] = prefetch
+        if memory_budget is not None:
+            query_kwargs['memory_budget'] = memory_budget
+        if self.chunk_layout != 'records':
+            query_kwargs['layout'] = self.chunk_layout
+
+        return self.db_obj.query_columns(colnames=self._active_columns,
+                                         obs_metadata=obs_metadata,
+                                         constraint=constraint,
+                                         chunk_size=chunk_size,
+                                         **query_kwargs)
 
     def _write_pre_process(self):
         """
@@ -629,10 +708,40 @@ class InstanceCatalog(with_metaclass(InstanceCatalogMeta, object)):
         if self._template is None:
             self._template = self._make_line_template(chunk_cols)
 
+        self._getter_row_nbytes = self._getter_nbytes_per_row(chunk_cols)
+
         # use a generator expression for lines rather than a list
         # for memory efficiency
         file_handle.writelines(self._template % line for line in zip(*chunk_cols))
 
+    def _getter_nbytes_per_row(self, chunk_cols):
+        """
+        Return the number of bytes per row of self._current_chunk taken up
+        by the arrays in chunk_cols and in the column cache that own their
+        data (i.e. the columns calculated by getters, rather than views
+        of the database query results)
+        """
+        if len(self._current_chunk) == 0:
+            return 0
+
+        columns = list(chunk_cols)
+        for cached in self._column_cache.values():
+            if isinstance(cached, OrderedDict):
+                columns.extend(cached.values())
+            else:
+                columns.append(cached)
+
+        nbytes = 0
+        counted = set()
+        for column in columns:
+            if isinstance(column, np.ndarray) and column.flags['OWNDATA'] and \
+               id(column) not in counted:
+
+                counted.add(id(column))
+                nbytes += column.nbytes
+
+        return nbytes//len(self._current_chunk)
+
     def _write_recarray(self, chunk, file_handle):
         """
         This method takes a recarray (usually returned by querying db_obj),
@@ -660,10 +769,9 @@ class InstanceCatalog(with_metaclass(InstanceCatalogMeta, object)):
         """
         self.db_required_columns()
 
-        query_result = self.db_obj.query_columns(colnames=self._active_columns,
-                                                 obs_metadata=self.obs_metadata,
-                                                 constraint=self.constraint,
-                                                 chunk_size=chunk_size)
+        query_result = self._query_db_obj(chunk_size=chunk_size,
+                                          obs_metadata=self.obs_metadata,
+                                          constraint=self.constraint)
 
         list_of_transform_keys = list(self.transformations.keys())
 
@@ -676,13 +784,18 @@ class InstanceCatalog(with_metaclass(InstanceCatalogMeta, object)):
             for line in zip(*chunk_cols):
                 yield line
 
-    def iter_catalog_chunks(self, chunk_size=None):
+    def iter_catalog_chunks(self, chunk_size=None, memory_budget=None):
         """
         Iterate over catalog contents one chunk at a time.
 
         chunk_size controls the number of catalog rows contained
         in each chunk.
 
+        Alternatively, memory_budget is a number of bytes of memory
+        each chunk may use; the number of rows in each chunk is then
+        derived from the size of the database rows and reduced after
+        each chunk to account for the memory used by the catalog's getters.
+
         The iterator will return a chunk of the database (a list of lists
         containing the contents of the datbase chunk).  The first dimension
         of the chunk corresponds to the columns of the catalog, i.e. chunk[0]
@@ -701,10 +814,10 @@ class InstanceCatalog(with_metaclass(InstanceCatalogMeta, object)):
         """
         self.db_required_columns()
 
-        query_result = self.db_obj.query_columns(colnames=self._active_columns,
-                                                 obs_metadata=self.obs_metadata,
-                                                 constraint=self.constraint,
-                                                 chunk_size=chunk_size)
+        query_result = self._query_db_obj(chunk_size=chunk_size,
+                                          obs_metadata=self.obs_metadata,
+                                          constraint=self.constraint,
+                                          memory_budget=memory_budget)
 
         list_of_transform_keys = list(self.transformations.keys())
 
@@ -714,6 +827,8 @@ class InstanceCatalog(with_metaclass(InstanceCatalogMeta, object)):
                           if col in list_of_transform_keys else
                           self.column_by_name(col)
                           for col in self.iter_column_names()]
+            if memory_budget is not None:
+                query_result.set_row_overhead(self._getter_nbytes_per_row(chunk_cols))
             chunkColMap = dict([(col, i) for i, col in enumerate(self.iter_column_names())])
             yield chunk_cols, chunkColMap
 
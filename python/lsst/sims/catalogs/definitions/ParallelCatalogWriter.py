@@ -2,7 +2,7 @@ from __future__ import print_function
 import copy
 
 
-__all__ = ["parallelCatalogWriter"]
+__all__ = ["parallelCatalogWriter", "parallelCatalogWriterAsync"]
 
 
 def parallelCatalogWriter(catalog_dict, chunk_size=None, constraint=None,
@@ -104,3 +104,21 @@ def parallelCatalogWriter(catalog_dict, chunk_size=None, constraint=None,
                 catalog_dict[file_name]._write_current_chunk(file_handle)
 
         local_write_mode = 'a'
+
+
+def parallelCatalogWriterAsync(catalog_dict, chunk_size=None, constraint=None,
+                               write_mode='w', write_header=True):
+    """
+    Return an awaitable which writes the catalogs in catalog_dict as
+    parallelCatalogWriter does, for use from an asyncio event loop.  The
+    catalogs are queried and written on a thread of their own, once the
+    bound on the number of queries and catalog writes in flight at once
+    allows (see CatalogDBObject.set_async_concurrency).
+
+    The parameters are as for parallelCatalogWriter.
+    """
+    from lsst.sims.catalogs.db.AsyncQuery import run_blocking
+    ref_cat = catalog_dict[list(catalog_dict.keys())[0]]
+    return run_blocking(ref_cat.db_obj.connection, parallelCatalogWriter, catalog_dict,
+                        chunk_size=chunk_size, constraint=constraint,
+                        write_mode=write_mode, write_header=write_header)
@@ -4,7 +4,7 @@ from builtins import range
 import sqlite3
 import numpy as np
 
-from lsst.sims.catalogs.db import CatalogDBObject
+from lsst.sims.catalogs.db import CatalogDBObject, get_sqlite_profile, set_sqlite_pragmas
 
 __all__ = ["getOneChunk", "writeResult", "sampleSphere", "myTestGals",
            "makeGalTestDB", "myTestStars", "makeStarTestDB"]
@@ -114,6 +114,8 @@ def makeGalTestDB(filename='testDatabase.db', size=1000, seedVal=None,
     that the objects are clustered around the bore site for a unit test
     """
     conn = sqlite3.connect(filename)
+    # the test databases can always be rebuilt, so they need not be journaled
+    set_sqlite_pragmas(conn, get_sqlite_profile('bulk_load')['pragmas'])
     c = conn.cursor()
     try:
         c.execute('''CREATE TABLE galaxies
@@ -229,6 +231,8 @@ def makeStarTestDB(filename='testDatabase.db', size=1000, seedVal=None,
     that the objects are clustered around the bore site for a unit test
     """
     conn = sqlite3.connect(filename)
+    # the test databases can always be rebuilt, so they need not be journaled
+    set_sqlite_pragmas(conn, get_sqlite_profile('bulk_load')['pragmas'])
     c = conn.cursor()
     try:
         c.execute('''CREATE TABLE stars
@@ -0,0 +1,160 @@
+from __future__ import with_statement
+from builtins import range
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+import unittest
+import tempfile
+import shutil
+import numpy as np
+
+import lsst.utils.tests
+from lsst.sims.utils.CodeUtilities import sims_clean_up
+from lsst.sims.catalogs.db import CatalogDBObject
+from lsst.sims.catalogs.definitions import InstanceCatalog, parallelCatalogWriterAsync
+
+ROOT = os.path.abspath(os.path.dirname(__file__))
+
+
+def setup_module(module):
+    lsst.utils.tests.init()
+
+
+class dbForAsyncTest(CatalogDBObject):
+    objid = 'asyncTest'
+    tableid = 'test'
+    idColKey = 'id'
+    driver = 'sqlite'
+
+    # track how many queries are postprocessing a chunk at once
+    lock = threading.Lock()
+    n_active = 0
+    max_active = 0
+
+    def _final_pass(self, results):
+        with self.lock:
+            dbForAsyncTest.n_active += 1
+            dbForAsyncTest.max_active = max(dbForAsyncTest.max_active, dbForAsyncTest.n_active)
+        time.sleep(0.02)
+        with self.lock:
+            dbForAsyncTest.n_active -= 1
+        return results
+
+
+class AsyncTestCatalog(InstanceCatalog):
+    column_outputs = ['id', 'i1', 'f1']
+
+
+class AsyncQueryTestCase(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.scratch_dir = tempfile.mkdtemp(dir=ROOT, prefix='AsyncQueryTestCase')
+        cls.db_name = os.path.join(cls.scratch_dir, 'testAsyncQueryDB.db')
+        with sqlite3.connect(cls.db_name) as conn:
+            c = conn.cursor()
+            c.execute('''CREATE TABLE test (id int PRIMARY KEY, i1 int, f1 real)''')
+            c.executemany('''INSERT INTO test VALUES (?, ?, ?)''',
+                          ((ii, ii*ii, 0.5*ii) for ii in range(100)))
+            conn.commit()
+
+    @classmethod
+    def tearDownClass(cls):
+        sims_clean_up()
+        if os.path.exists(cls.scratch_dir):
+            shutil.rmtree(cls.scratch_dir)
+
+    def setUp(self):
+        dbForAsyncTest.max_active = 0
+
+    def tearDown(self):
+        CatalogDBObject.set_async_concurrency(8)
+
+    def test_query_columns_async(self):
+        """
+        Test that concurrent asynchronous queries return the same chunks as
+        query_columns, with no more queries in flight than allowed
+        """
+        db = dbForAsyncTest(database=self.db_name)
+        constraints = ['id < %d' % nn for nn in (20, 40, 60, 80)]
+        expected = [list(db.query_columns(['id', 'f1'], constraint=constraint, chunk_size=7))
+                    for constraint in constraints]
+
+        async def query(constraint):
+            chunks = []
+            async for chunk in db.query_columns_async(['id', 'f1'], constraint=constraint,
+                                                      chunk_size=7):
+                chunks.append(chunk)
+            return chunks
+
+        async def query_all():
+            return await asyncio.gather(*[query(constraint) for constraint in constraints])
+
+        CatalogDBObject.set_async_concurrency(2)
+        dbForAsyncTest.max_active = 0
+        results = asyncio.run(query_all())
+        self.assertEqual(dbForAsyncTest.max_active, 2)
+
+        for chunks, expected_chunks in zip(results, expected):
+            self.assertEqual(len(chunks), len(expected_chunks))
+            for chunk, expected_chunk in zip(chunks, expected_chunks):
+                np.testing.assert_array_equal(chunk, expected_chunk)
+
+    def test_aclose(self):
+        """
+        Test that closing an asynchronous query early frees its place
+        for the next one
+        """
+        db = dbForAsyncTest(database=self.db_name)
+
+        async def query():
+            async with db.query_columns_async(['id'], chunk_size=10) as chunks:
+                async for chunk in chunks:
+                    return chunk
+
+        async def query_twice():
+            first = await asyncio.wait_for(query(), 10.0)
+            second = await asyncio.wait_for(query(), 10.0)
+            return first, second
+
+        CatalogDBObject.set_async_concurrency(1)
+        first, second = asyncio.run(query_twice())
+        np.testing.assert_array_equal(first['id'], np.arange(10))
+        np.testing.assert_array_equal(second['id'], np.arange(10))
+
+    def test_write_catalog_async(self):
+        """
+        Test that catalogs written asynchronously match those written by
+        write_catalog and parallelCatalogWriter
+        """
+        db = dbForAsyncTest(database=self.db_name)
+        control_name = os.path.join(self.scratch_dir, 'async_control.txt')
+        AsyncTestCatalog(db).write_catalog(control_name, chunk_size=9)
+        with open(control_name, 'r') as input_file:
+            control = input_file.read()
+
+        file_names = [os.path.join(self.scratch_dir, 'async_cat_%d.txt' % ii) for ii in range(3)]
+        parallel_name = os.path.join(self.scratch_dir, 'async_parallel.txt')
+
+        async def write_all():
+            writes = [AsyncTestCatalog(db).write_catalog_async(file_name, chunk_size=9)
+                      for file_name in file_names]
+            writes.append(parallelCatalogWriterAsync({parallel_name: AsyncTestCatalog(db)},
+                                                     chunk_size=9))
+            await asyncio.gather(*writes)
+
+        asyncio.run(write_all())
+        for file_name in file_names + [parallel_name]:
+            with open(file_name, 'r') as input_file:
+                self.assertEqual(input_file.read(), control)
+
+
+class MemoryTestClass(lsst.utils.tests.MemoryTestCase):
+    pass
+
+
+if __name__ == "__main__":
+    lsst.utils.tests.init()
+    unittest.main()
@@ -3,19 +3,26 @@ from __future__ import print_function
 from builtins import zip
 from builtins import str
 from builtins import super
+from builtins import next
 import os
 import sqlite3
 import sys
 import json
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
 
 import unittest
 import numpy as np
 import tempfile
 import shutil
 import lsst.utils.tests
+from sqlalchemy import text
 from lsst.sims.utils.CodeUtilities import sims_clean_up
 from lsst.sims.utils import ObservationMetaData
-from lsst.sims.catalogs.db import CatalogDBObject, fileDBObject
+from lsst.sims.catalogs.db import (CatalogDBObject, fileDBObject, ChunkIterator,
+                                  ColumnChunk, PartitionedChunkIterator)
 import lsst.sims.catalogs.utils.testUtils as tu
 from lsst.sims.catalogs.utils.testUtils import myTestStars, myTestGals
 from lsst.sims.utils import haversine
@@ -34,6 +41,19 @@ class dbForQueryColumnsTest(CatalogDBObject):
     dbDefaultValues = {'i2': -1, 'i3': -2}
 
 
+class dbForStreamingTest(CatalogDBObject):
+    objid = 'streamingTest'
+    tableid = 'streamingTest'
+    idColKey = 'id'
+    raColName = 'ra'
+    decColName = 'decl'
+    columns = [('id', None, int),
+               ('ra', None),
+               ('decl', None),
+               ('mag', None),
+               ('sedFilename', 'sed', str, 10)]
+
+
 class myNonsenseDB(CatalogDBObject):
     objid = 'Nonsense'
     tableid = 'test'
@@ -471,6 +491,366 @@ class CatalogDBObjectTestCase(unittest.TestCase):
                 self.assertEqual(len(row), 5)
         self.assertGreater(ct, 0)
 
+    def testColumnarConversion(self):
+        """
+        Test that converting query results column-by-column straight from
+        the DBAPI cursor gives the same recarrays as converting them
+        row-by-row through sqlalchemy
+        """
+        db_name = os.path.join(self.scratch_dir, 'testCatalogDBObjectDatabase.db')
+        mystars = testCatalogDBObjectTestStars(database=db_name)
+        mycolumns = ['id', 'raJ2000', 'decJ2000', 'umag', 'varParamStr']
+        query = mystars._get_column_query(mycolumns)
+
+        for chunk_size in (None, 700):
+            columnar_iter = ChunkIterator(mystars, query, chunk_size)
+            self.assertTrue(columnar_iter.columnar)
+            row_iter = ChunkIterator(mystars, query, chunk_size, columnar=False)
+            self.assertFalse(row_iter.columnar)
+
+            ct = 0
+            for columnar_chunk, row_chunk in zip(columnar_iter, row_iter):
+                self.assertIsInstance(columnar_chunk, np.recarray)
+                self.assertEqual(columnar_chunk.dtype, row_chunk.dtype)
+                self.assertEqual(len(columnar_chunk), len(row_chunk))
+                for name in mycolumns:
+                    np.testing.assert_array_equal(columnar_chunk[name], row_chunk[name])
+                ct += len(columnar_chunk)
+
+            self.assertEqual(ct, 5000)
+            self.assertRaises(StopIteration, next, columnar_iter)
+
+    def testPrefetch(self):
+        """
+        Test that query_columns returns the same chunks when they are
+        prefetched in a background thread, that errors raised while
+        prefetching are propagated, and that closing the iterator early
+        stops the background thread
+        """
+        db_name = os.path.join(self.scratch_dir, 'testCatalogDBObjectDatabase.db')
+        mystars = testCatalogDBObjectTestStars(database=db_name)
+        mycolumns = ['id', 'raJ2000', 'decJ2000', 'umag', 'varParamStr']
+
+        for chunk_size in (None, 700):
+            control_iter = mystars.query_columns(mycolumns, chunk_size=chunk_size)
+            prefetch_iter = mystars.query_columns(mycolumns, chunk_size=chunk_size, prefetch=2)
+
+            ct = 0
+            for control_chunk, prefetch_chunk in zip(control_iter, prefetch_iter):
+                self.assertEqual(control_chunk.dtype, prefetch_chunk.dtype)
+                for name in mycolumns:
+                    np.testing.assert_array_equal(control_chunk[name], prefetch_chunk[name])
+                ct += len(prefetch_chunk)
+
+            self.assertEqual(ct, 5000)
+            self.assertRaises(StopIteration, next, prefetch_iter)
+            self.assertRaises(StopIteration, next, prefetch_iter)
+
+        bad_iter = mystars.get_arbitrary_chunk_iterator('SELECT * FROM nonsense_table',
+                                                        chunk_size=10, prefetch=2)
+        with self.assertRaises(Exception):
+            next(bad_iter)
+        self.assertRaises(StopIteration, next, bad_iter)
+
+        prefetch_iter = mystars.query_columns(mycolumns, chunk_size=100, prefetch=2)
+        thread = prefetch_iter._prefetch_thread
+        chunk = next(prefetch_iter)
+        self.assertEqual(len(chunk), 100)
+        prefetch_iter.close()
+        self.assertFalse(thread.is_alive())
+        self.assertRaises(StopIteration, next, prefetch_iter)
+
+        # the catalog's own queries still work afterwards
+        results = mystars.query_columns(mycolumns)
+        self.assertEqual(len(next(results)), 5000)
+
+    def testPartitionedQuery(self):
+        """
+        Test that query_columns_partitioned returns the same rows as
+        query_columns, whichever way it partitions the query
+        """
+        db_name = os.path.join(self.scratch_dir, 'testCatalogDBObjectDatabase.db')
+        mystars = testCatalogDBObjectTestStars(database=db_name)
+        mycolumns = ['id', 'raJ2000', 'decJ2000', 'umag']
+        obs = ObservationMetaData(pointingRA=50.0, pointingDec=-30.0,
+                                  boundType='circle', boundLength=40.0)
+
+        for obs_metadata in (None, obs):
+            control = next(mystars.query_columns(mycolumns, obs_metadata=obs_metadata,
+                                                 constraint='umag > 12.0'))
+            control = control[np.argsort(control['id'])]
+            self.assertGreater(len(control), 0)
+
+            for partition_by in ('id', 'dec'):
+                query = mystars._get_column_query(mycolumns)
+                if obs_metadata is not None:
+                    query = mystars.filter(query, obs_metadata.bounds)
+                query = query.filter(text('umag > 12.0'))
+                queries = mystars._partition_query(query, 5, partition_by)
+                self.assertEqual(len(queries), 5)
+                ordered_control = np.concatenate([next(ChunkIterator(mystars, partition, None))
+                                                  for partition in queries])
+
+                for ordered in (True, False):
+                    chunk_iter = mystars.query_columns_partitioned(mycolumns,
+                                                                   chunk_size=100,
+                                                                   obs_metadata=obs_metadata,
+                                                                   constraint='umag > 12.0',
+                                                                   n_partitions=5,
+                                                                   n_workers=3,
+                                                                   partition_by=partition_by,
+                                                                   ordered=ordered)
+                    chunks = list(chunk_iter)
+                    self.assertRaises(StopIteration, next, chunk_iter)
+                    for chunk in chunks:
+                        self.assertLessEqual(len(chunk), 100)
+                    results = np.concatenate(chunks)
+                    if ordered:
+                        # the partitions should be returned one after the other
+                        for name in mycolumns:
+                            np.testing.assert_array_equal(results[name], ordered_control[name])
+                    results = results[np.argsort(results['id'])]
+                    for name in mycolumns:
+                        np.testing.assert_array_equal(results[name], control[name])
+
+        with self.assertRaises(ValueError):
+            mystars.query_columns_partitioned(mycolumns, partition_by='nonsense')
+
+        # errors in the partitions are raised by the iterator
+        query = mystars._get_column_query(mycolumns)
+        chunk_iter = PartitionedChunkIterator(mystars, [query, 'SELECT * FROM nonsense_table'],
+                                              chunk_size=100, ordered=False)
+        with self.assertRaises(Exception):
+            list(chunk_iter)
+        self.assertRaises(StopIteration, next, chunk_iter)
+
+        # test closing the iterator before it is exhausted
+        chunk_iter = mystars.query_columns_partitioned(mycolumns, chunk_size=10)
+        workers = list(chunk_iter._workers)
+        self.assertEqual(len(next(chunk_iter)), 10)
+        chunk_iter.close()
+        for worker in workers:
+            self.assertFalse(worker.is_alive())
+        self.assertRaises(StopIteration, next, chunk_iter)
+
+    def testPartitionedQueryStringId(self):
+        """
+        Test that a query cannot be partitioned on a text id column, but
+        can be partitioned on Dec
+        """
+        txt_file_name = os.path.join(self.scratch_dir, 'partition_string_id.txt')
+        with open(txt_file_name, 'w') as output_file:
+            output_file.write('# name ra dec\n')
+            for ii in range(50):
+                output_file.write('star_%02d %.2f %.2f\n' % (ii, 2.0*ii, ii - 25.0))
+
+        dtype = np.dtype([('name', str, 10), ('ra', float), ('dec', float)])
+
+        class StringIdFileDB(fileDBObject):
+            objid = 'partitionStringIdFileDB'
+            idColKey = 'name'
+            raColName = 'ra'
+            decColName = 'dec'
+
+        db = StringIdFileDB(txt_file_name, runtable='test', dtype=dtype)
+        with self.assertRaises(ValueError) as context:
+            db.query_columns_partitioned(['name', 'dec'], n_partitions=3, partition_by='id')
+        self.assertIn("partition_by='dec'", str(context.exception))
+
+        results = np.concatenate(list(db.query_columns_partitioned(['name', 'dec'], n_partitions=3,
+                                                                   partition_by='dec')))
+        self.assertEqual(sorted(results['name']), ['star_%02d' % ii for ii in range(50)])
+
+    def testNumpySpatialFilter(self):
+        """
+        Test that filtering on a bounding box in SQL and cutting to the exact
+        bounds in numpy returns the rows inside the bounds, including for
+        bounds which wrap around RA=0 or contain a pole
+        """
+        db_name = os.path.join(self.scratch_dir, 'testCatalogDBObjectDatabase.db')
+        mystars = testCatalogDBObjectTestStars(database=db_name)
+        mycolumns = ['id', 'raJ2000', 'decJ2000', 'umag']
+
+        obs_list = [ObservationMetaData(pointingRA=50.0, pointingDec=-30.0,
+                                        boundType='circle', boundLength=40.0),
+                    ObservationMetaData(pointingRA=2.0, pointingDec=10.0,
+                                        boundType='circle', boundLength=15.0),
+                    ObservationMetaData(pointingRA=355.0, pointingDec=-60.0,
+                                        boundType='circle', boundLength=20.0),
+                    ObservationMetaData(pointingRA=120.0, pointingDec=80.0,
+                                        boundType='circle', boundLength=15.0),
+                    ObservationMetaData(pointingRA=200.0, pointingDec=-89.0,
+                                        boundType='circle', boundLength=5.0),
+                    ObservationMetaData(pointingRA=100.0, pointingDec=0.0,
+                                        boundType='box', boundLength=10.0),
+                    ObservationMetaData(pointingRA=358.0, pointingDec=20.0,
+                                        boundType='box', boundLength=np.array([15.0, 10.0]))]
+
+        all_stars = next(mystars.query_columns(mycolumns))
+
+        for obs in obs_list:
+            if obs.boundType == 'circle':
+                in_bounds = haversine(all_stars['raJ2000'], all_stars['decJ2000'],
+                                      obs._pointingRA, obs._pointingDec) < np.radians(obs.boundLength)
+            else:
+                half_width = np.atleast_1d(obs.boundLength)[0]
+                half_height = np.atleast_1d(obs.boundLength)[-1]
+                d_ra = (np.degrees(all_stars['raJ2000']) - obs.pointingRA + 180.0) % 360.0 - 180.0
+                d_dec = np.degrees(all_stars['decJ2000']) - obs.pointingDec
+                in_bounds = (np.abs(d_ra) <= half_width) & (np.abs(d_dec) <= half_height)
+            control = all_stars[in_bounds]
+            self.assertGreater(len(control), 0)
+            for chunk_size, layout in ((None, 'records'), (100, 'records'), (100, 'columns')):
+                chunks = list(mystars.query_columns(mycolumns, obs_metadata=obs,
+                                                    chunk_size=chunk_size, layout=layout,
+                                                    spatial_filter='numpy'))
+                for chunk in chunks:
+                    self.assertEqual(chunk.dtype, control.dtype)
+                results = np.concatenate([chunk.to_recarray() if layout == 'columns' else chunk
+                                          for chunk in chunks])
+                np.testing.assert_array_equal(np.sort(results['id']), np.sort(control['id']))
+
+        # the database is only sent a bounding box
+        query = mystars._filter_bounding_box(mystars._get_column_query(mycolumns),
+                                             [obs_list[1].bounds])
+        self.assertNotIn('ASIN', str(query.statement).upper())
+
+        with self.assertRaises(ValueError):
+            mystars.query_columns(mycolumns, spatial_filter='nonsense')
+
+    def testQueryColumnsMulti(self):
+        """
+        Test that query_columns_multi returns, for each pointing, the rows
+        query_columns returns for that pointing
+        """
+        db_name = os.path.join(self.scratch_dir, 'testCatalogDBObjectDatabase.db')
+        mystars = testCatalogDBObjectTestStars(database=db_name)
+        mycolumns = ['id', 'raJ2000', 'decJ2000', 'umag']
+
+        rng = np.random.RandomState(5512)
+        obs_list = [ObservationMetaData(pointingRA=ra, pointingDec=dec,
+                                        boundType='circle', boundLength=12.0)
+                    for ra, dec in zip((rng.random_sample(20)*40.0-20.0) % 360.0,
+                                       rng.random_sample(20)*40.0-20.0)]
+        obs_list.append(ObservationMetaData(pointingRA=5.0, pointingDec=-5.0,
+                                            boundType='box', boundLength=8.0))
+        obs_list.append(ObservationMetaData(pointingRA=180.0, pointingDec=-85.0,
+                                            boundType='circle', boundLength=10.0))
+
+        for chunk_size, layout in ((None, 'records'), (300, 'records'), (300, 'columns')):
+            results = {}
+            for i_obs, chunk in mystars.query_columns_multi(obs_list, colnames=mycolumns,
+                                                            chunk_size=chunk_size,
+                                                            constraint='umag > 21.0',
+                                                            layout=layout):
+                if layout == 'columns':
+                    self.assertIsInstance(chunk, ColumnChunk)
+                    chunk = chunk.to_recarray()
+                self.assertGreater(len(chunk), 0)
+                results.setdefault(i_obs, []).append(chunk)
+
+            for i_obs, obs in enumerate(obs_list):
+                control = np.concatenate(list(mystars.query_columns(mycolumns, obs_metadata=obs,
+                                                                    constraint='umag > 21.0',
+                                                                    spatial_filter='numpy')))
+                self.assertGreater(len(control), 0)
+                test = np.concatenate(results[i_obs])
+                self.assertEqual(test.dtype, control.dtype)
+                np.testing.assert_array_equal(np.sort(test['id']), np.sort(control['id']))
+
+        with self.assertRaises(ValueError):
+            mystars.query_columns_multi([])
+
+    def testColumnLayout(self):
+        """
+        Test that query_columns with layout='columns' returns ColumnChunks
+        containing the same data as the recarrays it returns by default
+        """
+        db_name = os.path.join(self.scratch_dir, 'testCatalogDBObjectDatabase.db')
+        mystars = testCatalogDBObjectTestStars(database=db_name)
+        mycolumns = ['id', 'raJ2000', 'decJ2000', 'umag', 'varParamStr']
+
+        for columnar in (True, False):
+            for chunk_size in (None, 700):
+                query = mystars._get_column_query(mycolumns)
+                records_iter = ChunkIterator(mystars, query, chunk_size, columnar=columnar)
+                columns_iter = ChunkIterator(mystars, query, chunk_size, columnar=columnar,
+                                             layout='columns')
+                ct = 0
+                for records_chunk, columns_chunk in zip(records_iter, columns_iter):
+                    self.assertIsInstance(columns_chunk, ColumnChunk)
+                    self.assertEqual(columns_chunk.dtype, records_chunk.dtype)
+                    self.assertEqual(len(columns_chunk), len(records_chunk))
+                    for name in mycolumns:
+                        self.assertTrue(columns_chunk[name].flags['C_CONTIGUOUS'])
+                        np.testing.assert_array_equal(columns_chunk[name], records_chunk[name])
+                    ct += len(columns_chunk)
+                self.assertEqual(ct, 5000)
+
+        results = mystars.query_columns(mycolumns, layout='columns')
+        self.assertIsInstance(next(results), ColumnChunk)
+
+        with self.assertRaises(ValueError):
+            mystars.query_columns(mycolumns, layout='nonsense')
+
+    @unittest.skipIf(tracemalloc is None, "tracemalloc is not available")
+    def testStreaming(self):
+        """
+        Test that streamed queries return all of the rows while only
+        holding about chunk_size rows in memory at a time
+        """
+        db_name = os.path.join(self.scratch_dir, 'testCatalogDBObjectStreamingDB.db')
+        if os.path.exists(db_name):
+            os.unlink(db_name)
+
+        n_rows = 100000
+        rng = np.random.RandomState(4412)
+        ra = rng.random_sample(n_rows)*360.0
+        with sqlite3.connect(db_name) as conn:
+            c = conn.cursor()
+            c.execute('''CREATE TABLE streamingTest
+                      (id int PRIMARY KEY, ra real, decl real, mag real, sed text)''')
+            c.executemany('''INSERT INTO streamingTest VALUES (?, ?, ?, ?, ?)''',
+                          ((ii, ra[ii], 0.0, 20.0, 'sed_%d' % (ii % 100))
+                           for ii in rng.permutation(n_rows).tolist()))
+            conn.commit()
+
+        db = dbForStreamingTest(database=db_name, driver='sqlite')
+        full_result = next(db.query_columns())
+        self.assertEqual(len(full_result), n_rows)
+
+        # sqlite does not have server-side cursors, so the query is
+        # paginated on idColKey
+        chunk_iter = db.query_columns(chunk_size=2000, stream=True)
+        self.assertIsNotNone(chunk_iter._keyset_column)
+
+        tracemalloc.start()
+        try:
+            ct = 0
+            last_id = -1
+            for chunk in chunk_iter:
+                self.assertLessEqual(len(chunk), 2000)
+                self.assertGreater(chunk['id'][0], last_id)
+                np.testing.assert_array_equal(chunk['ra'], ra[chunk['id']])
+                last_id = chunk['id'][-1]
+                ct += len(chunk)
+            high_water = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+        self.assertEqual(ct, n_rows)
+        self.assertLess(high_water, full_result.nbytes/4)
+
+        # test that limit and constraints are respected while paginating
+        for prefetch in (0, 2):
+            chunk_iter = db.query_columns(chunk_size=700, stream=True, limit=2001,
+                                          constraint='id % 2 = 0', prefetch=prefetch)
+            ids = np.concatenate([chunk['id'] for chunk in chunk_iter])
+            np.testing.assert_array_equal(ids, np.arange(0, 4002, 2))
+
+        if os.path.exists(db_name):
+            os.unlink(db_name)
+
     def testClassVariables(self):
         """
         Make sure that the daughter classes of CatalogDBObject properly overwrite the member
@@ -586,6 +966,46 @@ class CatalogDBObjectTestCase(unittest.TestCase):
 
         self.assertGreater(ct, 0)
 
+    def testQueryColumnsDefaultsAllTypes(self):
+        """
+        Test that dbDefaultValues replace NULLs and other false values
+        (0, '') in int, float and string columns, whether the query results
+        are converted straight from the cursor or through sqlalchemy rows
+        """
+        db_name = os.path.join(self.scratch_dir, 'testDefaultsAllTypes.db')
+        with sqlite3.connect(db_name) as conn:
+            c = conn.cursor()
+            c.execute('''CREATE TABLE defaults_test (id int, ii int, ff real, ss text)''')
+            values = [(0, 1, 1.5, 'a'),
+                      (1, None, None, None),
+                      (2, 0, 0.0, ''),
+                      (3, 4, 2.5, 'b'),
+                      (4, None, 3.5, 'c')]
+            c.executemany('''INSERT INTO defaults_test VALUES (?, ?, ?, ?)''', values)
+            conn.commit()
+
+        class DefaultsTestDBObject(CatalogDBObject):
+            objid = 'defaults_all_types_test'
+            tableid = 'defaults_test'
+            idColKey = 'id'
+            columns = [('id', None, int),
+                       ('ii', None, int),
+                       ('ff', None, float),
+                       ('ss', None, str, 5)]
+            dbDefaultValues = {'ii': -99, 'ff': -1.25, 'ss': 'none'}
+
+        db = DefaultsTestDBObject(database=db_name, driver='sqlite')
+        query = db._get_column_query(['id', 'ii', 'ff', 'ss'])
+        for columnar in (True, False):
+            results = ChunkIterator(db, query, 2, columnar=columnar)
+            chunk = np.concatenate([cc for cc in results])
+            np.testing.assert_array_equal(chunk['id'], [0, 1, 2, 3, 4])
+            np.testing.assert_array_equal(chunk['ii'], [1, -99, -99, 4, -99])
+            np.testing.assert_array_equal(chunk['ff'], [1.5, -1.25, -1.25, 2.5, 3.5])
+            np.testing.assert_array_equal(chunk['ss'], ['a', 'none', 'none', 'b', 'c'])
+            self.assertEqual(str(chunk.dtype['ii']), 'int64')
+            self.assertEqual(str(chunk.dtype['ff']), 'float64')
+
     # The tests below all replicate tests above, except with CatalogDBObjects whose
     # connection was passed directly in from the constructor, in order to make sure
     # that passing a connection in works.
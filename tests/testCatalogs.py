@@ -366,6 +366,44 @@ class InstanceCatalogTestCase(unittest.TestCase):
         if os.path.exists(cat_name):
             os.unlink(cat_name)
 
+    def test_memory_budget(self):
+        """
+        Test that write_catalog and iter_catalog_chunks return the same
+        results when given a memory_budget instead of a chunk_size, and
+        that the chunks shrink to account for the memory used by getters
+        """
+        obs = ObservationMetaData(pointingRA=10.0, pointingDec=-20.0,
+                                  boundLength=50.0, boundType='circle')
+
+        cat = CustomCatalog(self.starDB, obs_metadata=obs)
+        cat_name = os.path.join(self.scratch_dir, 'memory_budget_control.txt')
+        cat.write_catalog(cat_name)
+        with open(cat_name, 'r') as in_file:
+            control_lines = in_file.readlines()
+        self.assertGreater(len(control_lines), 1)
+
+        cat = CustomCatalog(self.starDB, obs_metadata=obs)
+        budget_name = os.path.join(self.scratch_dir, 'memory_budget_test.txt')
+        cat.write_catalog(budget_name, memory_budget=2000)
+        with open(budget_name, 'r') as in_file:
+            self.assertEqual(in_file.readlines(), control_lines)
+
+        row_nbytes = self.starDB._get_results_dtype(cat._active_columns).itemsize
+        cat = CustomCatalog(self.starDB, obs_metadata=obs)
+        chunk_lengths = []
+        for chunk, chunk_map in cat.iter_catalog_chunks(memory_budget=2000):
+            chunk_lengths.append(len(chunk[0]))
+        self.assertEqual(sum(chunk_lengths), len(control_lines)-1)
+        self.assertGreater(len(chunk_lengths), 2)
+        self.assertEqual(chunk_lengths[0], 2000//row_nbytes)
+        self.assertLess(chunk_lengths[1], chunk_lengths[0])
+
+        with self.assertRaises(ValueError):
+            self.starDB.query_columns(chunk_size=10, memory_budget=2000)
+
+        for name in (cat_name, budget_name):
+            if os.path.exists(name):
+                os.unlink(name)
 
 
 class boundingBoxTest(unittest.TestCase):
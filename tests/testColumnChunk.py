@@ -0,0 +1,82 @@
+from __future__ import with_statement
+import unittest
+import numpy as np
+
+import lsst.utils.tests
+from lsst.sims.catalogs.db import ColumnChunk
+
+
+def setup_module(module):
+    lsst.utils.tests.init()
+
+
+class ColumnChunkTestCase(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.RandomState(8812)
+        self.records = np.recarray(20, dtype=np.dtype([('id', int), ('ra', float),
+                                                        ('sed', (str, 10))]))
+        self.records['id'] = np.arange(20)
+        self.records['ra'] = rng.random_sample(20)*360.0
+        self.records['sed'] = ['sed_%d' % ii for ii in range(20)]
+
+    def test_columns(self):
+        """
+        Test that a ColumnChunk holds contiguous copies of the columns
+        of the recarray it was built from
+        """
+        chunk = ColumnChunk.from_recarray(self.records)
+        self.assertEqual(len(chunk), 20)
+        self.assertEqual(chunk.dtype, self.records.dtype)
+        self.assertEqual(chunk.dtype.names, ('id', 'ra', 'sed'))
+        self.assertIn('ra', chunk)
+        for name in self.records.dtype.names:
+            self.assertTrue(chunk[name].flags['C_CONTIGUOUS'])
+            np.testing.assert_array_equal(chunk[name], self.records[name])
+
+        with self.assertRaises(ValueError):
+            chunk['nonsense']
+
+        chunk['ra'] = 2.0*self.records['ra']
+        np.testing.assert_array_equal(chunk['ra'], 2.0*self.records['ra'])
+        with self.assertRaises(ValueError):
+            chunk['nonsense'] = 1.0
+
+        with self.assertRaises(ValueError):
+            ColumnChunk([('a', np.zeros(3)), ('b', np.zeros(4))])
+
+    def test_indexing(self):
+        """
+        Test that indexing a ColumnChunk behaves like indexing a recarray
+        """
+        chunk = ColumnChunk.from_recarray(self.records)
+        mask = self.records['ra'] > 180.0
+        for key in (mask, np.where(mask), np.where(mask)[0], slice(3, 11, 2)):
+            sub_chunk = chunk[key]
+            self.assertIsInstance(sub_chunk, ColumnChunk)
+            sub_records = self.records[key]
+            self.assertEqual(len(sub_chunk), len(sub_records))
+            for name in self.records.dtype.names:
+                np.testing.assert_array_equal(sub_chunk[name], sub_records[name])
+
+        sub_chunk = chunk[['sed', 'id']]
+        self.assertEqual(sub_chunk.dtype.names, ('sed', 'id'))
+        np.testing.assert_array_equal(sub_chunk['id'], self.records['id'])
+
+        for ii in (0, 7, -1):
+            self.assertEqual(chunk[ii]['id'], self.records[ii]['id'])
+            self.assertEqual(chunk[ii]['sed'], self.records[ii]['sed'])
+
+        records = chunk.to_recarray()
+        self.assertIsInstance(records, np.recarray)
+        np.testing.assert_array_equal(records, self.records)
+        self.assertEqual([row['id'] for row in chunk], list(range(20)))
+
+
+class MemoryTestClass(lsst.utils.tests.MemoryTestCase):
+    pass
+
+
+if __name__ == "__main__":
+    lsst.utils.tests.init()
+    unittest.main()
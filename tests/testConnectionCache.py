@@ -3,6 +3,7 @@ from builtins import range
 import unittest
 import sqlite3
 import os
+import json
 import numpy as np
 import tempfile
 import shutil
@@ -10,6 +11,7 @@ import shutil
 import lsst.utils.tests
 from lsst.sims.utils.CodeUtilities import sims_clean_up
 from lsst.sims.catalogs.db import CatalogDBObject, DBObject
+from lsst.sims.catalogs.db.dbConnection import DBConnection
 
 ROOT = os.path.abspath(os.path.dirname(__file__))
 
@@ -117,6 +119,156 @@ class CachingTestCase(unittest.TestCase):
         np.testing.assert_array_equal(results['i1'], results['other'])
         np.testing.assert_array_equal(results['id']*(-1), results['i2'])
 
+    def test_cache_eviction(self):
+        """
+        Test that the connection cache counts hits and misses, and evicts
+        the least recently used connection when it is full
+        """
+        sims_clean_up()
+        db_names = []
+        for ii in range(3):
+            db_names.append(os.path.join(self.scratch_dir, 'connection_cache_lru_%d.db' % ii))
+            shutil.copyfile(self.db_name, db_names[-1])
+
+        class DbClass4(CatalogDBObject):
+            driver = 'sqlite'
+            tableid = 'test'
+            idColKey = 'id'
+            objid = 'test_db_class_4'
+
+            columns = [('identification', 'id')]
+
+        CatalogDBObject.set_connection_cache_size(2)
+        try:
+            info = CatalogDBObject.connection_cache_info()
+            self.assertEqual(info['size'], 0)
+            self.assertEqual(info['max_size'], 2)
+
+            db0 = DbClass4(database=db_names[0])
+            db1 = DbClass4(database=db_names[1])
+            self.assertIs(DbClass4(database=db_names[0]).connection, db0.connection)
+            new_info = CatalogDBObject.connection_cache_info()
+            self.assertEqual(new_info['misses'] - info['misses'], 2)
+            self.assertEqual(new_info['hits'] - info['hits'], 1)
+
+            # db_names[1] is now the least recently used, so it is evicted
+            DbClass4(database=db_names[2])
+            self.assertEqual(CatalogDBObject.connection_cache_info()['size'], 2)
+            self.assertIs(DbClass4(database=db_names[0]).connection, db0.connection)
+            self.assertIsNot(DbClass4(database=db_names[1]).connection, db1.connection)
+
+            # the evicted connection is still usable
+            self.assertEqual(len(next(db1.query_columns(['id', 'i1']))), 5)
+
+            CatalogDBObject.set_connection_cache_size(1)
+            self.assertEqual(CatalogDBObject.connection_cache_info()['size'], 1)
+        finally:
+            CatalogDBObject.set_connection_cache_size(32)
+            sims_clean_up()
+
+    def test_lazy(self):
+        """
+        Test that lazy CatalogDBObjects and DBObjects do not connect to
+        the database until they are used
+        """
+        sims_clean_up()
+        db_name = os.path.join(self.scratch_dir, 'connection_cache_lazy.db')
+
+        class DbClass5(CatalogDBObject):
+            driver = 'sqlite'
+            tableid = 'test'
+            idColKey = 'id'
+            objid = 'test_db_class_5'
+
+            columns = [('identification', 'id')]
+
+        # the database does not even exist yet
+        db = DbClass5(database=db_name, lazy=True)
+        arbitrary_db = DBObject(database=db_name, driver='sqlite', lazy=True)
+        self.assertFalse(db.connection.connected)
+        self.assertFalse(arbitrary_db.connection.connected)
+        self.assertFalse(os.path.exists(db_name))
+
+        shutil.copyfile(self.db_name, db_name)
+        self.assertEqual(list(db.columnMap.keys()), ['identification', 'id', 'i1', 'i2'])
+        self.assertTrue(db.connection.connected)
+        results = next(db.query_columns(['identification', 'i1']))
+        np.testing.assert_array_equal(results['i1'], [ii*ii for ii in range(5)])
+
+        self.assertEqual(len(arbitrary_db.execute_arbitrary('SELECT * FROM test')), 5)
+        self.assertTrue(arbitrary_db.connection.connected)
+        sims_clean_up()
+
+    def test_pool_options(self):
+        """
+        Test that DBConnection passes its pool options to the engine
+        """
+        conn = DBConnection(database=self.db_name, driver='sqlite',
+                            pool_recycle=3600, pool_pre_ping=True)
+        self.assertEqual(conn.pool_recycle, 3600)
+        self.assertTrue(conn.pool_pre_ping)
+        self.assertEqual(conn.engine.pool._recycle, 3600)
+        self.assertTrue(conn.engine.pool._pre_ping)
+        db = DBObject(connection=conn)
+        self.assertEqual(len(db.execute_arbitrary('SELECT * FROM test')), 5)
+
+    @unittest.skipIf(not hasattr(os, 'fork'), "os.fork is not available")
+    def test_fork(self):
+        """
+        Test that a forked process can use the connections of its parent's
+        CatalogDBObjects, and that it does not share its parent's cached
+        connections or sessions
+        """
+        sims_clean_up()
+
+        class DbClass3(CatalogDBObject):
+            database = self.db_name
+            driver = 'sqlite'
+            tableid = 'test'
+            idColKey = 'id'
+            objid = 'test_db_class_3'
+
+            columns = [('identification', 'id')]
+
+        db1 = DbClass3()
+        self.assertEqual(len(next(db1.query_columns(['id', 'i1']))), 5)
+        parent_connection = db1.connection
+        parent_session = db1.connection.session
+
+        read_fd, write_fd = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.close(read_fd)
+            try:
+                result = {'i1': next(db1.query_columns(['id', 'i1']))['i1'].tolist(),
+                          'new_session': db1.connection.session is not parent_session}
+                db2 = DbClass3()
+                result['new_connection'] = db2.connection is not parent_connection
+                result['i2'] = next(db2.query_columns(['id', 'i2']))['i2'].tolist()
+            except Exception as error:
+                result = {'error': repr(error)}
+            with os.fdopen(write_fd, 'w') as output_file:
+                json.dump(result, output_file)
+            os._exit(0)
+
+        os.close(write_fd)
+        with os.fdopen(read_fd, 'r') as input_file:
+            result = json.load(input_file)
+        os.waitpid(pid, 0)
+
+        self.assertNotIn('error', result)
+        self.assertEqual(result['i1'], [ii*ii for ii in range(5)])
+        self.assertEqual(result['i2'], [-ii for ii in range(5)])
+        self.assertTrue(result['new_session'])
+        self.assertTrue(result['new_connection'])
+
+        # the parent's connection is unaffected
+        self.assertIs(db1.connection.session, parent_session)
+        self.assertIs(DbClass3().connection, parent_connection)
+        self.assertEqual(len(CatalogDBObject._connection_cache), 1)
+        np.testing.assert_array_equal(next(db1.query_columns(['id', 'i1']))['i1'],
+                                      [ii*ii for ii in range(5)])
+
 
 class MemoryTestClass(lsst.utils.tests.MemoryTestCase):
     pass
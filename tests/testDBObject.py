@@ -435,6 +435,51 @@ class DBObjectTestCase(unittest.TestCase):
         if os.path.exists(db_name):
             os.unlink(db_name)
 
+    def test_dtype_from_description(self):
+        """
+        Test that the dtype of arbitrary queries is derived from the
+        cursor so that strings containing every delimiter are read
+        correctly, strings which are longer in later chunks are not
+        truncated, and all-NULL columns are read as floats
+        """
+        db_name = os.path.join(self.scratch_dir, 'testDBObject_dtype_description_DB.db')
+        if os.path.exists(db_name):
+            os.unlink(db_name)
+
+        sentences = ['short', 'a, b; c| d: e/ f', 'a much, much; longer| sentence: /']
+        with sqlite3.connect(db_name) as conn:
+            c = conn.cursor()
+            c.execute('CREATE TABLE testTable (id int, val real, sentence text, empty real)')
+            for ii, sentence in enumerate(sentences):
+                c.execute('INSERT INTO testTable VALUES (?, ?, ?, NULL)', (ii, 0.5*ii, sentence))
+            conn.commit()
+
+        db = DBObject(database=db_name, driver='sqlite')
+        query = 'SELECT id, val, sentence, empty FROM testTable ORDER BY id'
+
+        results = db.execute_arbitrary(query)
+        self.assertEqual(list(results['sentence']), sentences)
+        self.assertEqual(str(results.dtype['id']), 'int64')
+        self.assertEqual(str(results.dtype['val']), 'float64')
+        self.assertEqual(str(results.dtype['empty']), 'float64')
+        self.assertTrue(np.isnan(results['empty']).all())
+
+        chunk_iter = db.get_arbitrary_chunk_iterator(query, chunk_size=1)
+        found = []
+        for chunk in chunk_iter:
+            self.assertEqual(len(chunk), 1)
+            self.assertEqual(str(chunk.dtype['id']), 'int64')
+            found.append(chunk['sentence'][0])
+        self.assertEqual(found, sentences)
+
+        # an empty result still has the right column names
+        results = db.execute_arbitrary('SELECT id, val FROM testTable WHERE id > 10')
+        self.assertEqual(len(results), 0)
+        self.assertEqual(results.dtype.names, ('id', 'val'))
+
+        if os.path.exists(db_name):
+            os.unlink(db_name)
+
 class MemoryTestClass(lsst.utils.tests.MemoryTestCase):
     pass
 
@@ -1,12 +1,21 @@
 from __future__ import with_statement
 from builtins import zip
+from builtins import range
 import unittest
 import os
 import numpy as np
 import shutil
 import tempfile
 import lsst.utils.tests
+from sqlalchemy import inspect
+from sqlalchemy.exc import OperationalError
+try:
+    from astropy.io import fits
+except ImportError:
+    fits = None
 from lsst.sims.catalogs.db import fileDBObject
+from lsst.sims.catalogs.db import utils
+from lsst.sims.catalogs.db.utils import make_engine, createSQLTable, loadTable
 
 ROOT = os.path.abspath(os.path.dirname(__file__))
 
@@ -70,6 +79,173 @@ class FileDBObjectTestCase(unittest.TestCase):
         if os.path.exists(txt_file_name):
             os.unlink(txt_file_name)
 
+    def test_load_table(self):
+        """
+        Test that loadTable loads every chunk of a file (including a final
+        chunk of one line and lines with missing values) and creates indexes
+        """
+        txt_file_name = os.path.join(self.scratch_dir, "load_table_test.txt")
+        n_rows = 21
+        with open(txt_file_name, 'w') as output_file:
+            output_file.write("# id, f1, name\n")
+            for ix in range(n_rows):
+                if ix == 7:
+                    output_file.write('%d,,name_%d\n' % (ix, ix))
+                else:
+                    output_file.write('%d,%.2f,name_%d\n' % (ix, 0.25*ix, ix))
+
+        dtype = np.dtype([('id', int), ('f1', float), ('name', str, 10)])
+        engine, metadata = make_engine('sqlite:///%s' % os.path.join(self.scratch_dir, 'load.db'))
+        table = createSQLTable(dtype, 'test', 'id', metadata)
+        n_loaded = loadTable(txt_file_name, table, ',', dtype, engine,
+                             indexCols=['f1', ('id', 'name')], chunkSize=5)
+        self.assertEqual(n_loaded, n_rows)
+
+        rows = engine.execute('SELECT id, f1, name FROM test ORDER BY id').fetchall()
+        self.assertEqual(len(rows), n_rows)
+        for ix, row in enumerate(rows):
+            self.assertEqual(row[0], ix)
+            if ix == 7:
+                self.assertTrue(row[1] is None or np.isnan(row[1]))
+            else:
+                self.assertAlmostEqual(row[1], 0.25*ix)
+            self.assertEqual(row[2], 'name_%d' % ix)
+
+        index_names = [index['name'] for index in inspect(engine).get_indexes('test')]
+        self.assertIn('f1idx', index_names)
+        self.assertIn('idnameidx', index_names)
+
+    def test_load_table_parallel(self):
+        """
+        Test that parsing a file in several processes loads the same rows,
+        in the same order, as parsing it in this one
+        """
+        txt_file_name = os.path.join(self.scratch_dir, "load_table_parallel_test.txt")
+        rng = np.random.RandomState(5512)
+        n_rows = 1000
+        with open(txt_file_name, 'w') as output_file:
+            output_file.write("# id f1 name\n")
+            for ix in range(n_rows):
+                # vary the line lengths so that the byte ranges are uneven
+                output_file.write('%d %.6f %s\n' % (ix, rng.random_sample(),
+                                                    'n'*rng.randint(1, 20)))
+
+        dtype = np.dtype([('id', int), ('f1', float), ('name', str, 20)])
+        results = {}
+        for n_processes in (1, 3):
+            engine, metadata = make_engine('sqlite:///%s' %
+                                           os.path.join(self.scratch_dir, 'load_%d.db' % n_processes))
+            table = createSQLTable(dtype, 'test', 'id', metadata)
+            n_loaded = loadTable(txt_file_name, table, None, dtype, engine,
+                                 chunkSize=37, n_processes=n_processes)
+            self.assertEqual(n_loaded, n_rows)
+            results[n_processes] = engine.execute('SELECT id, f1, name FROM test ORDER BY rowid').fetchall()
+
+        self.assertEqual(len(results[3]), n_rows)
+        self.assertEqual([row[0] for row in results[3]], list(range(n_rows)))
+        self.assertEqual(results[1], results[3])
+
+    def test_binary_formats(self):
+        """
+        Test that fileDBObject ingests .npy, .npz and FITS files, with
+        either backend, taking the dtype from the files
+        """
+        rng = np.random.RandomState(4413)
+        n_rows = 50
+        data = np.zeros(n_rows, dtype=[('id', int), ('f1', float), ('i1', np.int32), ('name', 'S8')])
+        data['id'] = np.arange(n_rows)
+        data['f1'] = rng.random_sample(n_rows)
+        data['i1'] = rng.randint(-100, 100, n_rows)
+        data['name'] = ['name_%d' % ii for ii in range(n_rows)]
+
+        file_names = [os.path.join(self.scratch_dir, 'binary_test.npy'),
+                      os.path.join(self.scratch_dir, 'binary_test_table.npz'),
+                      os.path.join(self.scratch_dir, 'binary_test_columns.npz')]
+        np.save(file_names[0], data)
+        np.savez(file_names[1], table=data)
+        np.savez(file_names[2], **dict((name, data[name]) for name in data.dtype.names))
+        if fits is not None:
+            file_names.append(os.path.join(self.scratch_dir, 'binary_test.fits'))
+            fits.BinTableHDU(data).writeto(file_names[-1])
+
+        for file_name in file_names:
+            for backend in ('sql', 'numpy'):
+                db = fileDBObject(file_name, runtable='test', idColKey='id', backend=backend,
+                                  chunkSize=17)
+                self.assertEqual(list(db.columnMap.keys()), ['id', 'f1', 'i1', 'name'])
+                results = next(db.query_columns(['id', 'f1', 'i1', 'name'], constraint='i1 < 50'))
+                expected = data[data['i1'] < 50]
+                np.testing.assert_array_equal(results['id'], expected['id'])
+                np.testing.assert_array_equal(results['f1'], expected['f1'])
+                np.testing.assert_array_equal(results['i1'], expected['i1'])
+                np.testing.assert_array_equal(results['name'], expected['name'].astype(str))
+                if backend == 'numpy' and file_name.endswith('.npy'):
+                    self.assertIsInstance(db._numpy_table.data, np.memmap)
+                del db
+
+    def test_cache(self):
+        """
+        Test that fileDBObject reopens a cached database, read-only, until
+        the file or the way it is loaded changes, and only hashes the file
+        when its size or modification time changes
+        """
+        txt_file_name = os.path.join(self.scratch_dir, "cache_test.txt")
+        cache_dir = os.path.join(self.scratch_dir, "cache")
+        with open(txt_file_name, 'w') as output_file:
+            output_file.write("# id f1\n")
+            for ix in range(20):
+                output_file.write('%d %.2f\n' % (ix, 0.5*ix))
+
+        dtype = np.dtype([('id', int), ('f1', float)])
+        db = fileDBObject(txt_file_name, runtable='test', dtype=dtype, idColKey='id',
+                          cacheDir=cache_dir)
+        self.assertEqual(os.path.dirname(db.database), cache_dir)
+        mtime = os.path.getmtime(db.database)
+
+        n_hashed = []
+        file_digest = utils._file_digest
+
+        def count_hashes(*args):
+            n_hashed.append(1)
+            return file_digest(*args)
+
+        utils._file_digest = count_hashes
+        try:
+            cached_db = fileDBObject(txt_file_name, runtable='test', dtype=dtype, idColKey='id',
+                                     cacheDir=cache_dir)
+            self.assertEqual(len(n_hashed), 0)
+            os.utime(txt_file_name, (mtime + 10.0, mtime + 10.0))
+            touched_db = fileDBObject(txt_file_name, runtable='test', dtype=dtype, idColKey='id',
+                                      cacheDir=cache_dir)
+            self.assertEqual(len(n_hashed), 1)
+            self.assertEqual(touched_db.database, db.database)
+            fileDBObject(txt_file_name, runtable='test', dtype=dtype, idColKey='id', cacheDir=cache_dir)
+            self.assertEqual(len(n_hashed), 1)
+        finally:
+            utils._file_digest = file_digest
+        self.assertEqual(cached_db.database, db.database)
+        self.assertEqual(os.path.getmtime(cached_db.database), mtime)
+        results = cached_db.execute_arbitrary('SELECT id, f1 FROM test ORDER BY id')
+        np.testing.assert_array_equal(results['f1'], 0.5*np.arange(20))
+        with self.assertRaises(OperationalError):
+            cached_db.connection.engine.execute('DELETE FROM test')
+
+        other_db = fileDBObject(txt_file_name, runtable='other', dtype=dtype, idColKey='id',
+                                cacheDir=cache_dir)
+        self.assertNotEqual(other_db.database, db.database)
+
+        with open(txt_file_name, 'a') as output_file:
+            output_file.write('20 10.00\n')
+        changed_db = fileDBObject(txt_file_name, runtable='test', dtype=dtype, idColKey='id',
+                                  cacheDir=cache_dir)
+        self.assertNotEqual(changed_db.database, db.database)
+        self.assertEqual(len(changed_db.execute_arbitrary('SELECT id FROM test')), 21)
+        self.assertEqual(len([name for name in os.listdir(cache_dir) if name.endswith('.db')]), 3)
+
+        with self.assertRaises(ValueError):
+            fileDBObject(txt_file_name, runtable='test', dtype=dtype, idColKey='id',
+                         cacheDir=cache_dir, database=os.path.join(self.scratch_dir, 'other.db'))
+
 
 class MemoryTestClass(lsst.utils.tests.MemoryTestCase):
     pass
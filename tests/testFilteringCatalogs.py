@@ -471,6 +471,27 @@ class InstanceCatalogTestCase(unittest.TestCase):
                 self.assertGreater(ii+1, 5)
                 self.assertEqual(line, '%d, %d\n' % (ii, ii+1))
 
+        # test that prefetching chunks in a background thread writes
+        # the same catalog
+        prefetch_name = os.path.join(self.scratch_dir, "inst_empty_chunk_prefetch_cat.txt")
+        cat = FilteredCat6(self.db)
+        cat.write_catalog(prefetch_name, chunk_size=2, prefetch=2)
+        with open(prefetch_name, 'r') as input_file:
+            self.assertEqual(input_file.readlines(), input_lines)
+        os.unlink(prefetch_name)
+
+        # test that holding the chunks as ColumnChunks writes the
+        # same catalog
+        class FilteredColumnsCat6(FilteredCat6):
+            chunk_layout = 'columns'
+
+        columns_name = os.path.join(self.scratch_dir, "inst_empty_chunk_columns_cat.txt")
+        cat = FilteredColumnsCat6(self.db)
+        cat.write_catalog(columns_name, chunk_size=2)
+        with open(columns_name, 'r') as input_file:
+            self.assertEqual(input_file.readlines(), input_lines)
+        os.unlink(columns_name)
+
         # test that iter_catalog returns the same result
         cat = FilteredCat6(self.db)
         line_ct = 0
@@ -0,0 +1,229 @@
+from __future__ import with_statement
+from builtins import range
+import os
+import sqlite3
+import unittest
+import tempfile
+import shutil
+import numpy as np
+
+import lsst.utils.tests
+from sqlalchemy import inspect
+try:
+    import healpy
+except ImportError:
+    healpy = None
+from lsst.sims.utils.CodeUtilities import sims_clean_up
+from lsst.sims.utils import ObservationMetaData
+from lsst.sims.catalogs.db import CatalogDBObject, fileDBObject, make_engine, addHealpixColumn
+from lsst.sims.catalogs.db.dbConnection import _in_bounds
+
+ROOT = os.path.abspath(os.path.dirname(__file__))
+
+
+def setup_module(module):
+    lsst.utils.tests.init()
+
+
+class HealpixFileDB(fileDBObject):
+    objid = 'healpixFileDB'
+    idColKey = 'id'
+    raColName = 'ra'
+    decColName = 'decl'
+
+
+class HealpixDB(CatalogDBObject):
+    objid = 'healpixDB'
+    tableid = 'test'
+    idColKey = 'id'
+    driver = 'sqlite'
+    raColName = 'ra'
+    decColName = 'decl'
+
+
+@unittest.skipIf(healpy is None, 'healpy is not installed')
+class HealpixColumnTestCase(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.scratch_dir = tempfile.mkdtemp(dir=ROOT, prefix='HealpixColumnTestCase')
+        rng = np.random.RandomState(6629)
+        cls.n_rows = 2000
+        cls.ra = rng.random_sample(cls.n_rows)*360.0
+        cls.dec = np.degrees(np.arcsin(rng.random_sample(cls.n_rows)*2.0 - 1.0))
+
+        cls.txt_file_name = os.path.join(cls.scratch_dir, 'healpix_test.txt')
+        cls.db_name = os.path.join(cls.scratch_dir, 'healpix_test.db')
+        with open(cls.txt_file_name, 'w') as output_file:
+            output_file.write('# id ra decl\n')
+            for ii in range(cls.n_rows):
+                output_file.write('%d %.10f %.10f\n' % (ii, cls.ra[ii], cls.dec[ii]))
+        with sqlite3.connect(cls.db_name) as conn:
+            c = conn.cursor()
+            c.execute('''CREATE TABLE test (id int PRIMARY KEY, ra real, decl real)''')
+            c.executemany('''INSERT INTO test VALUES (?, ?, ?)''',
+                          ((ii, cls.ra[ii], cls.dec[ii]) for ii in range(cls.n_rows)))
+            conn.commit()
+
+        # circles and boxes in the middle of the sky, across RA = 0 and around a pole
+        cls.obs_list = [ObservationMetaData(pointingRA=ra, pointingDec=dec, boundType=bound_type,
+                                            boundLength=length)
+                        for ra, dec, bound_type, length in ((100.0, -20.0, 'circle', 15.0),
+                                                            (359.0, 5.0, 'circle', 12.0),
+                                                            (40.0, 80.0, 'circle', 12.0),
+                                                            (200.0, 30.0, 'box', 10.0),
+                                                            (2.0, -40.0, 'box', (15.0, 12.0)))]
+
+    @classmethod
+    def tearDownClass(cls):
+        sims_clean_up()
+        if os.path.exists(cls.scratch_dir):
+            shutil.rmtree(cls.scratch_dir)
+
+    def assertRowsInBounds(self, db, healpixColName):
+        """
+        Assert that db restricts each of self.obs_list to ranges of
+        healpixColName, which contain every row within the bounds, and then
+        selects the same rows as it does without them
+        """
+        ra = np.radians(self.ra)
+        dec = np.radians(self.dec)
+        plain_db = HealpixDB(database=self.db_name)
+        for obs in self.obs_list:
+            query = db.filter(db._get_column_query(['id']), obs.bounds)
+            self.assertIn('%s BETWEEN' % healpixColName, str(query))
+            ids = np.sort(next(db.query_columns(['id'], obs_metadata=obs))['id'])
+            self.assertGreater(len(ids), 10)
+            expected = np.sort(next(plain_db.query_columns(['id'], obs_metadata=obs))['id'])
+            np.testing.assert_array_equal(ids, expected)
+
+            in_pixels = db.execute_arbitrary('SELECT id FROM test WHERE %s' %
+                                             db._healpix_to_SQL(obs.bounds))['id']
+            if obs.bounds.boundType == 'circle':
+                distance = np.arccos(np.clip(np.sin(dec)*np.sin(obs.bounds.DEC) +
+                                             np.cos(dec)*np.cos(obs.bounds.DEC) *
+                                             np.cos(ra - obs.bounds.RA), -1.0, 1.0))
+                inside = np.flatnonzero(distance < obs.bounds.radius)
+            else:
+                inside = expected
+            self.assertEqual(len(np.setdiff1d(inside, in_pixels)), 0)
+            self.assertLess(len(in_pixels), 4*len(inside))
+
+    def test_file_db(self):
+        """
+        Test that fileDBObject adds an indexed column of HEALPix pixel ids,
+        with which it selects the rows inside bounds
+        """
+        db = HealpixFileDB(self.txt_file_name, runtable='test', healpixColName='hpid',
+                           healpixNside=256)
+        self.assertEqual(list(db.columnMap.keys()), ['id', 'ra', 'decl', 'hpid'])
+        self.assertIn('hpididx', [index['name'] for index in inspect(db.connection.engine).get_indexes('test')])
+
+        results = next(db.query_columns(['id', 'hpid']))
+        np.testing.assert_array_equal(results['hpid'],
+                                      healpy.ang2pix(256, self.ra[results['id']], self.dec[results['id']],
+                                                     nest=True, lonlat=True))
+
+        self.assertRowsInBounds(db, 'hpid')
+
+    def test_add_healpix_column(self):
+        """
+        Test that addHealpixColumn adds a column of HEALPix pixel ids to an
+        existing table, with which CatalogDBObjects select the rows inside
+        bounds
+        """
+        db_name = os.path.join(self.scratch_dir, 'healpix_add_test.db')
+        shutil.copyfile(self.db_name, db_name)
+        engine, metadata = make_engine('sqlite:///%s' % db_name)
+        n_rows = addHealpixColumn(engine, 'test', 'id', 'ra', 'decl', chunkSize=300)
+        self.assertEqual(n_rows, self.n_rows)
+        self.assertIn('healpixidx', [index['name'] for index in inspect(engine).get_indexes('test')])
+        pixels = np.array(engine.execute('SELECT healpix FROM test ORDER BY id').fetchall())[:, 0]
+        np.testing.assert_array_equal(pixels, healpy.ang2pix(1024, self.ra, self.dec, nest=True, lonlat=True))
+        engine.dispose()
+
+        class HealpixAddedDB(HealpixDB):
+            objid = 'healpixAddedDB'
+            healpixColName = 'healpix'
+
+        self.assertRowsInBounds(HealpixAddedDB(database=db_name), 'healpix')
+
+    def test_wide_boxes(self):
+        """
+        Test that the pixel ranges cover boxes which are wide in RA or
+        which wrap around RA = 0, so that no row inside them is lost
+        """
+        db = HealpixFileDB(self.txt_file_name, runtable='test', healpixColName='hpid',
+                           healpixNside=256)
+        for ra, dec, length in ((180.0, 0.0, (170.0, 5.0)), (90.0, 45.0, (120.0, 30.0)),
+                                (350.0, 10.0, (30.0, 20.0))):
+            obs = ObservationMetaData(pointingRA=ra, pointingDec=dec, boundType='box',
+                                      boundLength=length)
+            inside = np.flatnonzero(_in_bounds(obs.bounds, self.ra, self.dec))
+            self.assertGreater(len(inside), 10)
+            in_pixels = db.execute_arbitrary('SELECT id FROM test WHERE %s' %
+                                             db._healpix_to_SQL(obs.bounds))['id']
+            self.assertEqual(len(np.setdiff1d(inside, in_pixels)), 0)
+            ids = next(db.query_columns(['id'], obs_metadata=obs))['id']
+            np.testing.assert_array_equal(np.sort(ids), inside)
+
+    def test_without_rowids(self):
+        """
+        Test that the pixel ranges of views and WITHOUT ROWID tables,
+        which cannot be searched by rowid, are tested in place
+        """
+        db_name = os.path.join(self.scratch_dir, 'healpix_rowid_test.db')
+        shutil.copyfile(self.db_name, db_name)
+        engine, metadata = make_engine('sqlite:///%s' % db_name)
+        addHealpixColumn(engine, 'test', 'id', 'ra', 'decl', chunkSize=300)
+        engine.execute('CREATE VIEW test_view AS SELECT * FROM test')
+        engine.execute('CREATE TABLE test_no_rowid (id int PRIMARY KEY, ra real, decl real, '
+                       'healpix int) WITHOUT ROWID')
+        engine.execute('INSERT INTO test_no_rowid SELECT id, ra, decl, healpix FROM test')
+        engine.dispose()
+
+        obs = self.obs_list[0]
+        expected = np.sort(next(HealpixDB(database=self.db_name).query_columns(['id'],
+                                                                               obs_metadata=obs))['id'])
+        for tableid, has_rowid in (('test', True), ('test_view', False), ('test_no_rowid', False)):
+
+            class HealpixRowidDB(HealpixDB):
+                objid = 'healpixRowidDB_%s' % tableid
+                healpixColName = 'healpix'
+
+            HealpixRowidDB.tableid = tableid
+            db = HealpixRowidDB(database=db_name)
+            self.assertEqual(db._is_rowid_table(), has_rowid)
+            query = str(db.filter(db._get_column_query(['id']), obs.bounds))
+            self.assertIn('healpix BETWEEN', query)
+            self.assertEqual('%s.rowid IN' % tableid in query, has_rowid)
+            ids = next(db.query_columns(['id'], obs_metadata=obs))['id']
+            np.testing.assert_array_equal(np.sort(ids), expected)
+
+    def test_rowid_constraint(self):
+        """
+        Test that the pixel ranges of a rowid table select the right rows
+        when the query has a constraint as well
+        """
+        db = HealpixFileDB(self.txt_file_name, runtable='test', healpixColName='hpid',
+                           healpixNside=256)
+        self.assertTrue(db._is_rowid_table())
+        plain_db = HealpixDB(database=self.db_name)
+        constraint = 'id < 1500'
+        for obs in self.obs_list:
+            query = str(db.filter(db._get_column_query(['id']), obs.bounds))
+            self.assertIn('test.rowid IN', query)
+            expected = next(plain_db.query_columns(['id'], obs_metadata=obs, constraint=constraint))['id']
+            ids = next(db.query_columns(['id'], obs_metadata=obs, constraint=constraint))['id']
+            self.assertGreater(len(ids), 0)
+            self.assertLess(ids.max(), 1500)
+            np.testing.assert_array_equal(np.sort(ids), np.sort(expected))
+
+
+class MemoryTestClass(lsst.utils.tests.MemoryTestCase):
+    pass
+
+
+if __name__ == "__main__":
+    lsst.utils.tests.init()
+    unittest.main()
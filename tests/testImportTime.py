@@ -0,0 +1,36 @@
+from __future__ import with_statement
+import os
+import sys
+import unittest
+
+import lsst.utils.tests
+
+ROOT = os.path.abspath(os.path.dirname(__file__))
+sys.path.insert(0, os.path.join(ROOT, '..', 'benchmarks'))
+from benchmarkImportTime import LAZY_MODULES, time_import  # noqa: E402
+
+
+def setup_module(module):
+    lsst.utils.tests.init()
+
+
+class ImportTimeTestCase(unittest.TestCase):
+
+    def test_lazy_modules(self):
+        """
+        Test that importing the packages in a fresh python process does not
+        import any of the modules which are only imported when needed
+        """
+        self.assertGreater(len(LAZY_MODULES), 0)
+        for package in ('lsst.sims.catalogs.db', 'lsst.sims.catalogs.definitions'):
+            duration, lazy = time_import([package])
+            self.assertEqual(lazy, [], msg='importing %s imported %s' % (package, lazy))
+
+
+class MemoryTestClass(lsst.utils.tests.MemoryTestCase):
+    pass
+
+
+if __name__ == "__main__":
+    lsst.utils.tests.init()
+    unittest.main()
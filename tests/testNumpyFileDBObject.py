@@ -0,0 +1,191 @@
+from __future__ import with_statement
+from builtins import range
+import unittest
+import numpy as np
+import os
+import shutil
+import tempfile
+
+import lsst.utils.tests
+from lsst.sims.utils.CodeUtilities import sims_clean_up
+from lsst.sims.utils import ObservationMetaData
+from lsst.sims.catalogs.definitions import InstanceCatalog
+from lsst.sims.catalogs.decorators import cached
+from lsst.sims.catalogs.db import (fileDBObject, ColumnChunk, NumpyTable,
+                                  NumpyChunkIterator)
+
+ROOT = os.path.abspath(os.path.dirname(__file__))
+
+
+def setup_module(module):
+    lsst.utils.tests.init()
+
+
+class NumpyTestFileDB(fileDBObject):
+    objid = 'numpyTestFileDB'
+    idColKey = 'id'
+    raColName = 'ra'
+    decColName = 'decl'
+    columns = [('raJ2000', 'ra*PI()/180.0'),
+               ('decJ2000', 'RADIANS(decl)'),
+               ('halfId', 'id/2', int),
+               ('sedFilename', 'sed', str, 10)]
+
+
+class NumpyDefaultsFileDB(fileDBObject):
+    objid = 'numpyDefaultsFileDB'
+    idColKey = 'id'
+    dbDefaultValues = {'mag': 99.0, 'flag': -1, 'sed': 'none'}
+
+
+class NumpyTestCatalog(InstanceCatalog):
+    column_outputs = ['id', 'raJ2000', 'mag', 'halfId', 'sedFilename', 'magPlusOne']
+
+    @cached
+    def get_magPlusOne(self):
+        return self.column_by_name('mag') + 1.0
+
+
+class NumpyTableTestCase(unittest.TestCase):
+
+    def test_evaluate(self):
+        """
+        Test that NumpyTable evaluates SQL expressions as a database would
+        """
+        data = np.array([(1, 2.5, b'a'), (-7, 0.5, b'b'), (4, -1.0, b"it's")],
+                        dtype=[('i', int), ('f', float), ('s', 'S5')])
+        table = NumpyTable(data)
+        np.testing.assert_array_equal(table.evaluate('i/2'), [0, -3, 2])
+        np.testing.assert_array_equal(table.evaluate('i % 3'), [1, -1, 1])
+        np.testing.assert_array_almost_equal(table.evaluate('POWER(f, 2)*PI() - -i'),
+                                             data['f']**2*np.pi + data['i'])
+        np.testing.assert_array_equal(table.select("s = 'b' or s = 'it''s'"), [False, True, True])
+        np.testing.assert_array_equal(table.select("NOT (i > 0 AND f <> 2.5)"), [True, True, False])
+        np.testing.assert_array_equal(table.select("0 < i <= 4"), [True, False, True])
+        np.testing.assert_array_equal(table.evaluate('i', rows=[2, 0]), [4, 1])
+        self.assertAlmostEqual(table.evaluate('PI()/4'), 0.25*np.pi)
+
+        for sql in ("i IN (1, 2)", "f BETWEEN 0 AND 1", "s IS NULL", "nonsense > 2",
+                    "i; DROP TABLE test", "__import__('os')", "i.real"):
+            with self.assertRaises(ValueError):
+                table.evaluate(sql)
+
+
+class NumpyFileDBObjectTestCase(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.scratch_dir = tempfile.mkdtemp(dir=ROOT, prefix="scratchSpace-")
+        cls.db_src_name = os.path.join(cls.scratch_dir, 'numpy_file_db.txt')
+        rng = np.random.RandomState(6621)
+        cls.n_rows = 500
+        with open(cls.db_src_name, 'w') as output_file:
+            output_file.write('# id ra decl mag sed\n')
+            for ii in range(cls.n_rows):
+                output_file.write('%d %.8f %.8f %.4f sed_%d.txt\n' %
+                                  (ii, rng.random_sample()*20.0, rng.random_sample()*20.0 - 10.0,
+                                   rng.random_sample()*10.0 + 15.0, ii % 7))
+
+        cls.dtype = np.dtype([('id', int), ('ra', float), ('decl', float),
+                              ('mag', float), ('sed', str, 10)])
+        cls.sql_db = NumpyTestFileDB(cls.db_src_name, runtable='test', dtype=cls.dtype)
+        cls.numpy_db = NumpyTestFileDB(cls.db_src_name, runtable='test', dtype=cls.dtype,
+                                       backend='numpy')
+
+    @classmethod
+    def tearDownClass(cls):
+        sims_clean_up()
+        del cls.sql_db
+        del cls.numpy_db
+        if os.path.exists(cls.scratch_dir):
+            shutil.rmtree(cls.scratch_dir)
+
+    def test_columns(self):
+        """
+        Test that the numpy backend has the same columns as the sql backend
+        """
+        self.assertIsNone(self.numpy_db.connection)
+        self.assertEqual(list(self.numpy_db.columnMap.items()), list(self.sql_db.columnMap.items()))
+        self.assertEqual(list(self.numpy_db.typeMap.items()), list(self.sql_db.typeMap.items()))
+
+    def test_query_columns(self):
+        """
+        Test that the numpy backend returns the same chunks as the sql backend
+        """
+        obs = ObservationMetaData(pointingRA=10.0, pointingDec=0.0,
+                                  boundType='circle', boundLength=4.0)
+        colnames = ['id', 'raJ2000', 'decJ2000', 'halfId', 'mag', 'sedFilename']
+        queries = [dict(chunk_size=None),
+                   dict(chunk_size=37, constraint="mag < 20.0 AND sed <> 'sed_3.txt'"),
+                   dict(chunk_size=23, constraint='id/2 > 100', limit=51),
+                   dict(chunk_size=100, obs_metadata=obs, constraint='decl > -2.0')]
+        for kwargs in queries:
+            expected = list(self.sql_db.query_columns(colnames=colnames, **kwargs))
+            results = self.numpy_db.query_columns(colnames=colnames, **kwargs)
+            self.assertIsInstance(results, NumpyChunkIterator)
+            results = list(results)
+            self.assertGreater(len(results), 0)
+            self.assertEqual(len(results), len(expected))
+            for chunk, expected_chunk in zip(results, expected):
+                self.assertIsInstance(chunk, np.recarray)
+                self.assertEqual(chunk.dtype, expected_chunk.dtype)
+                for name in ('id', 'halfId', 'sedFilename'):
+                    np.testing.assert_array_equal(chunk[name], expected_chunk[name])
+                for name in ('raJ2000', 'decJ2000', 'mag'):
+                    np.testing.assert_array_almost_equal(chunk[name], expected_chunk[name], decimal=10)
+
+        chunks = list(self.numpy_db.query_columns(colnames=['id', 'mag'], chunk_size=200,
+                                                  layout='columns'))
+        self.assertEqual([len(chunk) for chunk in chunks], [200, 200, 100])
+        for chunk in chunks:
+            self.assertIsInstance(chunk, ColumnChunk)
+
+        self.assertEqual(list(self.numpy_db.query_columns(constraint='mag > 100.0', chunk_size=10)), [])
+
+    def test_default_values(self):
+        """
+        Test that the numpy backend fills in dbDefaultValues as the sql
+        backend does
+        """
+        file_name = os.path.join(self.scratch_dir, 'numpy_defaults.txt')
+        with open(file_name, 'w') as output_file:
+            output_file.write('# id,mag,flag,sed\n')
+            for ii in range(30):
+                output_file.write('%d,%s,%d,%s\n' % (ii, '' if ii % 3 == 0 else '%.2f' % (20.0 + 0.1*ii),
+                                                     ii % 4, '' if ii % 5 == 0 else 'sed_%d' % ii))
+        dtype = np.dtype([('id', int), ('mag', float), ('flag', int), ('sed', str, 10)])
+        colnames = ['id', 'mag', 'flag', 'sed']
+        chunks = dict((backend, list(NumpyDefaultsFileDB(file_name, runtable='test', dtype=dtype,
+                                                         delimiter=',', backend=backend)
+                                     .query_columns(colnames=colnames, chunk_size=7)))
+                      for backend in ('sql', 'numpy'))
+        results = dict((backend, np.concatenate(chunks[backend])) for backend in chunks)
+        self.assertEqual((results['numpy']['mag'] == 99.0).sum(), 10)
+        self.assertEqual((results['numpy']['flag'] == -1).sum(), 8)
+        self.assertEqual((results['numpy']['sed'] == 'none').sum(), 6)
+        for name in colnames:
+            np.testing.assert_array_equal(results['numpy'][name], results['sql'][name])
+
+    def test_catalog(self):
+        """
+        Test that InstanceCatalogs written from either backend are the same
+        """
+        obs = ObservationMetaData(pointingRA=10.0, pointingDec=0.0,
+                                  boundType='box', boundLength=5.0)
+        cat_names = []
+        for db in (self.sql_db, self.numpy_db):
+            cat_names.append(os.path.join(self.scratch_dir, 'numpy_cat_%s.txt' % db.backend))
+            NumpyTestCatalog(db, obs_metadata=obs).write_catalog(cat_names[-1], chunk_size=47)
+
+        with open(cat_names[0], 'r') as sql_file:
+            with open(cat_names[1], 'r') as numpy_file:
+                self.assertEqual(numpy_file.read(), sql_file.read())
+
+
+class MemoryTestClass(lsst.utils.tests.MemoryTestCase):
+    pass
+
+
+if __name__ == "__main__":
+    lsst.utils.tests.init()
+    unittest.main()
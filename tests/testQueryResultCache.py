@@ -0,0 +1,201 @@
+from __future__ import with_statement
+from builtins import range
+import os
+import sqlite3
+import unittest
+import tempfile
+import shutil
+import numpy as np
+
+import lsst.utils.tests
+from lsst.sims.utils.CodeUtilities import sims_clean_up
+from lsst.sims.utils import ObservationMetaData
+from lsst.sims.catalogs.db import (CatalogDBObject, ChunkIterator, ColumnChunk,
+                                  QueryResultCache)
+
+ROOT = os.path.abspath(os.path.dirname(__file__))
+
+
+def setup_module(module):
+    lsst.utils.tests.init()
+
+
+class dbForResultCacheTest(CatalogDBObject):
+    objid = 'resultCacheTest'
+    tableid = 'resultCacheTest'
+    idColKey = 'id'
+    raColName = 'ra'
+    decColName = 'decl'
+    columns = [('id', None, int),
+               ('ra', None),
+               ('decl', None),
+               ('mag', None),
+               ('sedFilename', 'sed', str, 10)]
+
+
+class dbForResultCacheFinalPassTest(dbForResultCacheTest):
+    objid = 'resultCacheFinalPassTest'
+
+    def _final_pass(self, results):
+        results['mag'] += 1.0
+        return results
+
+
+class QueryResultCacheTestCase(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.scratch_dir = tempfile.mkdtemp(dir=ROOT, prefix='QueryResultCacheTestCase')
+        cls.db_name = os.path.join(cls.scratch_dir, 'testQueryResultCacheDB.db')
+        rng = np.random.RandomState(771)
+        cls.n_rows = 1000
+        cls.ra = rng.random_sample(cls.n_rows)*20.0
+        cls.dec = rng.random_sample(cls.n_rows)*20.0-10.0
+        with sqlite3.connect(cls.db_name) as conn:
+            c = conn.cursor()
+            c.execute('''CREATE TABLE resultCacheTest
+                      (id int PRIMARY KEY, ra real, decl real, mag real, sed text)''')
+            c.executemany('''INSERT INTO resultCacheTest VALUES (?, ?, ?, ?, ?)''',
+                          ((ii, cls.ra[ii], cls.dec[ii], 20.0+0.01*ii, 'sed_%d' % (ii % 10))
+                           for ii in range(cls.n_rows)))
+            conn.commit()
+
+    @classmethod
+    def tearDownClass(cls):
+        sims_clean_up()
+        if os.path.exists(cls.scratch_dir):
+            shutil.rmtree(cls.scratch_dir)
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp(dir=self.scratch_dir, prefix='cache')
+        self.db = dbForResultCacheTest(database=self.db_name, driver='sqlite')
+        self.db.result_cache = QueryResultCache(self.cache_dir)
+        self.obs = ObservationMetaData(pointingRA=10.0, pointingDec=0.0,
+                                       boundType='circle', boundLength=5.0)
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir)
+
+    def test_replay(self):
+        """
+        Test that a repeated query is replayed from the cache, with the
+        same results, re-chunked to the requested chunk_size and layout
+        """
+        colnames = ['id', 'ra', 'mag', 'sedFilename']
+        expected = np.concatenate(list(self.db.query_columns(colnames=colnames,
+                                                             obs_metadata=self.obs,
+                                                             chunk_size=100)))
+        self.assertGreater(len(expected), 100)
+        self.assertEqual(self.db.result_cache.nbytes, expected.nbytes)
+
+        # make sure the results are not coming from the database
+        self.assertNotIsInstance(self.db.query_columns(colnames=colnames, obs_metadata=self.obs),
+                                 ChunkIterator)
+
+        for chunk_size in (None, 7, 100, 150):
+            chunks = list(self.db.query_columns(colnames=colnames, obs_metadata=self.obs,
+                                                chunk_size=chunk_size))
+            if chunk_size is None:
+                self.assertEqual(len(chunks), 1)
+            for chunk in chunks:
+                self.assertIsInstance(chunk, np.recarray)
+                if chunk_size is not None:
+                    self.assertLessEqual(len(chunk), chunk_size)
+            np.testing.assert_array_equal(np.concatenate(chunks), expected)
+
+        chunks = list(self.db.query_columns(colnames=colnames, obs_metadata=self.obs,
+                                            chunk_size=60, layout='columns'))
+        for chunk in chunks:
+            self.assertIsInstance(chunk, ColumnChunk)
+        np.testing.assert_array_equal(np.concatenate([chunk['mag'] for chunk in chunks]),
+                                      expected['mag'])
+
+        # a different query is not served from the cache
+        other = np.concatenate(list(self.db.query_columns(colnames=colnames, obs_metadata=self.obs,
+                                                          constraint='mag < 25.0')))
+        self.assertLess(len(other), len(expected))
+
+    def test_distinct_keys(self):
+        """
+        Test that results are not replayed to a class with a different
+        _final_pass, nor to a query with different exact bounds which has
+        the same bounding box in SQL
+        """
+        expected = np.concatenate(list(self.db.query_columns(colnames=['id', 'mag'],
+                                                             obs_metadata=self.obs)))
+        other_db = dbForResultCacheFinalPassTest(database=self.db_name, driver='sqlite')
+        other_db.result_cache = self.db.result_cache
+        for ii in range(2):
+            results = np.concatenate(list(other_db.query_columns(colnames=['id', 'mag'],
+                                                                 obs_metadata=self.obs)))
+            np.testing.assert_array_equal(results['mag'], expected['mag'] + 1.0)
+
+        box_obs = ObservationMetaData(pointingRA=10.0, pointingDec=0.0,
+                                      boundType='box', boundLength=5.0)
+        for ii in range(2):
+            circle_ids = np.concatenate(list(self.db.query_columns(colnames=['id'], obs_metadata=self.obs,
+                                                                   spatial_filter='numpy')))['id']
+            box_ids = np.concatenate(list(self.db.query_columns(colnames=['id'], obs_metadata=box_obs,
+                                                                spatial_filter='numpy')))['id']
+            self.assertLess(len(circle_ids), len(box_ids))
+            np.testing.assert_array_equal(circle_ids, expected['id'])
+
+    def test_incomplete_queries(self):
+        """
+        Test that queries which are not read to completion are not cached
+        """
+        chunk_iter = self.db.query_columns(chunk_size=100)
+        next(chunk_iter)
+        chunk_iter.close()
+        del chunk_iter
+        self.assertEqual(self.db.result_cache.nbytes, 0)
+        self.assertEqual(os.listdir(os.path.join(self.cache_dir, 'resultCacheTest')), [])
+
+    def test_single_chunk(self):
+        """
+        Test that a query with chunk_size=None is cached as soon as its one
+        chunk has been read
+        """
+        expected = next(self.db.query_columns(colnames=['id', 'mag'], obs_metadata=self.obs))
+        self.assertEqual(self.db.result_cache.nbytes, expected.nbytes)
+
+        chunk_iter = self.db.query_columns(colnames=['id', 'mag'], obs_metadata=self.obs)
+        self.assertNotIsInstance(chunk_iter, ChunkIterator)
+        np.testing.assert_array_equal(next(chunk_iter), expected)
+
+    def test_invalidate_and_evict(self):
+        """
+        Test that the results from a table can be invalidated and that the
+        least recently used results are evicted when the cache is full
+        """
+        queries = [dict(constraint='id < %d' % nn) for nn in (100, 200, 300)]
+        results = [next(self.db.query_columns(**kwargs)) for kwargs in queries]
+        for kwargs in queries:
+            list(self.db.query_columns(**kwargs))
+        self.assertEqual(self.db.result_cache.nbytes, sum(rr.nbytes for rr in results))
+
+        self.db.invalidate_result_cache()
+        self.assertEqual(self.db.result_cache.nbytes, 0)
+
+        self.db.result_cache.max_bytes = results[1].nbytes + results[2].nbytes
+        for ii, kwargs in enumerate(queries):
+            list(self.db.query_columns(**kwargs))
+            # make sure the access times are distinguishable
+            for entry in self.db.result_cache._entries():
+                os.utime(os.path.join(entry[2], 'entry.json'), (entry[0]-1.0, entry[0]-1.0))
+        self.assertEqual(self.db.result_cache.nbytes, results[1].nbytes + results[2].nbytes)
+
+        # replaying the second query makes the third the least recently used
+        list(self.db.query_columns(**queries[1]))
+        self.db.result_cache.max_bytes = results[1].nbytes
+        self.db.result_cache._evict(self.db.result_cache.max_bytes)
+        self.assertEqual(self.db.result_cache.nbytes, results[1].nbytes)
+
+
+class MemoryTestClass(lsst.utils.tests.MemoryTestCase):
+    pass
+
+
+if __name__ == "__main__":
+    lsst.utils.tests.init()
+    unittest.main()
@@ -0,0 +1,105 @@
+from __future__ import with_statement
+from builtins import range
+import os
+import sqlite3
+import unittest
+import tempfile
+import shutil
+import numpy as np
+
+import lsst.utils.tests
+from lsst.sims.utils.CodeUtilities import sims_clean_up
+from lsst.sims.catalogs.db import CatalogDBObject, SchemaCache
+
+ROOT = os.path.abspath(os.path.dirname(__file__))
+
+
+def setup_module(module):
+    lsst.utils.tests.init()
+
+
+class dbForSchemaCacheTest(CatalogDBObject):
+    objid = 'schemaCacheTest'
+    tableid = 'test'
+    idColKey = 'id'
+    driver = 'sqlite'
+
+
+class SchemaCacheTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.scratch_dir = tempfile.mkdtemp(dir=ROOT, prefix='SchemaCacheTestCase')
+        self.db_name = os.path.join(self.scratch_dir, 'testSchemaCacheDB.db')
+        self.cache_dir = os.path.join(self.scratch_dir, 'cache')
+        with sqlite3.connect(self.db_name) as conn:
+            c = conn.cursor()
+            c.execute('''CREATE TABLE test (id int PRIMARY KEY, i1 int, f1 real)''')
+            c.executemany('''INSERT INTO test VALUES (?, ?, ?)''',
+                          ((ii, ii*ii, 0.5*ii) for ii in range(5)))
+            conn.commit()
+
+    def tearDown(self):
+        sims_clean_up()
+        dbForSchemaCacheTest.schema_cache = None
+        if os.path.exists(self.scratch_dir):
+            shutil.rmtree(self.scratch_dir)
+
+    def add_column(self):
+        """
+        Add a column to the table, so that we can tell whether
+        a CatalogDBObject reflected it or used the snapshot
+        """
+        with sqlite3.connect(self.db_name) as conn:
+            conn.cursor().execute('''ALTER TABLE test ADD COLUMN f2 real''')
+            conn.commit()
+
+    def test_snapshot(self):
+        """
+        Test that tables are built from the snapshot, in this process
+        and in a new one, until it expires or is refreshed
+        """
+        dbForSchemaCacheTest.schema_cache = SchemaCache(self.cache_dir)
+        db = dbForSchemaCacheTest(database=self.db_name)
+        self.assertEqual(list(db.table.c.keys()), ['id', 'i1', 'f1'])
+        self.add_column()
+
+        # simulate a new process: no DBConnections and an empty in-memory cache
+        sims_clean_up()
+        dbForSchemaCacheTest.schema_cache = SchemaCache(self.cache_dir)
+        db = dbForSchemaCacheTest(database=self.db_name)
+        self.assertEqual(list(db.table.c.keys()), ['id', 'i1', 'f1'])
+        self.assertTrue(db.table.c.id.primary_key)
+        results = next(db.query_columns(['id', 'i1', 'f1']))
+        np.testing.assert_array_equal(results['i1'], [ii*ii for ii in range(5)])
+        np.testing.assert_array_equal(results['f1'], [0.5*ii for ii in range(5)])
+
+        db.refresh_schema()
+        self.assertEqual(list(db.table.c.keys()), ['id', 'i1', 'f1', 'f2'])
+        sims_clean_up()
+        dbForSchemaCacheTest.schema_cache = SchemaCache(self.cache_dir)
+        db = dbForSchemaCacheTest(database=self.db_name)
+        self.assertIn('f2', db.columnMap)
+
+    def test_ttl(self):
+        """
+        Test that expired snapshots are replaced by reflecting the table
+        """
+        dbForSchemaCacheTest.schema_cache = SchemaCache(self.cache_dir, ttl=0)
+        db = dbForSchemaCacheTest(database=self.db_name)
+        self.assertNotIn('f2', db.columnMap)
+        self.add_column()
+        sims_clean_up()
+        db = dbForSchemaCacheTest(database=self.db_name)
+        self.assertIn('f2', db.columnMap)
+
+        dbForSchemaCacheTest.schema_cache.clear()
+        self.assertEqual(os.listdir(self.cache_dir), [])
+
+
+class MemoryTestClass(lsst.utils.tests.MemoryTestCase):
+    pass
+
+
+if __name__ == "__main__":
+    lsst.utils.tests.init()
+    unittest.main()
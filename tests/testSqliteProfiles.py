@@ -0,0 +1,116 @@
+from __future__ import with_statement
+from builtins import range
+import os
+import sqlite3
+import unittest
+import tempfile
+import shutil
+import numpy as np
+
+import lsst.utils.tests
+from sqlalchemy.exc import OperationalError
+from lsst.sims.catalogs.db import SQLITE_PROFILES, make_engine, createSQLTable, loadTable
+from lsst.sims.catalogs.db import dbConnection
+from lsst.sims.catalogs.db.dbConnection import DBConnection
+
+ROOT = os.path.abspath(os.path.dirname(__file__))
+
+
+def setup_module(module):
+    lsst.utils.tests.init()
+
+
+class SqliteProfileTestCase(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.scratch_dir = tempfile.mkdtemp(dir=ROOT, prefix='SqliteProfileTestCase')
+        cls.db_name = os.path.join(cls.scratch_dir, 'testSqliteProfilesDB.db')
+        with sqlite3.connect(cls.db_name) as conn:
+            c = conn.cursor()
+            c.execute('''CREATE TABLE test (id int PRIMARY KEY, f1 real)''')
+            c.executemany('''INSERT INTO test VALUES (?, ?)''',
+                          ((ii, 0.5*ii) for ii in range(100)))
+            conn.commit()
+
+    @classmethod
+    def tearDownClass(cls):
+        if os.path.exists(cls.scratch_dir):
+            shutil.rmtree(cls.scratch_dir)
+
+    def test_profiles(self):
+        """
+        Test that connections are opened with the URI parameters and
+        pragmas of their profile, and can evaluate the trig functions
+        """
+        for name in ('read', 'immutable', 'wal'):
+            db = DBConnection(database=self.db_name, driver='sqlite', sqlite_profile=name)
+            self.assertEqual(db.sqlite_profile, name)
+            engine = db.engine
+            results = engine.execute('SELECT SUM(SIN(f1)), PI() FROM test').fetchall()
+            self.assertAlmostEqual(results[0][0], np.sin(0.5*np.arange(100)).sum())
+            self.assertAlmostEqual(results[0][1], np.pi)
+            self.assertEqual(engine.execute('PRAGMA mmap_size').fetchall()[0][0], 1 << 30)
+            if SQLITE_PROFILES[name]['uri'].get('mode') == 'ro':
+                with self.assertRaises(OperationalError):
+                    engine.execute('DELETE FROM test')
+            else:
+                self.assertEqual(engine.execute('PRAGMA journal_mode').fetchall()[0][0], 'wal')
+            db.engine.dispose()
+
+        for kwargs in (dict(database=self.db_name, sqlite_profile='nonsense'),
+                       dict(database=':memory:', sqlite_profile='read'),
+                       dict(database=':memory:', read_only=True)):
+            with self.assertRaises(ValueError):
+                DBConnection(driver='sqlite', **kwargs)
+
+    def test_functions_declared_once(self):
+        """
+        Test that the trig functions are declared once per DBAPI connection,
+        rather than each time a connection is checked out of the pool
+        """
+        n_declared = []
+        declareTrigFunctions = dbConnection.declareTrigFunctions
+
+        def count_declarations(*args):
+            n_declared.append(1)
+            declareTrigFunctions(*args)
+
+        dbConnection.declareTrigFunctions = count_declarations
+        try:
+            db = DBConnection(database=':memory:', driver='sqlite')
+            for ii in range(5):
+                self.assertAlmostEqual(db.engine.execute('SELECT COS(0.0)').fetchall()[0][0], 1.0)
+        finally:
+            dbConnection.declareTrigFunctions = declareTrigFunctions
+        self.assertEqual(len(n_declared), 1)
+
+    def test_bulk_load(self):
+        """
+        Test that loadTable sets the pragmas of a profile while it loads
+        the rows, and then restores them
+        """
+        txt_file_name = os.path.join(self.scratch_dir, 'bulk_load_test.txt')
+        with open(txt_file_name, 'w') as output_file:
+            output_file.write('# id f1\n')
+            for ix in range(50):
+                output_file.write('%d %.2f\n' % (ix, 0.25*ix))
+
+        dtype = np.dtype([('id', int), ('f1', float)])
+        engine, metadata = make_engine('sqlite://')
+        synchronous = engine.execute('PRAGMA synchronous').fetchall()[0][0]
+        table = createSQLTable(dtype, 'test', 'id', metadata)
+        n_loaded = loadTable(txt_file_name, table, None, dtype, engine, chunkSize=7,
+                             sqliteProfile='bulk_load')
+        self.assertEqual(n_loaded, 50)
+        self.assertEqual(engine.execute('SELECT COUNT(*) FROM test').fetchall()[0][0], 50)
+        self.assertEqual(engine.execute('PRAGMA synchronous').fetchall()[0][0], synchronous)
+
+
+class MemoryTestClass(lsst.utils.tests.MemoryTestCase):
+    pass
+
+
+if __name__ == "__main__":
+    lsst.utils.tests.init()
+    unittest.main()
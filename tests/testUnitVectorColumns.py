@@ -0,0 +1,141 @@
+from __future__ import with_statement
+from builtins import range
+import os
+import sqlite3
+import unittest
+import tempfile
+import shutil
+import numpy as np
+
+import lsst.utils.tests
+from sqlalchemy import inspect
+from lsst.sims.utils.CodeUtilities import sims_clean_up
+from lsst.sims.utils import ObservationMetaData
+from lsst.sims.catalogs.db import CatalogDBObject, fileDBObject, make_engine, addUnitVectorColumns
+
+ROOT = os.path.abspath(os.path.dirname(__file__))
+
+
+def setup_module(module):
+    lsst.utils.tests.init()
+
+
+class UnitVectorFileDB(fileDBObject):
+    objid = 'unitVectorFileDB'
+    idColKey = 'id'
+    raColName = 'ra'
+    decColName = 'decl'
+
+
+class UnitVectorDB(CatalogDBObject):
+    objid = 'unitVectorDB'
+    tableid = 'test'
+    idColKey = 'id'
+    driver = 'sqlite'
+    raColName = 'ra'
+    decColName = 'decl'
+
+
+class UnitVectorTestCase(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.scratch_dir = tempfile.mkdtemp(dir=ROOT, prefix='UnitVectorTestCase')
+        rng = np.random.RandomState(1871)
+        cls.n_rows = 2000
+        cls.ra = rng.random_sample(cls.n_rows)*360.0
+        cls.dec = np.degrees(np.arcsin(rng.random_sample(cls.n_rows)*2.0 - 1.0))
+
+        cls.txt_file_name = os.path.join(cls.scratch_dir, 'unit_vector_test.txt')
+        cls.db_name = os.path.join(cls.scratch_dir, 'unit_vector_test.db')
+        with open(cls.txt_file_name, 'w') as output_file:
+            output_file.write('# id ra decl\n')
+            for ii in range(cls.n_rows):
+                output_file.write('%d %.10f %.10f\n' % (ii, cls.ra[ii], cls.dec[ii]))
+        with sqlite3.connect(cls.db_name) as conn:
+            c = conn.cursor()
+            c.execute('''CREATE TABLE test (id int PRIMARY KEY, ra real, decl real)''')
+            c.executemany('''INSERT INTO test VALUES (?, ?, ?)''',
+                          ((ii, cls.ra[ii], cls.dec[ii]) for ii in range(cls.n_rows)))
+            conn.commit()
+
+        # circles in the middle of the sky, across RA = 0 and around a pole
+        cls.obs_list = [ObservationMetaData(pointingRA=ra, pointingDec=dec, boundType='circle',
+                                            boundLength=radius)
+                        for ra, dec, radius in ((100.0, -20.0, 15.0), (359.0, 5.0, 12.0),
+                                                (40.0, 80.0, 12.0))]
+
+    @classmethod
+    def tearDownClass(cls):
+        sims_clean_up()
+        if os.path.exists(cls.scratch_dir):
+            shutil.rmtree(cls.scratch_dir)
+
+    def assertRowsInBounds(self, db):
+        """
+        Assert that db selects the rows within each of self.obs_list, without
+        evaluating trigonometric functions in the database
+        """
+        ra = np.radians(self.ra)
+        dec = np.radians(self.dec)
+        for obs in self.obs_list:
+            query = db.filter(db._get_column_query(['id']), obs.bounds)
+            for function in ('SIN', 'COS', 'ASIN', 'SQRT', 'POWER', 'PI'):
+                self.assertNotIn('%s(' % function, str(query).upper())
+            ids = next(db.query_columns(['id'], obs_metadata=obs))['id']
+            distance = np.arccos(np.clip(np.sin(dec)*np.sin(obs.bounds.DEC) +
+                                         np.cos(dec)*np.cos(obs.bounds.DEC)*np.cos(ra - obs.bounds.RA),
+                                         -1.0, 1.0))
+            self.assertGreater(len(ids), 10)
+            np.testing.assert_array_equal(np.sort(ids), np.flatnonzero(distance < obs.bounds.radius))
+
+    def test_file_db(self):
+        """
+        Test that fileDBObject adds unit-vector columns, with which it selects
+        the rows inside circular bounds
+        """
+        db = UnitVectorFileDB(self.txt_file_name, runtable='test', unitVectorColNames=('x', 'y', 'z'))
+        self.assertEqual(list(db.columnMap.keys()), ['id', 'ra', 'decl', 'x', 'y', 'z'])
+        self.assertIn('zidx', [index['name'] for index in inspect(db.connection.engine).get_indexes('test')])
+
+        results = next(db.query_columns(['id', 'x', 'y', 'z']))
+        dec = np.radians(self.dec[results['id']])
+        ra = np.radians(self.ra[results['id']])
+        np.testing.assert_array_almost_equal(results['x'], np.cos(dec)*np.cos(ra), decimal=12)
+        np.testing.assert_array_almost_equal(results['y'], np.cos(dec)*np.sin(ra), decimal=12)
+        np.testing.assert_array_almost_equal(results['z'], np.sin(dec), decimal=12)
+
+        self.assertRowsInBounds(db)
+
+    def test_add_unit_vector_columns(self):
+        """
+        Test that addUnitVectorColumns adds unit-vector columns to an existing
+        table, with which CatalogDBObjects select the rows inside
+        circular bounds
+        """
+        db_name = os.path.join(self.scratch_dir, 'unit_vector_add_test.db')
+        shutil.copyfile(self.db_name, db_name)
+        engine, metadata = make_engine('sqlite:///%s' % db_name)
+        n_rows = addUnitVectorColumns(engine, 'test', 'id', 'ra', 'decl',
+                                      unitVectorCols=('ux', 'uy', 'uz'), chunkSize=300)
+        self.assertEqual(n_rows, self.n_rows)
+        self.assertIn('uzidx', [index['name'] for index in inspect(engine).get_indexes('test')])
+        rows = np.array(engine.execute('SELECT ux, uy, uz FROM test ORDER BY id').fetchall())
+        np.testing.assert_array_almost_equal(np.sum(rows**2, axis=1), np.ones(self.n_rows), decimal=12)
+        np.testing.assert_array_almost_equal(rows[:, 2], np.sin(np.radians(self.dec)), decimal=12)
+        engine.dispose()
+
+        class UnitVectorAddedDB(UnitVectorDB):
+            objid = 'unitVectorAddedDB'
+            unitVectorColNames = ('ux', 'uy', 'uz')
+
+        self.assertRowsInBounds(UnitVectorAddedDB(database=db_name))
+
+
+class MemoryTestClass(lsst.utils.tests.MemoryTestCase):
+    pass
+
+
+if __name__ == "__main__":
+    lsst.utils.tests.init()
+    unittest.main()